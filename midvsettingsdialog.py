@@ -683,6 +683,7 @@ class SpatialiteSettings(gui_utils.RowEntryGrid):
         dbpath = self.dbpath
         self.midvsettingsdialogdock.ms.settingsdict['database'] = common_utils.anything_to_string_representation(
             {'spatialite': {'dbpath': dbpath}})
+        db_utils.invalidate_db_properties_cache()
         self.midvsettingsdialogdock.ms.save_settings('database')
         self.midvsettingsdialogdock.load_plot_settings()
         warn_about_old_database()
@@ -721,6 +722,7 @@ class PostgisSettings(gui_utils.RowEntryGrid):
     def set_db(self):
         if self.connection:
             self.midvsettingsdialogdock.ms.settingsdict['database'] = common_utils.anything_to_string_representation({'postgis': {'connection': self.connection}})
+            db_utils.invalidate_db_properties_cache()
             self.midvsettingsdialogdock.ms.save_settings('database')
             self.midvsettingsdialogdock.load_plot_settings()
             warn_about_old_database()
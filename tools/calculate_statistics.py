@@ -21,12 +21,17 @@ from __future__ import absolute_import
 
 import os
 
+import numpy as np
+
 import qgis.PyQt
 from qgis.PyQt.QtCore import QCoreApplication
 
 from midvatten.tools.utils import common_utils, gui_utils, db_utils
 from midvatten.tools.utils.common_utils import returnunicode as ru
 
+# Aggregate functions that get_statistics can calculate without the database.
+BATCH_STATISTICS_FUNCTIONS = ('min', 'max', 'avg', 'count', 'sum')
+
 calculate_statistics_dialog = qgis.PyQt.uic.loadUiType(os.path.join(os.path.dirname(__file__),'..','ui', 'calculate_statistics_ui.ui'))[0]
 
 class CalculateStatisticsGui(qgis.PyQt.QtWidgets.QMainWindow, calculate_statistics_dialog):
@@ -83,52 +88,214 @@ class DbBrowser(gui_utils.DistinctValuesBrowser):
     def get_distinct_values(tablename, columnname):
         return []
 
-def get_statistics(obsids, table, column, sql_function_order=None, median=True, dbconnection=None):
-    if not isinstance(dbconnection, db_utils.DbConnectionManager):
-        dbconnection = db_utils.DbConnectionManager()
+def get_statistics(obsids, table, column, sql_function_order=None, median=True, dbconnection=None, percentiles=None):
+    """
+    Calculates statistics for column in table for each obsid.
+
+    The values for all obsids are fetched using one query and the statistics are calculated in one vectorized pass.
+    If the column contains non-numeric values or sql_function_order contains other functions than
+    BATCH_STATISTICS_FUNCTIONS, the sql functions of the database are used instead.
+
+    :param obsids: An obsid or a list of obsids
+    :param table: The table
+    :param column: The column
+    :param sql_function_order: A list of sql functions, like ['min', 'max', 'avg', 'count']
+    :param median: True to append the median after the sql function results.
+    :param dbconnection: A DbConnectionManager
+    :param percentiles: A list of percentiles (0-100) to append last, like [10, 90].
+    :return: A dict like {obsid: [min, max, avg, count, median, percentile 10, percentile 90]}
+    """
+    dbconnection, dbconnection_created = db_utils.get_dbconnection(dbconnection)
 
     if sql_function_order is None:
         sql_function_order = ['min', 'max', 'avg', 'count']
     if not isinstance(obsids, (list, tuple)):
         obsids = [obsids]
 
-    sql = 'select obsid, %s from %s where obsid in (%s) group by obsid'%(', '.join(['%s(%s)'%(func, column) for func in sql_function_order]), table, ', '.join(["'{}'".format(x) for x in obsids]))
+    res = None
+    if all([func.lower() in BATCH_STATISTICS_FUNCTIONS for func in sql_function_order]):
+        sql = 'select obsid, %s from %s where obsid in (%s)'%(column, table, common_utils.sql_unicode_list(obsids))
+        rows = dbconnection.execute_and_fetchall(sql)
+        res = calculate_batch_statistics(rows, sql_function_order, median=median, percentiles=percentiles)
+
+    if res is None:
+        res = get_statistics_using_sql(obsids, table, column, sql_function_order, median=median,
+                                       percentiles=percentiles, dbconnection=dbconnection)
+
+    if dbconnection_created:
+        dbconnection.closedb()
+    return res
+
+def get_statistics_using_sql(obsids, table, column, sql_function_order, median=True, percentiles=None, dbconnection=None):
+    """
+    Calculates the statistics using one sql query per obsid for the median. Percentiles are not supported and set to None.
+    """
+    sql = 'select obsid, %s from %s where obsid in (%s) group by obsid'%(', '.join(['%s(%s)'%(func, column) for func in sql_function_order]), table, common_utils.sql_unicode_list(obsids))
     _res = db_utils.get_sql_result_as_dict(sql, dbconnection=dbconnection)[1]
     res = dict([(obsid, list(v[0])) for obsid, v in _res.items()])
     if median:
         [v.append(db_utils.calculate_median_value(table, column, obsid, dbconnection)) for obsid, v in res.items()]
+    if percentiles:
+        [v.extend([None] * len(percentiles)) for v in res.values()]
     return res
 
-def get_statistics_for_single_obsid(obsid ='', table='w_levels', data_columns=None):
-    Statistics_list = [0]*4
+def calculate_batch_statistics(rows, sql_function_order, median=True, percentiles=None):
+    """
+    Calculates statistics for each obsid in one vectorized pass.
+
+    NULL values are ignored like the sql aggregate functions do. The median and percentiles use linear interpolation
+    between the closest values.
+
+    >>> calculate_batch_statistics([('1', 1.0), ('1', 5.0), ('1', 3.0), ('2', 4), ('2', 2), ('3', None)], ['min', 'max', 'avg', 'count'], percentiles=[25])
+    {'1': [1.0, 5.0, 3.0, 3, 3.0, 2.0], '2': [2.0, 4.0, 3.0, 2, 3.0, 2.5], '3': [None, None, None, 0, None, None]}
+    >>> calculate_batch_statistics([('1', 'a')], ['min']) is None
+    True
+
+    :param rows: A list of rows like [(obsid, value), ...]
+    :param sql_function_order: A list of functions from BATCH_STATISTICS_FUNCTIONS.
+    :param median: True to append the median after the function results.
+    :param percentiles: A list of percentiles (0-100) to append last.
+    :return: A dict like {obsid: [function results, median, percentiles]} or None if the values are not numeric.
+    """
+    all_obsids = sorted(set([row[0] for row in rows]))
+    rows = [row for row in rows if row[1] is not None]
+    if not all([isinstance(row[1], (int, float)) and not isinstance(row[1], bool) for row in rows]):
+        return None
+    all_ints = all([isinstance(row[1], int) for row in rows])
+
+    obsid_index = dict([(obsid, idx) for idx, obsid in enumerate(all_obsids)])
+    codes = np.array([obsid_index[row[0]] for row in rows], dtype=int)
+    values = np.array([row[1] for row in rows], dtype=float)
+    order = np.lexsort((values, codes))
+    codes = codes[order]
+    values = values[order]
+
+    counts = np.bincount(codes, minlength=len(all_obsids))
+    sums = np.bincount(codes, weights=values, minlength=len(all_obsids))
+    has_values = counts > 0
+    ends = np.cumsum(counts)
+    starts = ends - counts
+
+    def as_list(calculated, as_int=False):
+        """Returns a list with one python value per obsid, None for obsids without values"""
+        if as_int:
+            calculated = np.round(calculated).astype(int)
+        return [calculated[idx].item() if has_values[idx] else None for idx in range(len(all_obsids))]
+
+    def value_at(positions):
+        if not len(values):
+            return np.zeros(len(positions))
+        return values[positions.clip(0, len(values) - 1)]
 
+    def percentile(q):
+        position = starts + (counts - 1).clip(min=0) * (q / 100.0)
+        lower = np.floor(position).astype(int)
+        upper = np.ceil(position).astype(int)
+        lower_values = value_at(lower)
+        return as_list(lower_values + (value_at(upper) - lower_values) * (position - lower))
+
+    columns = []
+    for func in sql_function_order:
+        func = func.lower()
+        if func == 'count':
+            columns.append([int(count) for count in counts])
+        elif func == 'sum':
+            columns.append(as_list(sums, as_int=all_ints))
+        elif func == 'avg':
+            columns.append(as_list(sums / counts.clip(min=1)))
+        elif func == 'min':
+            columns.append(as_list(value_at(starts), as_int=all_ints))
+        elif func == 'max':
+            columns.append(as_list(value_at(ends - 1), as_int=all_ints))
+    if median:
+        columns.append(percentile(50))
+    if percentiles:
+        columns.extend([percentile(q) for q in percentiles])
+
+    return dict([(obsid, [column[idx] for column in columns]) for idx, obsid in enumerate(all_obsids)])
+
+def get_statistics_for_single_obsid(obsid ='', table='w_levels', data_columns=None, dbconnection=None):
+    return get_statistics_for_obsids([obsid], table=table, data_columns=data_columns, dbconnection=dbconnection)[obsid]
+
+def get_statistics_for_obsids(obsids, table='w_levels', data_columns=None, dbconnection=None):
+    """
+    Calculates statistics for many obsids using one query.
+
+    For each obsid, the column in data_columns with the most values is used (the first column wins if equal).
+
+    :param obsids: A list of obsids
+    :param table: The table
+    :param data_columns: A list of candidate columns, default ['meas', 'level_masl']
+    :param dbconnection: A DbConnectionManager
+    :return: A dict like {obsid: (data_column, [min, median, number of values, max])}
+    """
     if data_columns is None:
         data_columns = ['meas', 'level_masl']
+    if not obsids:
+        return {}
+
+    dbconnection, dbconnection_created = db_utils.get_dbconnection(dbconnection)
+
+    sql = 'select obsid, %s from %s where obsid in (%s)'%(', '.join(data_columns), table, common_utils.sql_unicode_list(obsids))
+    rows = dbconnection.execute_and_fetchall(sql)
+
+    columns_stats = []
+    for colnr, column in enumerate(data_columns, 1):
+        column_stats = calculate_batch_statistics([(row[0], row[colnr]) for row in rows], ['min', 'count', 'max'])
+        if column_stats is None:
+            break
+        columns_stats.append(column_stats)
+    else:
+        res = {}
+        for obsid in obsids:
+            Statistics_list = [None, 0, 0, None]
+            data_column = data_columns[0]
+            for column, column_stats in zip(data_columns, columns_stats):
+                _min, _count, _max, _median = column_stats.get(obsid, [None, 0, None, None])
+                if _count > Statistics_list[2] or (column == data_column and _count == Statistics_list[2]):
+                    data_column = column
+                    Statistics_list = [_min, _median if _median else 0, _count, _max]
+            res[obsid] = (data_column, Statistics_list)
+
+        if dbconnection_created:
+            dbconnection.closedb()
+        return res
+
+    # Non-numeric values, let the database calculate the statistics.
+    res = dict([(obsid, get_statistics_for_single_obsid_using_sql(obsid, table, data_columns, dbconnection))
+                for obsid in obsids])
+    if dbconnection_created:
+        dbconnection.closedb()
+    return res
+
+def get_statistics_for_single_obsid_using_sql(obsid, table, data_columns, dbconnection):
+    Statistics_list = [0]*4
+
     data_column = data_columns[0] #default value
 
 
     #number of values, also decide wehter to use meas or level_masl in report
     for column in data_columns:
         sql = r"""select Count(%s) from %s where obsid = '%s'"""%(column, table, obsid)
-        ConnectionOK, number_of_values = db_utils.sql_load_fr_db(sql)
+        ConnectionOK, number_of_values = db_utils.sql_load_fr_db(sql, dbconnection=dbconnection)
         if number_of_values and number_of_values[0][0] > Statistics_list[2]:#this will select meas if meas >= level_masl
             data_column = column
             Statistics_list[2] = number_of_values[0][0]
 
     #min value
     sql = r"""select min(%s) from %s where obsid = '%s'"""%(data_column, table, obsid)
-    ConnectionOK, min_value = db_utils.sql_load_fr_db(sql)
+    ConnectionOK, min_value = db_utils.sql_load_fr_db(sql, dbconnection=dbconnection)
     if min_value:
         Statistics_list[0] = min_value[0][0]
 
     #median value
-    median_value = db_utils.calculate_median_value(table, data_column, obsid)
+    median_value = db_utils.calculate_median_value(table, data_column, obsid, dbconnection=dbconnection)
     if median_value:
         Statistics_list[1] = median_value
 
     #max value
     sql = r"""select max(%s) from %s where obsid = '%s'"""%(data_column, table, obsid)
-    ConnectionOK, max_value = db_utils.sql_load_fr_db(sql)
+    ConnectionOK, max_value = db_utils.sql_load_fr_db(sql, dbconnection=dbconnection)
     if max_value:
         Statistics_list[3] = max_value[0][0]
 
@@ -169,6 +169,7 @@ class NewDb(object):
 
         dbconnection.commit()
         dbconnection.vacuum()
+        db_utils.invalidate_schema_cache(dbconnection)
         dbconnection.commit_and_closedb()
 
         #create SpatiaLite Connection in QGIS QSettings
@@ -305,6 +306,7 @@ class NewDb(object):
                                       w_levels_timezone=w_levels_timezone)
 
         dbconnection.vacuum()
+        db_utils.invalidate_schema_cache(dbconnection)
 
         dbconnection.commit_and_closedb()
 
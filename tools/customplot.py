@@ -35,16 +35,11 @@ import matplotlib.pyplot as plt
 import numpy as np
 import qgis.PyQt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+import matplotlib.dates as mdates
 from matplotlib.dates import datestr2num
 from qgis.PyQt import QtGui, QtCore, uic, QtWidgets  # , QtSql
 from qgis.PyQt.QtCore import QCoreApplication
 
-try:#assume matplotlib >=1.5.1
-    from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-    from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
-except:
-    from matplotlib.backends.backend_qt5agg import NavigationToolbar2QTAgg as NavigationToolbar
-    from matplotlib.backends.backend_qt5agg import NavigationToolbar2QTAgg
 import datetime
 import matplotlib.ticker as tick
 
@@ -52,9 +47,10 @@ from qgis.PyQt.QtWidgets import QApplication
 
 from midvatten.tools.utils import common_utils, midvatten_utils, db_utils
 from midvatten.tools.utils.common_utils import returnunicode as ru, LEGEND_NCOL_KEY, \
-    MessagebarAndLog
+    MessagebarAndLog, decimate_min_max
 from midvatten.definitions import midvatten_defs as defs
 from midvatten.tools.utils.gui_utils import set_groupbox_children_visibility
+from midvatten.tools.utils.matplotlib_replacements import NavigationToolbarWithSignal
 
 try:
     import pandas as pd
@@ -203,7 +199,8 @@ class CustomPlot(QtWidgets.QMainWindow, customplot_ui_class):
         self.axes = self.custplotfigure.add_subplot(111)
         self.canvas = FigureCanvas(self.custplotfigure)
 
-        self.mpltoolbar = NavigationToolbar(self.canvas, self.widgetPlot)
+        self.mpltoolbar = NavigationToolbarWithSignal(self.canvas, self.widgetPlot)
+        self.level_of_detail = common_utils.LevelOfDetail(self.axes, self.mpltoolbar)
         common_utils.PickAnnotator(self.custplotfigure, canvas=self.canvas)
         self.layoutplot.addWidget(self.canvas)
         self.layoutplot.addWidget(self.mpltoolbar)
@@ -322,16 +319,19 @@ class CustomPlot(QtWidgets.QMainWindow, customplot_ui_class):
 
             remove_mean = checkBox_remove_mean.isChecked()
 
-            _sql = r"""SELECT %s, %s FROM %s """% (str(xcol_ComboBox.currentText()), str(ycol_ComboBox.currentText()), str(table_ComboBox.currentText()))
-            _sql += r"""WHERE %s """ % db_utils.test_not_null_and_not_empty_string(str(table_ComboBox.currentText()), str(xcol_ComboBox.currentText()), dbconnection)
-            _sql += r"""AND %s """ % db_utils.test_not_null_and_not_empty_string(str(table_ComboBox.currentText()), str(ycol_ComboBox.currentText()), dbconnection)
+            table = str(table_ComboBox.currentText())
+            xcol = str(xcol_ComboBox.currentText())
+            ycol = str(ycol_ComboBox.currentText())
+            used_filters = [(_filter, [str(item.text()) for item in filterlist])
+                            for _filter, filterlist in [(filter1, filter1list), (filter2, filter2list)]
+                            if _filter.strip() and filterlist]
+            series = self.get_series_data(dbconnection, table, xcol, ycol, used_filters)
 
             while i < len(self.p):
                 #Both filters empty
                 if (not filter1.strip() or not filter1list) and (not filter2.strip() or not filter2list):
-                    sql = _sql + r""" ORDER BY %s"""%str(xcol_ComboBox.currentText())
-                    recs = dbconnection.execute_and_fetchall(sql)
-                    label = str(ycol_ComboBox.currentText())+""", """+str(table_ComboBox.currentText())
+                    recs = series.get((), [])
+                    label = ycol+""", """+table
                     if not recs:
                         i += 1
                         continue
@@ -342,8 +342,7 @@ class CustomPlot(QtWidgets.QMainWindow, customplot_ui_class):
                 elif all((filter1.strip(), filter1list, filter2.strip(), filter2list)):
                     for item1 in filter1list:
                         for item2 in filter2list:
-                            sql = _sql + r""" AND %s = '%s' AND %s = '%s' ORDER BY %s"""%(filter1, str(item1.text()), filter2, str(item2.text()), str(xcol_ComboBox.currentText()))
-                            recs = dbconnection.execute_and_fetchall(sql)
+                            recs = series.get((str(item1.text()), str(item2.text())), [])
                             label = str(item1.text()) + """, """ + str(item2.text())
                             if not recs:
                                 common_utils.MessagebarAndLog.info(log_msg=ru(
@@ -360,8 +359,7 @@ class CustomPlot(QtWidgets.QMainWindow, customplot_ui_class):
                             continue
                         else:
                             for item in filterlist:
-                                sql = _sql + r""" AND %s = '%s' ORDER BY %s"""%(filter, str(item.text()), str(xcol_ComboBox.currentText()))
-                                recs = dbconnection.execute_and_fetchall(sql)
+                                recs = series.get((str(item.text()),), [])
                                 label = str(item.text())
                                 if not recs:
                                     common_utils.MessagebarAndLog.warning(log_msg=ru(
@@ -373,6 +371,40 @@ class CustomPlot(QtWidgets.QMainWindow, customplot_ui_class):
                                 i += 1
         return nop, i
 
+    def get_series_data(self, dbconnection, table, xcol, ycol, used_filters):
+        """
+        Reads all series for the selected filter values using one query.
+
+        :param used_filters: A list like [(filtercolumn, [selected value, ...]), ...]
+        :return: A dict like {(filtervalue, ...): [(x, y), ...]}, with the selected values of each used filter as key.
+        """
+        filtercols = [_filter for _filter, values in used_filters]
+        sql = r"""SELECT %s FROM %s """ % (', '.join(filtercols + [xcol, ycol]), table)
+        sql += r"""WHERE %s """ % db_utils.test_not_null_and_not_empty_string(table, xcol, dbconnection)
+        sql += r"""AND %s """ % db_utils.test_not_null_and_not_empty_string(table, ycol, dbconnection)
+        for _filter, values in used_filters:
+            sql += r"""AND %s IN (%s) """ % (_filter, common_utils.sql_unicode_list(values))
+        sql += r"""ORDER BY %s""" % ', '.join(filtercols + [xcol])
+        rows = dbconnection.execute_and_fetchall(sql)
+        if not rows:
+            return {}
+
+        # The rows are ordered by the filter columns, so each series is a continuous block of rows.
+        columns = list(zip(*rows))
+        nr_of_filters = len(filtercols)
+        changed = np.zeros(len(rows) - 1, dtype=bool)
+        for colnr in range(nr_of_filters):
+            column = np.array(columns[colnr], dtype=object)
+            changed |= column[1:] != column[:-1]
+        starts = np.concatenate(([0], np.flatnonzero(changed) + 1, [len(rows)]))
+
+        xy = list(zip(columns[nr_of_filters], columns[nr_of_filters + 1]))
+        series = {}
+        for start, end in zip(starts[:-1], starts[1:]):
+            key = tuple([str(columns[colnr][start]) for colnr in range(nr_of_filters)])
+            series.setdefault(key, []).extend(xy[start:end])
+        return series
+
     def createsingleplotobject(self,recs,i,My_format,plottype='line', factor=1.0,
                                offset=0.0, remove_mean=False, pandas_calc=None,
                                only_get_data=False):
@@ -381,8 +413,7 @@ class CustomPlot(QtWidgets.QMainWindow, customplot_ui_class):
             table = np.array(recs, dtype=My_format)  #NDARRAY
             table2=table.view(np.recarray)   # RECARRAY transform the 2 cols into callable objects
             FlagTimeXY = 'time'
-            myTimestring = list(table2.date_time)
-            numtime=datestr2num(myTimestring)  #conv list of strings to numpy.ndarray of floats
+            numtime = datestrings_to_num(table2.date_time)  #conv strings to numpy.ndarray of floats
         except Exception as e:
             common_utils.MessagebarAndLog.warning(log_msg=ru(QCoreApplication.translate('plotsqlitewindow', 'Plotting date_time failed, msg: %s')) % str(e))
             common_utils.MessagebarAndLog.info(log_msg=ru(QCoreApplication.translate('plotsqlitewindow', "Customplot, transforming to recarray with date_time as x-axis failed, msg: %s")) % ru(str(e)))
@@ -470,26 +501,36 @@ class CustomPlot(QtWidgets.QMainWindow, customplot_ui_class):
         if only_get_data:
             self.data.append((table2, self.plabels[i]))
             return
+
+        values = table2.values
+        # Lines without markers look the same with only the min and max value for each pixel column.
+        use_level_of_detail = plottype in ("line", "step-pre", "step-post")
+        if use_level_of_detail:
+            full_numtime, full_values = numtime, values
+            numtime, values = decimate_min_max(numtime, values, max(int(self.axes.bbox.width), 100))
         if plottype == "step-pre":
-            self.p[i], = plotfunc(numtime, table2.values, '', picker=2, drawstyle='steps-pre', marker='None', label=self.plabels[i], **next(self.line_cycler))# 'steps-pre' best for precipitation and flowmeters, optional types are 'steps', 'steps-mid', 'steps-post'
+            self.p[i], = plotfunc(numtime, values, '', picker=2, drawstyle='steps-pre', marker='None', label=self.plabels[i], **next(self.line_cycler))# 'steps-pre' best for precipitation and flowmeters, optional types are 'steps', 'steps-mid', 'steps-post'
         elif plottype == "step-post":
-            self.p[i], = plotfunc(numtime, table2.values, '', picker=2, drawstyle='steps-post', marker='None', label=self.plabels[i], **next(self.line_cycler))
+            self.p[i], = plotfunc(numtime, values, '', picker=2, drawstyle='steps-post', marker='None', label=self.plabels[i], **next(self.line_cycler))
         elif plottype == "line and cross":
-            self.p[i], = plotfunc(numtime, table2.values, '', picker=2, marker='x', label=self.plabels[i], markeredgewidth=markeredgewidth, **next(self.line_cycler))
+            self.p[i], = plotfunc(numtime, values, '', picker=2, marker='x', label=self.plabels[i], markeredgewidth=markeredgewidth, **next(self.line_cycler))
         elif plottype == "marker":
-            self.p[i], = plotfunc(numtime, table2.values, '', picker=2, linestyle='None', label=self.plabels[i], markeredgewidth=markeredgewidth, **next(self.marker_cycler))
+            self.p[i], = plotfunc(numtime, values, '', picker=2, linestyle='None', label=self.plabels[i], markeredgewidth=markeredgewidth, **next(self.marker_cycler))
         elif plottype == "line":
-            self.p[i], = plotfunc(numtime, table2.values, '', picker=2, marker='None', label=self.plabels[i], **next(self.line_cycler))
+            self.p[i], = plotfunc(numtime, values, '', picker=2, marker='None', label=self.plabels[i], **next(self.line_cycler))
         elif plottype == "frequency" and FlagTimeXY == "time":
             try:
-                self.p[i], = plotfunc(numtime, table2.values, '', picker=2, marker='None', label='frequency '+str(self.plabels[i]), **next(self.line_cycler))
+                self.p[i], = plotfunc(numtime, values, '', picker=2, marker='None', label='frequency '+str(self.plabels[i]), **next(self.line_cycler))
                 self.plabels[i]='frequency '+str(self.plabels[i])
             except:
                 self.p[i], = plotfunc(np.array([]),np.array([]), '', picker=2, marker='None', label='frequency '+str(self.plabels[i]), **next(self.line_cycler))
                 self.plabels[i]='frequency '+str(self.plabels[i])
         else:
             # line and marker
-            self.p[i], = plotfunc(numtime, table2.values, '', picker=2, label=self.plabels[i], markeredgewidth=markeredgewidth, **next(self.line_and_marker_cycler))
+            self.p[i], = plotfunc(numtime, values, '', picker=2, label=self.plabels[i], markeredgewidth=markeredgewidth, **next(self.line_and_marker_cycler))
+
+        if use_level_of_detail:
+            self.level_of_detail.add_line(self.p[i], full_numtime, full_values)
 
 
     def LastSelections(self):#set same selections as last plot
@@ -775,6 +816,7 @@ class CustomPlot(QtWidgets.QMainWindow, customplot_ui_class):
             self.axes.legend_ = None
 
         self.update_plot_size()
+        self.level_of_detail.update(draw=False)
 
         self.canvas.draw()
 
@@ -1006,6 +1048,24 @@ class PandasCalculations(object):
         return df
 
 
+def datestrings_to_num(datestrings):
+    """
+    Converts date strings to matplotlib date numbers.
+
+    ISO formatted dates are parsed at once by numpy, other formats are parsed one by one using datestr2num.
+
+    >>> datestrings_to_num(['2026-01-01 12:00', '2026-01-02']).tolist() == datestr2num(['2026-01-01 12:00', '2026-01-02']).tolist()
+    True
+    """
+    datestrings = np.asarray(datestrings)
+    if all(isinstance(datestring, str) for datestring in datestrings):
+        try:
+            return mdates.date2num(datestrings.astype(str).astype('datetime64[us]'))
+        except ValueError:
+            pass
+    return datestr2num(list(datestrings))
+
+
 def horizontal_line():
     line = qgis.PyQt.QtWidgets.QFrame()
     line.setGeometry(qgis.PyQt.QtCore.QRect(320, 150, 118, 3))
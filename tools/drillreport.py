@@ -28,7 +28,7 @@ from qgis.PyQt.QtCore import QCoreApplication
 from qgis.PyQt.QtCore import QUrl, QDir
 from qgis.PyQt.QtGui import QDesktopServices
 
-from midvatten.tools.calculate_statistics import get_statistics_for_single_obsid
+from midvatten.tools.calculate_statistics import get_statistics_for_obsids
 from midvatten.tools.utils import common_utils, midvatten_utils, db_utils
 from midvatten.tools.utils.common_utils import returnunicode as ru
 
@@ -56,16 +56,20 @@ class Drillreport(object):        # general observation point info for the selec
             merged_question = True
 
         obsids = sorted(set(obsids))
+
+        # All data for all obsids are loaded at once and the report is then written obsid by obsid.
+        prefetched = self.prefetch_data(obsids)
+
         if merged_question:
             f, rpt = self.open_file(', '.join(obsids), reportpath)
             for obsid in obsids:
-                self.write_obsid(obsid, rpt, imgpath, logopath, f)
+                self.write_obsid(obsid, rpt, imgpath, logopath, f, prefetched)
             self.close_file(f, reportpath)
         else:
             #opened = False
             for obsid in obsids:
                 f, rpt = self.open_file(obsid, reportpath)
-                self.write_obsid(obsid, rpt, imgpath, logopath, f)
+                self.write_obsid(obsid, rpt, imgpath, logopath, f, prefetched)
                 url_status = self.close_file(f, reportpath)
                 #This must be used if many obsids are allowed to used this method.
                 #if not opened:
@@ -91,10 +95,41 @@ class Drillreport(object):        # general observation point info for the selec
         url_status = QDesktopServices.openUrl(QUrl.fromLocalFile(reportpath))
         return url_status
 
-    def write_obsid(self, obsid, rpt, imgpath, logopath, f):
+    def prefetch_data(self, obsids, dbconnection=None):
+        """ Loads the report data for all obsids using one query per table
+
+        :return: A dict with the locale, the crs and crs name of obs_points and dicts like {obsid: data} for
+                 obs_points, stratigraphy and water level statistics.
+        """
+        dbconnection, dbconnection_created = db_utils.get_dbconnection(dbconnection)
+        obsids_sql = common_utils.sql_unicode_list(obsids)
+
+        prefetched = {}
+        prefetched['locale'] = midvatten_utils.getcurrentlocale(dbconnection=dbconnection)[0]
+        prefetched['obs_points_ok'], prefetched['obs_points'] = db_utils.get_sql_result_as_dict(
+            r"""SELECT obsid, * FROM obs_points WHERE obsid IN (%s)""" % obsids_sql, dbconnection=dbconnection)
+        prefetched['stratigraphy'] = db_utils.get_sql_result_as_dict(
+            r"""SELECT obsid, * FROM stratigraphy WHERE obsid IN (%s) ORDER BY obsid, stratid""" % obsids_sql,
+            dbconnection=dbconnection)[1]
+        if prefetched['obs_points_ok']:
+            srid = db_utils.sql_load_fr_db(r"""SELECT srid FROM geometry_columns where f_table_name = 'obs_points'""",
+                                           dbconnection=dbconnection)[1][0][0]
+            prefetched['crs'] = ru(srid)
+            prefetched['crsname'] = ru(db_utils.get_srid_name(srid, dbconnection=dbconnection))
+        prefetched['statistics'] = get_statistics_for_obsids(obsids, dbconnection=dbconnection)
+
+        if dbconnection_created:
+            dbconnection.closedb()
+        return prefetched
+
+    def write_obsid(self, obsid, rpt, imgpath, logopath, f, prefetched=None):
+        if prefetched is None:
+            prefetched = self.prefetch_data([obsid])
+        sv_locale = prefetched['locale'] == 'sv_SE'
+
         rpt += r"""<html><TABLE WIDTH=100% BORDER=0 CELLPADDING=1 CELLSPACING=1><TR VALIGN=TOP><TD WIDTH=15%><h3 style="font-family:'arial';font-size:18pt; font-weight:600">"""
         rpt += obsid
-        if  midvatten_utils.getcurrentlocale()[0] == 'sv_SE':
+        if sv_locale:
             rpt += ''.join([r'''</h3><img src="''', os.path.join(imgpath, 'for_general_report_sv.png'), r'''" /><br><img src=''', r"""'"""])
             #rpt += r"""</h3><img src="for_general_report_sv.png" /><br><img src='"""
         else:
@@ -102,7 +137,7 @@ class Drillreport(object):        # general observation point info for the selec
             #rpt += r"""</h3><img src="for_general_report.png" /><br><img src='"""
         rpt += logopath
         rpt +="""' /></TD><TD WIDTH=85%><TABLE WIDTH=100% BORDER=1 CELLPADDING=4 CELLSPACING=3><TR VALIGN=TOP><TD WIDTH=50%><P><U><B>"""
-        if  midvatten_utils.getcurrentlocale()[0] == 'sv_SE':
+        if sv_locale:
             rpt += 'Allmän information'
         else:
             rpt += ru(QCoreApplication.translate('Drillreport', 'General information'))
@@ -110,21 +145,20 @@ class Drillreport(object):        # general observation point info for the selec
         f.write(rpt)
 
         # GENERAL DATA UPPER LEFT QUADRANT
-        ConnectionOK, GeneralData = self.GetData(obsid, 'obs_points', 'n')#MacOSX fix1
+        ConnectionOK = prefetched['obs_points_ok']
+        GeneralData = prefetched['obs_points'].get(obsid, [])
         #utils.pop_up_info(str(ConnectionOK))#debug
         if ConnectionOK==True:
-            result2 = db_utils.sql_load_fr_db(r"""SELECT srid FROM geometry_columns where f_table_name = 'obs_points'""")[1][0][0]
-            CRS = ru(result2) #1st we need crs
-            result3 = db_utils.get_srid_name(result2)
-            CRSname = ru(result3) # and crs name
-            if  midvatten_utils.getcurrentlocale()[0] == 'sv_SE':
+            CRS = prefetched['crs'] #1st we need crs
+            CRSname = prefetched['crsname'] # and crs name
+            if sv_locale:
                 reportdata_1 = self.rpt_upper_left_sv(GeneralData, CRS, CRSname)
             else:
                 reportdata_1 = self.rpt_upper_left(GeneralData, CRS, CRSname)
             f.write(reportdata_1)
 
             rpt = r"""</TABLE></TD><TD WIDTH=50%><P><U><B>"""
-            if  midvatten_utils.getcurrentlocale()[0] == 'sv_SE':
+            if sv_locale:
                 rpt += 'Lagerföljd'
             else:
                 rpt += ru(QCoreApplication.translate('Drillreport', 'Stratigraphy'))
@@ -132,15 +166,15 @@ class Drillreport(object):        # general observation point info for the selec
             f.write(rpt)
 
             # STRATIGRAPHY DATA UPPER RIGHT QUADRANT
-            StratData = self.GetData(obsid, 'stratigraphy', 'n')[1] #MacOSX fix1
-            if  midvatten_utils.getcurrentlocale()[0] == 'sv_SE':
+            StratData = prefetched['stratigraphy'].get(obsid, [])
+            if sv_locale:
                 reportdata_2 = self.rpt_upper_right_sv(StratData)
             else:
                 reportdata_2 = self.rpt_upper_right(StratData)
             f.write(reportdata_2)
 
             rpt = r"""</TABLE></TD></TR><TR VALIGN=TOP><TD WIDTH=50%><P><U><B>"""
-            if  midvatten_utils.getcurrentlocale()[0] == 'sv_SE':
+            if sv_locale:
                 rpt += 'Kommentarer'
             else:
                 rpt += ru(QCoreApplication.translate('Drillreport', 'Comments'))
@@ -152,7 +186,7 @@ class Drillreport(object):        # general observation point info for the selec
             f.write(reportdata_3)
 
             rpt = r"""</TD><TD WIDTH=50%><P><U><B>"""
-            if  midvatten_utils.getcurrentlocale()[0] == 'sv_SE':
+            if sv_locale:
                 rpt += 'Vattennivåer'
             else:
                 rpt += ru(QCoreApplication.translate('Drillreport', 'Water levels'))
@@ -160,8 +194,8 @@ class Drillreport(object):        # general observation point info for the selec
             f.write(rpt)
 
             # WATER LEVEL STATISTICS LOWER RIGHT QUADRANT
-            meas_or_level_masl, statistics = get_statistics_for_single_obsid(obsid)#MacOSX fix1
-            if  midvatten_utils.getcurrentlocale()[0] == 'sv_SE':
+            meas_or_level_masl, statistics = prefetched['statistics'][obsid]
+            if sv_locale:
                 reportdata_4 = self.rpt_lower_right_sv(statistics,meas_or_level_masl)
             else:
                 reportdata_4 = self.rpt_lower_right(statistics,meas_or_level_masl)
@@ -372,17 +406,3 @@ class Drillreport(object):        # general observation point info for the selec
         rpt += r"""</p>"""
         return rpt
 
-    def GetData(self, obsid = '', tablename='', debug = 'n'):            # GetData method that returns a table with water quality data
-        # Load all data in obs_points table
-        sql = r"""select * from """
-        sql += tablename
-        sql += r""" where obsid = '"""
-        sql += obsid   
-        sql += r"""'"""
-        if tablename == 'stratigraphy':
-            sql += r""" order by stratid"""
-        if debug == 'y':
-            common_utils.pop_up_info(sql)
-        ConnectionOK, data = db_utils.sql_load_fr_db(sql)
-        return ConnectionOK, data
-
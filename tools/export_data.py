@@ -19,6 +19,7 @@
 """
 from __future__ import absolute_import
 
+import itertools
 import traceback
 
 import os, os.path
@@ -139,11 +140,9 @@ class ExportData(object):
         sql = """SELECT * FROM "%s" """%tname
         if obsids:
             sql += " WHERE obsid IN ({})".format(common_utils.sql_unicode_list(obsids))
-        data = self.source_dbconnection.execute_and_fetchall(sql)
-        printlist = [[col[0] for col in self.source_dbconnection.cursor.description]]
-        printlist.extend(data)
+        columns, rows = self.source_dbconnection.execute_and_fetchmany(sql)
         filename = os.path.join(self.exportfolder, tname + ".csv")
-        common_utils.write_printlist_to_file(filename, printlist)
+        common_utils.write_printlist_to_file(filename, itertools.chain([columns], rows))
 
     def to_sql(self, tname, obsids=None, replace=False):
         """
@@ -165,7 +164,7 @@ class ExportData(object):
             file_data_srid = 4326
 
         try:
-            source_data = self.get_table_data(tname, obsids, self.source_dbconnection, file_data_srid)
+            source_data = self.get_table_data(tname, obsids, self.source_dbconnection, file_data_srid, stream=True)
         except:
             common_utils.MessagebarAndLog.info(bar_msg=ru(
                 QCoreApplication.translate('ExportData', "Error! Export of table %s failed, see log message panel"))%tname,
@@ -178,11 +177,11 @@ class ExportData(object):
             if dest_data:
                 self.dest_dbconnection.execute('''DELETE FROM {}'''.format(tname))
 
-        if tname == 'obs_points':
+        if tname == 'obs_points' and source_data is not None:
             geom_column = list(db_utils.get_geometry_types(self.source_dbconnection, tname).keys())[0]
-            source_data = [set_east_north_to_null(row, source_data[0], geom_column) if rownr > 0
-                           else row
-                           for rownr, row in enumerate(source_data)]
+            header = next(source_data)
+            source_data = itertools.chain([header], (set_east_north_to_null(row, header, geom_column)
+                                                     for row in source_data))
 
         self.midv_data_importer.general_import(tname, source_data,
                                                _dbconnection=self.dest_dbconnection,
@@ -197,7 +196,14 @@ class ExportData(object):
                                                    skip_confirmation=True)
             self.dest_dbconnection.execute('''PRAGMA foreign_keys = ON;''')
 
-    def get_table_data(self, tname, obsids, dbconnection, file_data_srid):
+    def get_table_data(self, tname, obsids, dbconnection, file_data_srid, stream=False):
+        """
+        Reads the table data with the header (lowercase column names) as the first row.
+
+        :param stream: False to return a list of lists. True to return an iterator that fetches the rows from the
+                       database in batches while it's consumed, so the table never has to be kept in memory as a whole.
+        :return: The table data, or None if the table had no rows.
+        """
         dbconnection.execute("""SELECT * FROM "%s" LIMIT 1"""%tname)
         columns = [x[0] for x in dbconnection.cursor.description]
 
@@ -216,15 +222,20 @@ class ExportData(object):
         sql = '''SELECT {} FROM "{}"'''.format(u', '.join(select_columns), tname)
         if obsids:
             sql += " WHERE obsid IN ({})".format(common_utils.sql_unicode_list(obsids))
-        dbconnection.execute(sql)
 
-        table_data = [[x.lower() for x in columns]]
-        table_data.extend([row for row in dbconnection.execute_and_fetchall(sql)])
+        header = [x.lower() for x in columns]
+        if not stream:
+            table_data = [header]
+            table_data.extend(dbconnection.execute_and_fetchall(sql))
+            if len(table_data) < 2:
+                return None
+            return table_data
 
-        if len(table_data) < 2:
+        rows = dbconnection.execute_and_fetchmany(sql)[1]
+        first_row = next(rows, None)
+        if first_row is None:
             return None
-        else:
-            return table_data
+        return itertools.chain([header, first_row], rows)
 
     def get_table_rows_with_differences(self):
         """
@@ -29,6 +29,10 @@ from operator import itemgetter
 import traceback
 
 import io
+import itertools
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
 import psycopg2
 import psycopg2.extras
@@ -48,6 +52,9 @@ from qgis.PyQt.QtCore import QCoreApplication
 from midvatten.tools.utils import common_utils, db_utils
 from midvatten.tools.utils.common_utils import returnunicode as ru, UserInterruptError
 
+# The default number of rows staged at a time when file_data is an iterator.
+DEFAULT_CHUNKSIZE = 100000
+
 
 class midv_data_importer(object):  # this class is intended to be a multipurpose import class  BUT loggerdata probably needs specific importer or its own subfunction
 
@@ -60,16 +67,19 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
         self.temptable_name = None
         self.csvlayer = None
         self.foreign_keys_import_question = None
+        self.staging_times = OrderedDict()
 
     def general_import(self, dest_table, file_data, allow_obs_fk_import=False,
                        _dbconnection=None, dump_temptable=False, source_srid=None,
-                       skip_confirmation=False, binary_geometry=False):
+                       skip_confirmation=False, binary_geometry=False, chunksize=None):
         """General method for importing a list of list to a table
 
             self.temptableName must be the name of the table containing the new data to import.
 
         :param dest_table: The destination table
-        :param file_data: a list of list with a header list as first row
+        :param file_data: a list of list with a header list as first row, or an iterable (like a generator) yielding
+                          the header list first and then the rows. Iterables are staged into the temporary table
+                          in chunks, so the whole file never has to be kept in memory.
         :param allow_obs_fk_import: True to allow creation of obsids in obs_points and obs_lines.
         :param _dbconnection: A db_utils.DbConnectionManager-instance if other than the currently selected in the midvatten
                               settings dialog.
@@ -77,6 +87,8 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
         :param source_srid: The srid of the source geometry column if the geometry is a WKT or WKB
         :param skip_confirmation: True to not ask the user to import foreign keys.
         :param binary_geometry: True if the source geometry column should be parsed as a WKB, else it's parsed as WKT.
+        :param chunksize: The maximum number of rows staged at a time. None stages a list in one go and
+                          other iterables in chunks of DEFAULT_CHUNKSIZE rows.
         :return:
         """
 
@@ -86,7 +98,8 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
             self.foreign_keys_import_question = 1
 
         try:
-            if file_data is None or not file_data:
+            header, chunks = file_data_chunks(file_data, chunksize)
+            if header is None:
                 return
             common_utils.MessagebarAndLog.info(log_msg=ru(QCoreApplication.translate('midv_data_importer', '\nImport to %s starting\n--------------------')) % dest_table)
 
@@ -99,7 +112,6 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
 
             db_utils.activate_foreign_keys(activated=True, dbconnection=dbconnection)
 
-            recsinfile = len(file_data[1:])
             table_info = db_utils.db_tables_columns_info(table=dest_table, dbconnection=dbconnection)
             if not table_info:
                 raise MidvDataImporterError(ru(QCoreApplication.translate('midv_data_importer', 'The table %s did not exist. Update the database to latest version.')) % dest_table)
@@ -110,8 +122,8 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
             primary_keys = [row[1] for row in table_info if int(row[5])]        #Not null columns are allowed if they have a default value.
             not_null_columns = [row[1] for row in table_info if int(row[3]) and row[4] is None]
             #Only use the columns that exists in the goal table.
-            existing_columns_in_dest_table = [col for col in file_data[0] if col in column_headers_types]
-            existing_columns_in_temptable = file_data[0]
+            existing_columns_in_dest_table = [col for col in header if col in column_headers_types]
+            existing_columns_in_temptable = header
             missing_columns = [column for column in not_null_columns if column not in existing_columns_in_dest_table]
 
             if missing_columns:
@@ -119,7 +131,7 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
 
             primary_keys_for_concat = [pk for pk in primary_keys if pk in existing_columns_in_temptable]
 
-            self.list_to_table(dbconnection, dest_table, file_data, primary_keys_for_concat)
+            recsinfile = self.list_to_table(dbconnection, dest_table, header, chunks, primary_keys_for_concat)
 
             #Delete records from self.temptable where yyyy-mm-dd hh:mm or yyyy-mm-dd hh:mm:ss already exist for the same date.
             nr_before = dbconnection.execute_and_fetchall('''select count(*) from %s''' % (self.temptable_name))[0][0]
@@ -272,34 +284,73 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
                     #    pass
             common_utils.stop_waiting_cursor()
 
-    def list_to_table(self, dbconnection, destination_table, file_data, primary_keys_for_concat):
+    def list_to_table(self, dbconnection, destination_table, header, chunks, primary_keys_for_concat):
         """
+        Stages the rows into a new temporary table, one chunk at a time.
+
         TODO: This method can be extremely slow sometimes.
         @param dbconnection:
         @param destination_table:
-        @param file_data:
+        @param header: A list of column names.
+        @param chunks: An iterable of lists of rows.
         @param primary_keys_for_concat:
-        @return:
+        @return: The number of rows read, including skipped duplicates.
+
+        Empty strings are staged as NULL by the writers, so no normalization pass over the temporary table is needed.
+        The time spent in each phase is stored in self.staging_times and written to the log.
         """
-        fieldnames_types = ['{} TEXT'.format(field_name) for field_name in file_data[0]]
-        self.temptable_name = dbconnection.create_temporary_table_for_import(destination_table + '_temp', fieldnames_types)
+        self.staging_times = OrderedDict()
 
-        if pandas_on:
-            numskipped = self.list_to_table_using_pandas(dbconnection, self.temptable_name, file_data, primary_keys_for_concat)
-        else:
-            numskipped = self.list_to_table_using_loop(dbconnection, self.temptable_name, file_data, primary_keys_for_concat)
+        with self.staging_phase('create temporary table'):
+            fieldnames_types = ['{} TEXT'.format(field_name) for field_name in header]
+            self.temptable_name = dbconnection.create_temporary_table_for_import(destination_table + '_temp', fieldnames_types)
+
+        nr_of_rows = 0
+        nr_of_chunks = 0
+        numskipped = 0
+        chunks = iter(chunks)
+        while True:
+            with self.staging_phase('read rows'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            if not chunk:
+                continue
+            nr_of_rows += len(chunk)
+            nr_of_chunks += 1
+            with self.staging_phase('write rows'):
+                if pandas_on:
+                    numskipped += self.list_to_table_using_pandas(dbconnection, self.temptable_name, header, chunk, primary_keys_for_concat)
+                else:
+                    numskipped += self.list_to_table_using_loop(dbconnection, self.temptable_name, header, chunk, primary_keys_for_concat)
+
+        if nr_of_chunks > 1 and primary_keys_for_concat:
+            # Duplicates are skipped within each chunk. Duplicates between chunks are removed here, keeping the first.
+            with self.staging_phase('remove duplicates between chunks'):
+                nr_before = dbconnection.execute_and_fetchall('''select count(*) from %s''' % (self.temptable_name))[0][0]
+                db_utils.delete_duplicate_values(dbconnection, self.temptable_name, primary_keys_for_concat)
+                nr_after = dbconnection.execute_and_fetchall('''select count(*) from %s''' % (self.temptable_name))[0][0]
+                numskipped += nr_before - nr_after
 
         if numskipped:
             common_utils.MessagebarAndLog.warning(bar_msg=ru(QCoreApplication.translate('midv_data_importer', 'Import warning, duplicates skipped')), log_msg=ru(QCoreApplication.translate('midv_data_importer', "%s nr of duplicate rows in file was skipped while importing.")) % str(numskipped))
 
-        for colname in file_data[0]:
-            dbconnection.execute(f"""UPDATE {self.temptable_name} SET {colname} = NULL WHERE {colname} = '' """)
+        common_utils.MessagebarAndLog.info(log_msg=ru(QCoreApplication.translate('midv_data_importer', 'Staged %s rows in %s chunks. Time per phase: %s')) % (
+            str(nr_of_rows), str(nr_of_chunks), ', '.join(['%s: %.3f s' % (phase, seconds) for phase, seconds in self.staging_times.items()])))
+        return nr_of_rows
 
-        dbconnection.cursor.execute(f"""select * from {self.temptable_name}""")
+    @contextmanager
+    def staging_phase(self, name):
+        """Adds the time spent inside the with-block to self.staging_times[name]"""
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.staging_times[name] = self.staging_times.get(name, 0.0) + time.time() - t0
 
-    def list_to_table_using_pandas(self, dbconnection, temptable_name, file_data, primary_keys_for_concat):
+    def list_to_table_using_pandas(self, dbconnection, temptable_name, header, rows, primary_keys_for_concat):
         numskipped = 0
-        df = pd.DataFrame.from_records(file_data[1:], columns=file_data[0])
+        df = pd.DataFrame.from_records(rows, columns=header)
 
         if primary_keys_for_concat:
             len_before = len(df)
@@ -315,20 +366,22 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
                 pass
             pass
 
-        # Replaces NaN with None
-        df = df.astype(object).where(pd.notnull(df), None)
+        # Replaces NaN and empty strings with None
+        df = df.astype(object)
+        df = df.where(pd.notnull(df) & (df != ''), None)
 
         if dbconnection.dbtype == 'spatialite':
             placeholder_sign = db_utils.placeholder_sign(dbconnection)
             sql = """INSERT INTO %s VALUES (%s)""" % (
-                temptable_name, ', '.join([placeholder_sign for x in range(len(file_data[0]))]))
-            dbconnection.cursor.executemany(sql, list(df.itertuples(index=False)))
+                temptable_name, ', '.join([placeholder_sign for x in range(len(header))]))
+            dbconnection.cursor.executemany(sql, df.itertuples(index=False))
         else:
             csv_buffer = io.StringIO()
             df.to_csv(csv_buffer, index=False, header=False, sep=';')
             csv_buffer.seek(0)
             try:
-                dbconnection.cursor.copy_from(csv_buffer, temptable_name, sep=";")
+                # None is written as an empty field, which is read back as NULL.
+                dbconnection.cursor.copy_from(csv_buffer, temptable_name, sep=";", null='')
             except psycopg2.errors.BadCopyFileFormat:
                 # This is probably due to the separator exists in the values.
                 placeholder_sign = db_utils.placeholder_sign(dbconnection)
@@ -339,15 +392,15 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
 
         return numskipped
 
-    def list_to_table_using_loop(self, dbconnection, temptable_name, file_data, primary_keys_for_concat):
+    def list_to_table_using_loop(self, dbconnection, temptable_name, header, rows, primary_keys_for_concat):
         numskipped = 0
         placeholder_sign = db_utils.placeholder_sign(dbconnection)
-        concat_cols = [file_data[0].index(pk) for pk in primary_keys_for_concat]
+        concat_cols = [header.index(pk) for pk in primary_keys_for_concat]
         added_rows = set()
 
         sql = """INSERT INTO %s VALUES (%s)""" % (
-        temptable_name, ', '.join([placeholder_sign for x in range(len(file_data[0]))]))
-        for row in file_data[1:]:
+        temptable_name, ', '.join([placeholder_sign for x in range(len(header))]))
+        for row in rows:
             if primary_keys_for_concat:
                 concatted = '|'.join([ru(row[idx]) for idx in concat_cols])
                 if concatted in added_rows:
@@ -382,31 +435,28 @@ class midv_data_importer(object):  # this class is intended to be a multipurpose
 
         The function uses all primary keys to identify unique combinations, so different parameters will not block each other.
         """
-        pks = [pk for pk in primary_keys if pk != 'date_time']
-        pks.append('date_time')
-
-        #TODO: Maybe the length should be checked so that the test is only made for 2016-01-01 00:00 and 2016-01-01 00:00:00?
-
-        #Delete records that have the same date_time but with :00 at the end. (2016-01-01 00:00 will not be imported if 2016-01-01 00:00:00 exists
-        pks_and_00 = list(pks)
-        pks_and_00.append("':00'")
+        other_pks = [pk for pk in primary_keys if pk != 'date_time']
 
         if dbconnection.dbtype.lower() == 'postgis':
             dest_table = f'"{dbconnection.schema}"."{dest_table}"'
 
-        sql = '''delete from %s where %s in (select %s from %s)'''%(self.temptable_name,
-                                                                                          ' || '.join(pks_and_00),
-                                                                                          ' || '.join(pks),
-                                                                                          dest_table)
-        dbconnection.execute(sql)
-
-        # Delete records from temptable that have date_time yyyy-mm-dd HH:MM:XX when yyyy-mm-dd HH:MM exist.
-        #delete from temptable where SUBSTR("obsid" || "date_time", 1, length("obsid" || "date_time") - 3) in (select "obsid" || "date_time" from goaltable)
-        sql = '''delete from %s where SUBSTR(%s, 1, length(%s) - 3) in (select %s from %s)'''%(self.temptable_name,
-                                                                                          ' || '.join(pks),
-                                                                                          ' || '.join(pks),
-                                                                                          ' || '.join(pks),
-                                                                                          dest_table)
+        rowid = db_utils.rowid_string(dbconnection)
+
+        # The rows of the temptable are looked up in the primary key index of the destination table, so the
+        # time depends on the number of rows to import and not on the number of rows already in the database.
+        # The first candidate blocks 2016-01-01 00:00 if 2016-01-01 00:00:00 exists.
+        # The second candidate blocks 2016-01-01 00:00:XX if 2016-01-01 00:00 exists.
+        sql = '''DELETE FROM {temptable} WHERE {rowid} IN (
+                     SELECT t.{rowid} FROM {temptable} AS t
+                     WHERE EXISTS (
+                         SELECT 1 FROM {dest_table} AS d
+                         WHERE {pks_equal}d.date_time IN (t.date_time || ':00',
+                                                          CASE WHEN LENGTH(t.date_time) > 3
+                                                          THEN SUBSTR(t.date_time, 1, LENGTH(t.date_time) - 3) END)))'''.format(
+            temptable=self.temptable_name,
+            rowid=rowid,
+            dest_table=dest_table,
+            pks_equal=''.join(['d.{pk} = t.{pk} AND '.format(pk=pk) for pk in other_pks]))
         dbconnection.execute(sql)
 
     def create_geometry_sql(self, geom_col, table_name, dbconnection, source_srid, null_replacement,
@@ -534,6 +584,47 @@ class MidvDataImporterError(Exception):
     pass
 
 
+def file_data_chunks(file_data, chunksize=None):
+    """
+    Splits file_data into the header and an iterator of chunks of rows.
+
+    :param file_data: a list of list with a header list as first row, or any iterable yielding the header first.
+    :param chunksize: The maximum number of rows in each chunk. If None, a list is kept as one chunk and other
+                      iterables are split into chunks of DEFAULT_CHUNKSIZE rows.
+    :return: (header, chunks), or (None, None) if file_data was empty.
+
+    >>> header, chunks = file_data_chunks([['a', 'b'], [1, 2], [3, 4], [5, 6]], 2)
+    >>> header, list(chunks)
+    (['a', 'b'], [[[1, 2], [3, 4]], [[5, 6]]])
+    >>> file_data_chunks([])
+    (None, None)
+    """
+    if file_data is None:
+        return None, None
+
+    if isinstance(file_data, (list, tuple)) and chunksize is None:
+        if not file_data:
+            return None, None
+        return list(file_data[0]), iter([file_data[1:]])
+
+    rows = iter(file_data)
+    header = next(rows, None)
+    if header is None:
+        return None, None
+
+    if chunksize is None:
+        chunksize = DEFAULT_CHUNKSIZE
+
+    def chunks():
+        while True:
+            chunk = list(itertools.islice(rows, chunksize))
+            if not chunk:
+                return
+            yield chunk
+
+    return list(header), chunks()
+
+
 def import_exception_handler(func):
     def new_func(*args, **kwargs):
         try:
@@ -25,6 +25,7 @@ from __future__ import absolute_import
 import io
 import os
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from builtins import str
@@ -50,6 +51,9 @@ except:
 else:
     pandas_on = True
 
+# The number of data rows used to find the delimiter of a mon-file.
+DELIMITER_SAMPLE_SIZE = 100
+
 import_ui_dialog =  qgis.PyQt.uic.loadUiType(os.path.join(os.path.dirname(__file__),'..','ui', 'import_fieldlogger.ui'))[0]
 
 class DiverofficeImport(qgis.PyQt.QtWidgets.QMainWindow, import_ui_dialog):
@@ -192,6 +196,10 @@ class DiverofficeImport(qgis.PyQt.QtWidgets.QMainWindow, import_ui_dialog):
         parsed_files = []
         missing_utcoffset = False
 
+        if self.parse_func is self.parse_diveroffice_file:
+            read_files = self.read_diveroffice_files_concurrently(files, skip_rows_without_water_level, from_date, to_date)
+        else:
+            read_files = {}
 
         for selected_file in files:
             skip_file = False
@@ -202,7 +210,16 @@ class DiverofficeImport(qgis.PyQt.QtWidgets.QMainWindow, import_ui_dialog):
                 parse_func = self.parse_func
 
             try:
-                res = parse_func(path=selected_file, charset=self.charsetchoosen, skip_rows_without_water_level=skip_rows_without_water_level, begindate=from_date, enddate=to_date)
+                if selected_file in read_files:
+                    read_settings, future = read_files[selected_file]
+                    if future is None:
+                        res = read_settings
+                    else:
+                        res = self.diveroffice_columns_to_filedata(read_settings, future.result())
+                else:
+                    res = parse_func(path=selected_file, charset=self.charsetchoosen, skip_rows_without_water_level=skip_rows_without_water_level, begindate=from_date, enddate=to_date)
+            except DiverofficeDataError as e:
+                res = common_utils.ask_user_about_stopping(ru(QCoreApplication.translate('DiverofficeImport', "Failure, parsing failed for file %s\nInvalid date_time: %s\nDo you want to stop the import? (else it will continue with the next file)")) % (selected_file, ', '.join([ru(x) for x in e.invalid_dates[:10]])))
             except:
                 common_utils.MessagebarAndLog.critical(bar_msg=ru(QCoreApplication.translate('LeveloggerImport',
                                                                                       '''Error on file %s.''')) % selected_file,
@@ -343,37 +360,97 @@ class DiverofficeImport(qgis.PyQt.QtWidgets.QMainWindow, import_ui_dialog):
         if self.close_after_import.isChecked():
             self.close()
 
+    def read_diveroffice_files_concurrently(self, files, skip_rows_without_water_level, from_date=None, to_date=None):
+        """ Reads the data sections of all mon-files using a pool of worker threads.
+
+        The metadata of each file is scanned first in the GUI thread, as the user may be asked for the delimiter.
+        The workers only read and convert the data, using pandas which releases the GIL while parsing.
+        Threads are used instead of processes as QGIS can't reliably start new python processes on all platforms.
+
+        :return: a dict like {selected_file: (read_settings, future)}. future is None if read_settings is
+                 a result like 'skip'. All futures are done when this method returns.
+        """
+        read_files = {}
+        mon_files = [selected_file for selected_file in files if not selected_file.endswith('.csv')]
+        if not mon_files:
+            return read_files
+
+        with ThreadPoolExecutor(max_workers=min(len(mon_files), os.cpu_count() or 1)) as executor:
+            for selected_file in mon_files:
+                try:
+                    read_settings = self.scan_diveroffice_file(selected_file, self.charsetchoosen,
+                                                               skip_rows_without_water_level)
+                except:
+                    common_utils.MessagebarAndLog.critical(bar_msg=ru(QCoreApplication.translate('LeveloggerImport',
+                                                                                          '''Error on file %s.''')) % selected_file,
+                                                           log_msg=traceback.format_exc())
+                    raise
+
+                if isinstance(read_settings, str):
+                    read_files[selected_file] = (read_settings, None)
+                else:
+                    read_files[selected_file] = (read_settings, executor.submit(read_diveroffice_data, read_settings,
+                                                                                begindate=from_date, enddate=to_date))
+        return read_files
+
     @staticmethod
     def parse_diveroffice_file(path, charset, skip_rows_without_water_level=False, begindate=None, enddate=None):
+        read_settings = DiverofficeImport.scan_diveroffice_file(path, charset, skip_rows_without_water_level)
+        if isinstance(read_settings, str):
+            return read_settings
+        columns = read_diveroffice_data(read_settings, begindate=begindate, enddate=enddate)
+        return DiverofficeImport.diveroffice_columns_to_filedata(read_settings, columns)
+
+    @staticmethod
+    def scan_diveroffice_file(path, charset, skip_rows_without_water_level=False):
+        """ Reads the metadata of a diveroffice file and finds out how the data section should be read.
+
+        Only the rows up to the data section and the first rows of the data are read.
+        The user may be asked for the delimiter, so this must run in the GUI thread.
+
+        :return: a dict used by read_diveroffice_data or 'skip'.
+        """
         if not pandas_on:
             raise common_utils.UsageError(ru(QCoreApplication.translate('DiverofficeImport', "Parsing mon-files requires Python Pandas library!")))
 
-        filedata = []
         filename = os.path.basename(path)
         section = None
         data_start_row = None
         metadata = {}
+        sample_rows = []
         # Parse metadata
         with io.open(path, 'rt', encoding=str(charset)) as f:
-            rows = [ru(rawrow).rstrip('\n').rstrip('\r').strip() for rawrow in f]
+            for rownr, rawrow in enumerate(f):
+                row = ru(rawrow).rstrip('\n').rstrip('\r').strip()
 
-        for rownr, row in enumerate(rows):
-            if path.lower().endswith('.csv') and row.startswith('Date/time'):
-                data_start_row = rownr+1
-                break
+                if data_start_row is not None:
+                    if rownr < data_start_row or not row:
+                        continue
+                    if row.lower().startswith('end of data') or len(sample_rows) >= DELIMITER_SAMPLE_SIZE:
+                        break
+                    sample_rows.append(row)
+                    continue
 
-            if row.startswith('['):
-                section = row.strip().lstrip('[').rstrip(']').lower()
+                if path.lower().endswith('.csv') and row.startswith('Date/time'):
+                    data_start_row = rownr+1
+                    continue
 
-                if section == 'data':
-                    data_start_row = rownr+2
-                    break
-                else:
+                if row.startswith('['):
+                    section = row.strip().lstrip('[').rstrip(']').lower()
+
+                    if section == 'data':
+                        data_start_row = rownr+2
                     continue
 
-            if section:
-                kv = [x.strip() for x in row.split('=')]
-                metadata.setdefault(section, {})[kv[0].lower()] = '='.join(kv[1:])
+                if section:
+                    kv = [x.strip() for x in row.split('=')]
+                    metadata.setdefault(section, {})[kv[0].lower()] = '='.join(kv[1:])
+
+        if data_start_row is None:
+            common_utils.MessagebarAndLog.warning(
+                bar_msg=QCoreApplication.translate('DiverofficeImport', "Diveroffice import warning. See log message panel"),
+                log_msg=ru(QCoreApplication.translate('DiverofficeImport', "Warning, the file %s \ndid not have a [Data] section and will be skipped.")) % path)
+            return 'skip'
 
         utc_offset = metadata.get('logger settings', {}).get('instrument number', '')
         if not utc_offset:
@@ -391,18 +468,7 @@ class DiverofficeImport(qgis.PyQt.QtWidgets.QMainWindow, import_ui_dialog):
                 colname = data['identification']
                 data_headers[int(secno)] = colname
 
-        stop_row = None
-        for inv_rownr, row in enumerate(rows[::-1]):
-            true_rownr = len(rows) - inv_rownr - 1
-            if true_rownr == data_start_row:
-                break
-            if row.lower().strip().startswith('end of data'):
-                stop_row = true_rownr
-                break
-        if stop_row is not None:
-            skipfooter = len(rows) - stop_row
-
-        delimiter = common_utils.get_delimiter_from_file_rows(rows[data_start_row:stop_row],
+        delimiter = common_utils.get_delimiter_from_file_rows(sample_rows,
                                                               delimiters=['\t', ';', ',', '        ', '       ',
                                                                           '      ', '     ', '    ', '   ', '  '],
                                                               num_fields=len(data_headers), filename=filename)
@@ -428,28 +494,36 @@ class DiverofficeImport(qgis.PyQt.QtWidgets.QMainWindow, import_ui_dialog):
             common_utils.MessagebarAndLog.warning(
                 bar_msg=QCoreApplication.translate('DiverofficeImport', "Diveroffice import warning. See log message panel"),
                 log_msg=ru(QCoreApplication.translate('DiverofficeImport', "Warning, the file %s \ndid not have Water head as a channel.\nMake sure its barocompensated!"))%path)
-            if skip_rows_without_water_level:
+            if skip_rows_without_water_level or not colnames:
                 return 'skip'
 
-        df = pd.read_csv(path, sep=delimiter, encoding=charset, usecols=usecols, names=colnames,
-                         skipfooter=skipfooter, skiprows=data_start_row, parse_dates=['date_time'])
-        for col in df.columns[1:]:
-            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '.').str.strip(), errors='coerce')
+        return {'path': path,
+                'charset': charset,
+                'filename': filename,
+                'location': location,
+                'utc_offset': utc_offset,
+                'delimiter': delimiter,
+                'data_start_row': data_start_row,
+                'usecols': usecols,
+                'colnames': colnames,
+                'skip_rows_without_water_level': skip_rows_without_water_level}
 
-        if not df.empty:
-            if begindate is not None:
-                df = df.loc[(df['date_time'] >= begindate), :]
-            if enddate is not None:
-                df = df.loc[df['date_time'] <= enddate, :]
+    @staticmethod
+    def diveroffice_columns_to_filedata(read_settings, columns):
+        """ Turns the columns from read_diveroffice_data into the result of parse_diveroffice_file.
 
-            if df.empty:
-                return filedata, filename, location, utc_offset
+        Runs in the GUI thread as the user may be asked about stopping.
+        """
+        filedata = []
+        filename = read_settings['filename']
+        location = read_settings['location']
+        utc_offset = read_settings['utc_offset']
 
-        if skip_rows_without_water_level:
-            df = df.dropna(subset=['head_cm'])
-            if df.empty:
-                return filedata, filename, location, utc_offset
+        if columns is None:
+            # All rows were filtered away.
+            return filedata, filename, location, utc_offset
 
+        df = pd.DataFrame(columns)
         df['date_time'] = df['date_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
         # Replaces NaN with None
         df = df.astype(object).where(pd.notnull(df), None)
@@ -460,7 +534,7 @@ class DiverofficeImport(qgis.PyQt.QtWidgets.QMainWindow, import_ui_dialog):
                 df[c] = None
         filedata.extend(df.loc[:, filedata[0]].values.tolist())
         if len(filedata) < 2:
-            return common_utils.ask_user_about_stopping(ru(QCoreApplication.translate('DiverofficeImport', "Failure, parsing failed for file %s\nNo valid data found!\nDo you want to stop the import? (else it will continue with the next file)")) % path)
+            return common_utils.ask_user_about_stopping(ru(QCoreApplication.translate('DiverofficeImport', "Failure, parsing failed for file %s\nNo valid data found!\nDo you want to stop the import? (else it will continue with the next file)")) % read_settings['path'])
 
         return filedata, filename, location, utc_offset
 
@@ -666,3 +740,63 @@ class CheckboxAndExplanation(VRowEntry):
         self.checkbox.setChecked(check)
 
 
+
+
+class DiverofficeDataError(Exception):
+    """ Raised by read_diveroffice_data when the data section has rows with invalid date_time.
+
+    :param invalid_dates: the invalid date_time values.
+    """
+    def __init__(self, invalid_dates):
+        super(DiverofficeDataError, self).__init__(invalid_dates)
+        self.invalid_dates = invalid_dates
+
+
+def read_diveroffice_data(read_settings, begindate=None, enddate=None):
+    """ Reads the data section of a diveroffice file into column arrays.
+
+    Doesn't use any gui functions, so it can be run in a worker thread.
+
+    :param read_settings: a dict from DiverofficeImport.scan_diveroffice_file.
+    :param begindate: skip rows before this date.
+    :param enddate: skip rows after this date.
+    :return: an OrderedDict like {'date_time': datetime64-array, 'head_cm': array, ...}, or None if all rows were
+             filtered away.
+    :raises DiverofficeDataError: if a row other than the footer has an invalid date_time.
+    """
+    delimiter = read_settings['delimiter']
+    # If no delimiter was found, sep=None lets pandas detect it (requires the python engine).
+    df = pd.read_csv(read_settings['path'], sep=delimiter, encoding=read_settings['charset'],
+                     usecols=read_settings['usecols'], names=read_settings['colnames'],
+                     skiprows=read_settings['data_start_row'], dtype=str,
+                     engine='c' if delimiter is not None and len(delimiter) == 1 else 'python')
+
+    date_strings = df['date_time'].str.strip()
+    # The footer ("END OF DATA FILE...") is removed. Any other row without a valid date is an error.
+    footer = date_strings.str.lower().str.startswith('end of data').fillna(False).astype(bool)
+    df = df.loc[~footer, :].copy()
+    date_strings = date_strings[~footer]
+    date_time = pd.to_datetime(date_strings, errors='coerce')
+    invalid_dates = date_time.isna()
+    if invalid_dates.any():
+        raise DiverofficeDataError(date_strings[invalid_dates].tolist())
+    df['date_time'] = date_time
+
+    for col in df.columns[1:]:
+        df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '.').str.strip(), errors='coerce')
+
+    if not df.empty:
+        if begindate is not None:
+            df = df.loc[(df['date_time'] >= begindate), :]
+        if enddate is not None:
+            df = df.loc[df['date_time'] <= enddate, :]
+
+        if df.empty:
+            return None
+
+    if read_settings['skip_rows_without_water_level']:
+        df = df.dropna(subset=['head_cm'])
+        if df.empty:
+            return None
+
+    return OrderedDict([(col, df[col].to_numpy()) for col in df.columns])
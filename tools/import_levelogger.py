@@ -159,7 +159,7 @@ class LeveloggerImport(import_diveroffice.DiverofficeImport):
             return [], filename, location, timezone
         else:
             date_str = ' '.join([first_data_row[date_colnr], first_data_row[time_colnr]])
-            date_format = date_utils.datestring_to_date(date_str)
+            date_format = date_utils.find_date_format(date_str)
             if date_format is None:
                 common_utils.MessagebarAndLog.warning(bar_msg=ru(QCoreApplication.translate('LeveloggerImport',
                                                                                      '''Dateformat in file %s could not be parsed.''')) % filename)
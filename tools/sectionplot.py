@@ -13,7 +13,9 @@
 from __future__ import absolute_import
 
 import copy
+import heapq
 import os
+import re
 import sqlite3 as sqlite  # needed since spatialite-specific sql will be used during polyline layer import
 import traceback
 import types
@@ -37,7 +39,7 @@ from qgis.PyQt.QtWidgets import QApplication, QDockWidget, QSizePolicy
 from qgis.core import (QgsProject, QgsVectorLayer, QgsRectangle, QgsGeometry,
                        QgsFeatureRequest, QgsWkbTypes, QgsMapLayer, QgsRuleBasedRenderer,
                        QgsCategorizedSymbolRenderer, QgsSingleSymbolRenderer, QgsRenderContext,
-                       Qgis)
+                       QgsCoordinateTransform, QgsCoordinateReferenceSystem, QgsPointXY, Qgis)
 
 from midvatten.tools.utils.gui_utils import set_combobox
 
@@ -58,7 +60,7 @@ from midvatten.tools.utils.midvatten_utils import PlotTemplates
 from midvatten.tools.utils.matplotlib_replacements import NavigationToolbarWithSignal as NavigationToolbar
 import midvatten.definitions.midvatten_defs as defs
 from midvatten.tools.utils import matplotlib_replacements
-from midvatten.tools.utils.sampledem import qchain, sampling
+from midvatten.tools.utils.sampledem import chainage, sample_raster_points, line_locate_points
 
 try:
     import pandas as pd
@@ -79,6 +81,13 @@ SAKNAS:
 """
 
 
+# {(db identity, table, obsids, resample settings): (change token, WaterLevelCube)}
+_water_level_cube_cache = {}
+WATER_LEVEL_CUBE_CACHE_SIZE = 8
+# {db identity: name of the line locate point function}
+_line_locate_point_functions = {}
+
+
 class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPlotDock  is created instantaniously as this is created
     def __init__(self, parent1, iface1):
         #super(sectionplot, self).save_settings()
@@ -88,6 +97,7 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
         self.obsids_x_position = {}
 
         self.df = None
+        self.water_level_cube = None
         self.p = []
 
         self.geo_bars = {}
@@ -111,6 +121,7 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
 
         self.initUI()
         self.obsid_annotation = {}
+        self.polygon_rule_cache = {}
         self.water_level_labels_duplicate_check = []
         self.template_plot_label.setText("<a href=\"https://github.com/jkall/qgis-midvatten-plugin/wiki/5.-Plots-and-reports#create-section-plot\">Templates manual</a>")
         self.template_plot_label.setOpenExternalLinks(True)
@@ -299,13 +310,10 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
             # Test that layer and feature have been selected
             # upload vector line layer as temporary table in sqlite db
             self.line_crs = self.sectionlinelayer.crs()
-            # print(str(self.dbconnection.cursor().execute('select * from a.sqlite_master').fetchall()))
-            ok = self.upload_qgis_vector_layer(self.sectionlinelayer, self.line_crs.postgisSrid(), True,
-                                               False)  # loads qgis polyline layer into sqlite table
-            if not ok:
+            if self.get_section_line_geometry(self.sectionlinelayer) is None:
                 return None
 
-            # get sorted obsid and distance along section from sqlite db
+            # get sorted obsid and distance along section
             if len(selected_obspoints):
                 self.obsids_x_position = self.get_length_along(selected_obspoints)
 
@@ -339,9 +347,10 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
         
         # get PlotData
         self.z_data = self.get_z_data()
-        self.geo_bars = self.get_plot_data_bars(defs.PlotTypesDict(), strat_key='TRIM(LOWER(geoshort))')
+        self.strata = self.get_stratigraphy_data()
+        self.geo_bars = self.get_plot_data_bars(defs.PlotTypesDict(), strat_column='geoshort', lower=True)
         hydro_subtypes = {k: "IN ('{}')".format(k) for k in self.hydro_colors.keys()}
-        self.hydro_bars = self.get_plot_data_bars(hydro_subtypes, strat_key='TRIM(capacity)')
+        self.hydro_bars = self.get_plot_data_bars(hydro_subtypes, strat_column='capacity', lower=False)
         self.layer_texts = self.get_plot_data_layer_texts()
         self.get_plot_data_seismic()
         self.get_missing_obsid_labels()
@@ -805,15 +814,68 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
             self.rasterselection.append(item.text())
 
     @fn_timer
-    def get_length_along(self,obsidtuple):#returns a numpy recarray with attributes obs_id and length 
-        #------------First a sql clause that returns a table, but that is not what we need
+    def get_length_along(self, obsidtuple, in_db=False):
+        """
+        Calculates the distance along the section line for the obsids.
+
+        :param obsidtuple: The obsids
+        :param in_db: True to upload the line to a temporary table and calculate the distances in the database.
+                      False to project the obs_points on the line geometry in qgis.
+        :return: A dict like {obsid: distance along the line} ordered by distance.
+        """
+        if in_db:
+            return self.get_length_along_in_db(obsidtuple)
+
+        linegeom = self.get_section_line_geometry(self.sectionlinelayer)
+        if linegeom is None:
+            return {}
+
+        res = self.dbconnection.execute_and_fetchall('''SELECT obsid, ST_X(geometry), ST_Y(geometry), ST_SRID(geometry)
+                                                         FROM obs_points WHERE obsid IN ({})'''.format(
+                                                         common_utils.sql_unicode_list(obsidtuple)))
+        missing_geometry = [ru(row[0]) for row in res if row[1] is None or row[2] is None]
+        if missing_geometry:
+            common_utils.MessagebarAndLog.warning(bar_msg=ru(QCoreApplication.translate('SectionPlot',
+                                                  'Obsids without geometry skipped: %s')) % ', '.join(missing_geometry))
+        res = [row for row in res if row[1] is not None and row[2] is not None]
+        if not res:
+            return {}
+
+        points = np.array([[row[1], row[2]] for row in res], dtype=float)
+        srid = res[0][3]
+        if srid and srid != self.line_crs.postgisSrid():
+            transform = QgsCoordinateTransform(QgsCoordinateReferenceSystem.fromEpsgId(int(srid)), self.line_crs,
+                                               QgsProject.instance())
+            points = np.array([[p.x(), p.y()] for p in [transform.transform(QgsPointXY(x, y)) for x, y in points]],
+                              dtype=float)
+
+        distances = line_locate_points(linegeom, points)
+        return dict(sorted([(ru(row[0]), float(distance)) for row, distance in zip(res, distances)],
+                                  key=itemgetter(1)))
+
+    def get_length_along_in_db(self, obsidtuple):
+        ok = self.upload_qgis_vector_layer(self.sectionlinelayer, self.line_crs.postgisSrid(), True,
+                                           False)  # loads qgis polyline layer into sqlite table
+        if not ok:
+            return {}
 
         sql = """SELECT p.obsid, ST_Length((SELECT geometry FROM {temptable_name})) * {funcname}((SELECT geometry FROM {temptable_name}), p.geometry) AS absdist FROM obs_points AS p
-                  WHERE p.obsid in {obsids}
-                  ORDER BY absdist"""
+                  WHERE p.obsid in ({obsids})
+                  ORDER BY absdist""".format(temptable_name=self.temptable_name,
+                                             funcname=self.get_line_locate_point_function(),
+                                             obsids=common_utils.sql_unicode_list(obsidtuple))
+        res = self.dbconnection.execute_and_fetchall(sql)
+        return {ru(row[0]): row[1] for row in res}
+
+    def get_line_locate_point_function(self):
+        """
+        Returns the name of the line locate point function of the database. The name is only resolved once per database.
+        """
+        db_identity = self.dbconnection.db_identity()
+        if db_identity in _line_locate_point_functions:
+            return _line_locate_point_functions[db_identity]
 
         funcnames = ['ST_Line_Locate_Point', 'ST_LineLocatePoint']
-
         if self.dbconnection.dbtype == 'postgis':
             try:
                 _funcname = self.dbconnection.execute_and_fetchall('''SELECT proname FROM pg_proc
@@ -822,52 +884,47 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
                 common_utils.MessagebarAndLog.info(log_msg=traceback.format_exc())
             else:
                 if _funcname:
-                    _funcname = _funcname[0][0]
-                    funcnames.append(_funcname)
+                    funcnames.append(_funcname[0][0])
+
         cur = self.dbconnection.cursor
-        for nr, funcname in enumerate(funcnames):
+        for funcname in funcnames:
             try:
-                cur.execute(sql.format(temptable_name=self.temptable_name,
-                                           funcname=funcname,
-                                           obsids='({})'.format(', '.join(
-                                               ["'{}'".format(o) for o in obsidtuple]))))
+                cur.execute("SELECT {}(ST_GeomFromText('LINESTRING(0 0, 1 0)'), ST_GeomFromText('POINT(0 0)'))".format(funcname))
+                cur.fetchall()
             except:
-                if nr+1 == len(funcnames):
-                    # Run last sql again to get an error.
-                    res = self.dbconnection.execute_and_fetchall(sql.format(temptable_name=self.temptable_name,
-                                           funcname=funcname,
-                                           obsids='({})'.format(', '.join(
-                                               ["'{}'".format(o) for o in obsidtuple]))))
-                else:
-                    pass
+                if self.dbconnection.dbtype == 'postgis':
+                    self.dbconnection.conn.rollback()
             else:
-                res = cur.fetchall()
                 break
-
-        data = {ru(row[0]): row[1] for row in res}
-        return data
+        _line_locate_point_functions[db_identity] = funcname
+        return funcname
 
     @fn_timer
     def get_z_data(self):
         z_data = {}
+        obs_points_data = {}
+        if self.obsids_x_position:
+            sql = "SELECT obsid, h_toc, h_gs, length FROM obs_points WHERE obsid IN ({})".format(
+                common_utils.sql_unicode_list(self.obsids_x_position.keys()))
+            obs_points_data = {ru(row[0]): row[1:] for row in db_utils.sql_load_fr_db(sql, self.dbconnection)[1]}
+
         for obs in self.obsids_x_position.keys():
-            sql = "SELECT h_toc, h_gs, length FROM obs_points WHERE obsid = '{}'".format(obs)
-            recs = db_utils.sql_load_fr_db(sql, self.dbconnection)[1]
-            if common_utils.isfloat(str(recs[0][1])) and recs[0][1] > -999:
-                z = recs[0][1]
-            elif common_utils.isfloat(str(recs[0][0])) and recs[0][0] > -999:
-                z = recs[0][0]
+            h_toc, h_gs, length = obs_points_data.get(obs, (None, None, None))
+            if common_utils.isfloat(str(h_gs)) and h_gs > -999:
+                z = h_gs
+            elif common_utils.isfloat(str(h_toc)) and h_toc > -999:
+                z = h_toc
                 common_utils.MessagebarAndLog.warning(bar_msg=ru(QCoreApplication.translate('SectionPlot',
                                                                                             "Obsid %s: using h_gs '%s' failed, using '%s' instead.")) % (
-                                                                  obs, str(recs[0][1]), 'h_toc'))
+                                                                  obs, str(h_gs), 'h_toc'))
             else:
                 z = 0
                 common_utils.MessagebarAndLog.warning(bar_msg=ru(QCoreApplication.translate('SectionPlot',
                                                                                             "Obsid %s: using h_gs %s or h_toc %s failed, using 0 instead.")) % (
-                                                                  obs, str(recs[0][1]), str(recs[0][0])))
+                                                                  obs, str(h_gs), str(h_toc)))
 
-            if common_utils.isfloat(str(recs[0][2])):
-                barheight = recs[0][2]
+            if common_utils.isfloat(str(length)):
+                barheight = length
             else:
                 barheight = 0
 
@@ -880,16 +937,50 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
         return z_data
 
     @fn_timer
-    def get_plot_data_bars(self, typ_subtypes, strat_key='lower(geoshort)'):#this is called when class is instantiated, collecting data specific for the profile line layer and the obs_points
+    def get_stratigraphy_data(self):
+        """
+        Reads the stratigraphy for all obsids in the section using one query.
+
+        The result is shared by get_plot_data_bars and get_plot_data_layer_texts.
+        :return: A dict like {obsid: [(depthtop, depthbot, geology, geoshort, capacity, development, comment), ...]}
+                 with the layers ordered by stratid.
+        """
+        strata = {}
+        if self.obsids_x_position:
+            sql = """SELECT obsid, depthtop, depthbot, geology, geoshort, capacity, development, comment
+                     FROM stratigraphy WHERE obsid IN ({})
+                     ORDER BY obsid, stratid""".format(common_utils.sql_unicode_list(self.obsids_x_position.keys()))
+            for row in db_utils.sql_load_fr_db(sql, self.dbconnection)[1]:
+                strata.setdefault(ru(row[0]), []).append(tuple(row[1:]))
+        return strata
+
+    @fn_timer
+    def get_plot_data_bars(self, typ_subtypes, strat_column='geoshort', lower=True):#this is called when class is instantiated, collecting data specific for the profile line layer and the obs_points
+        """
+        Creates the bars from self.strata in memory.
+
+        :param typ_subtypes: A dict like {typ: "in ('a', 'b')"} where the values are sql conditions for strat_column.
+        :param strat_column: 'geoshort' or 'capacity'
+        :param lower: True to compare strat_column in lower case.
+        :return: A dict like {typ: {'x': [], 'height': [], 'bottom': []}}
+        """
         common_utils.start_waiting_cursor()#show the user this may take a long time...
+        colnr = {'geoshort': 3, 'capacity': 4}[strat_column]
+        ascii_lower = self.dbconnection.dbtype == 'spatialite'
         bars = {}
         if len(self.obsids_x_position) > 0:
             for typ, subtypes in typ_subtypes.items():
+                condition = parse_sql_in_condition(subtypes)
+                if condition is None:
+                    strata = self.get_stratigraphy_data_using_condition(strat_column, lower, subtypes)
+                else:
+                    strata = self.strata
+
                 for obs, x in self.obsids_x_position.items():
-                    sql = """SELECT depthtop, depthbot
-                             FROM stratigraphy WHERE obsid = '{obs}' AND  {key} {values} 
-                             ORDER BY stratid""".format(obs=obs, key=strat_key, values=subtypes)
-                    recs = db_utils.sql_load_fr_db(sql, self.dbconnection)[1]
+                    recs = strata.get(obs, [])
+                    if condition is not None:
+                        recs = [row for row in recs if matches_sql_in_condition(row[colnr], condition, lower,
+                                                                                 ascii_lower)]
                     if not recs:
                         continue
 
@@ -903,17 +994,28 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
         common_utils.stop_waiting_cursor()#now this long process is done and the cursor is back as normal
         return bars
 
+    def get_stratigraphy_data_using_condition(self, strat_column, lower, subtypes):
+        """
+        Fallback for sql conditions that parse_sql_in_condition doesn't understand. Reads the matching layers for all
+        obsids using one query.
+        """
+        key = 'TRIM(LOWER({}))'.format(strat_column) if lower else 'TRIM({})'.format(strat_column)
+        sql = """SELECT obsid, depthtop, depthbot, geology, geoshort, capacity, development, comment
+                 FROM stratigraphy WHERE obsid IN ({obsids}) AND {key} {values}
+                 ORDER BY obsid, stratid""".format(obsids=common_utils.sql_unicode_list(self.obsids_x_position.keys()),
+                                                   key=key, values=subtypes)
+        strata = {}
+        for row in db_utils.sql_load_fr_db(sql, self.dbconnection)[1]:
+            strata.setdefault(ru(row[0]), []).append(tuple(row[1:]))
+        return strata
+
     @fn_timer
     def get_plot_data_layer_texts(self):
         bar_texts = {}
         common_utils.start_waiting_cursor()#show the user this may take a long time...
 
         for obs, x in self.obsids_x_position.items():
-            sql = """SELECT depthtop, depthbot, geology, geoshort, capacity, development,
-                    comment
-                    FROM stratigraphy WHERE obsid = '%s'
-                    ORDER BY stratid""" % (obs)
-            recs = db_utils.sql_load_fr_db(sql, self.dbconnection)[1]
+            recs = self.strata.get(obs)
             if not recs:
                 continue
 
@@ -968,58 +1070,50 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
 
     @fn_timer
     def plot_dems(self):
-        try:
-            if self.ms.settingsdict['secplotselectedDEMs'] and len(self.ms.settingsdict['secplotselectedDEMs'])>0:    # Adding a plot for each selected raster
-                for layername in self.ms.settingsdict['secplotselectedDEMs']:
-                    if not self.ms.settingsdict['secplotdem_sampling_distance']:
-                        distance = self.barwidth / 2.0
-                        if not distance:
-                            distance = max([feat for feat in self.sectionlinelayer.getSelectedFeatures()][0].geometry().length()/ 5000, 1)
+        if self.ms.settingsdict['secplotselectedDEMs'] and len(self.ms.settingsdict['secplotselectedDEMs'])>0:    # Adding a plot for each selected raster
+            if not self.ms.settingsdict['secplotdem_sampling_distance']:
+                distance = self.barwidth / 2.0
+                if not distance:
+                    distance = max([feat for feat in self.sectionlinelayer.getSelectedFeatures()][0].geometry().length()/ 5000, 1)
+            else:
+                distance = self.ms.settingsdict['secplotdem_sampling_distance']
+            # The points along the line are the same for all DEMs
+            xarray, points = chainage(self.sectionlinelayer, distance)
+
+            for layername in self.ms.settingsdict['secplotselectedDEMs']:
+                DEMdata = sample_raster_points(points, self.rastItems[str(layername)])
+                plotlable = self.get_plot_label_name(layername, self.get_legend_items_labels()[1])
+                settings = self.secplot_templates.loaded_template['dems_Axes_plot'].get(plotlable,
+                                                                                 self.secplot_templates.loaded_template['dems_Axes_plot']['DEFAULT'])
+                self.secplot_templates.loaded_template['dems_Axes_plot'][plotlable] = copy.deepcopy(settings)
+                settings = self.secplot_templates.loaded_template['dems_Axes_plot'][plotlable]
+                settings['label'] = settings.get('label', plotlable)
+                settings['picker'] = 2
+                lineplot, = self.axes.plot(xarray, DEMdata, **settings)  # The comma is terribly annoying and also different from a bar plot, see http://stackoverflow.com/questions/11983024/matplotlib-legends-not-working and http://stackoverflow.com/questions/10422504/line-plotx-sinx-what-does-comma-stand-for?rq=1
+                self.p.append(lineplot)
+
+                if self.ms.settingsdict['secplot_apply_graded_dems'] :
+                    secplot_color_layer_name = f"{layername}_secplotcolor"
+                    try:
+                        common_utils.find_layer(secplot_color_layer_name)
+                    except UsageError:
+                        pass
                     else:
-                        distance = self.ms.settingsdict['secplotdem_sampling_distance']
-                        
-                    temp_memorylayer, xarray = qchain(self.sectionlinelayer, distance)
-                    DEMdata = sampling(temp_memorylayer,self.rastItems[str(layername)])
-                    plotlable = self.get_plot_label_name(layername, self.get_legend_items_labels()[1])
-                    settings = self.secplot_templates.loaded_template['dems_Axes_plot'].get(plotlable,
-                                                                                     self.secplot_templates.loaded_template['dems_Axes_plot']['DEFAULT'])
-                    self.secplot_templates.loaded_template['dems_Axes_plot'][plotlable] = copy.deepcopy(settings)
-                    settings = self.secplot_templates.loaded_template['dems_Axes_plot'][plotlable]
-                    settings['label'] = settings.get('label', plotlable)
-                    settings['picker'] = 2
-                    lineplot, = self.axes.plot(xarray, DEMdata, **settings)  # The comma is terribly annoying and also different from a bar plot, see http://stackoverflow.com/questions/11983024/matplotlib-legends-not-working and http://stackoverflow.com/questions/10422504/line-plotx-sinx-what-does-comma-stand-for?rq=1
-                    self.p.append(lineplot)
-
-                    if self.ms.settingsdict['secplot_apply_graded_dems'] :
-                        secplot_color_layer_name = f"{layername}_secplotcolor"
-                        try:
-                            common_utils.find_layer(secplot_color_layer_name)
-                        except UsageError:
-                            pass
-                        else:
-                            alpha_max = self.ms.settingsdict['secplot_grading_max_opacity']
-                            alpha_min = self.ms.settingsdict['secplot_grading_min_opacity']
-                            number_of_plots = self.ms.settingsdict['secplot_grading_num_layers']
-                            graded_depth_m = self.ms.settingsdict['secplot_grading_depth']
-                            skip_labels = []
-                            self.plot_graded_dems(temp_memorylayer, self.sectionlinelayer, xarray, DEMdata, secplot_color_layer_name, layername, alpha_max=alpha_max, alpha_min=alpha_min, number_of_plots=number_of_plots, graded_depth_m=graded_depth_m, skip_labels=skip_labels)
-                    QgsProject.instance().removeMapLayer(temp_memorylayer.id())
-        except:
-            raise
-        finally:
-            try:
-                QgsProject.instance().removeMapLayer(temp_memorylayer.id())
-            except:
-                pass
+                        alpha_max = self.ms.settingsdict['secplot_grading_max_opacity']
+                        alpha_min = self.ms.settingsdict['secplot_grading_min_opacity']
+                        number_of_plots = self.ms.settingsdict['secplot_grading_num_layers']
+                        graded_depth_m = self.ms.settingsdict['secplot_grading_depth']
+                        skip_labels = []
+                        self.plot_graded_dems(points, self.sectionlinelayer, xarray, DEMdata, secplot_color_layer_name, layername, alpha_max=alpha_max, alpha_min=alpha_min, number_of_plots=number_of_plots, graded_depth_m=graded_depth_m, skip_labels=skip_labels)
 
     @fn_timer
-    def plot_graded_dems(self, temp_memorylayer, sectionlinelayer, xarray, DEMdata, layername, dem_layername, alpha_max=0.5, alpha_min=0, number_of_plots=20, graded_depth_m=2, skip_labels=None):
+    def plot_graded_dems(self, points, sectionlinelayer, xarray, DEMdata, layername, dem_layername, alpha_max=0.5, alpha_min=0, number_of_plots=20, graded_depth_m=2, skip_labels=None):
         try:
             color_layer = common_utils.find_layer(layername)
         except UsageError:
             return
 
-        points_srid = temp_memorylayer.crs().authid()
+        points_srid = sectionlinelayer.crs().authid()
         color_layer_srid = color_layer.crs().authid()
         if points_srid != color_layer_srid:
             common_utils.MessagebarAndLog.warning(bar_msg=ru(QCoreApplication.translate('SectionPlot', "Grade dem: Layer %s had wrong srid! Had '%s' but should have '%s'.")) % (layername, str(color_layer_srid), str(points_srid)))
@@ -1031,12 +1125,11 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
         else:
             print(f"Sampling as raster")
             labels_colors_dict = {}
-            colors = sampling(temp_memorylayer, color_layer, extract_type='value',
-                                            bands=(1, 2, 3))
+            colors = sample_raster_points(points, color_layer, bands=(1, 2, 3))
             for color in colors:
                 if color is not None:
-                    if color not in labels_colors_dict:
-                        labels_colors_dict[color] = f"{len(labels_colors_dict)+1}"
+                    if tuple(color) not in labels_colors_dict:
+                        labels_colors_dict[tuple(color)] = f"{len(labels_colors_dict)+1}"
 
             """colors = [tuple([float(c)/255.0 for c in color])
                       if color is not None else None
@@ -1198,37 +1291,8 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
 
     @fn_timer
     def plot_water_level_interactive(self):
-        sql = '''SELECT date_time, level_masl, obsid FROM {} WHERE obsid IN ({})'''.format(self.ms.settingsdict['secplotwlvltab'], common_utils.sql_unicode_list(self.obsids_x_position.keys()))
-        df = pd.read_sql(sql,
-                         self.dbconnection.conn,
-                         index_col='date_time',
-                         coerce_float=True,
-                         params=None,
-                         parse_dates={'date_time': {'format': 'mixed'}},
-                         columns=None,
-                         chunksize=None)
-
-        if isinstance(df, pd.Series):
-            df = df.to_frame()
-
-        resample_kwargs = {'how': self.resample_how.text()}
-        if self.resample_offset.text():
-            if pd.__version__ < '1.1.0':
-                resample_kwargs['base'] = int(self.resample_offset.text())
-            else:
-                resample_kwargs['offset'] = self.resample_offset.text()
-
-        # First resample each obsid to overcome duplicate date_times
-        df = resample(df.groupby(by=['obsid']), 'level_masl', self.resample_rule.text(), resample_kwargs)
-        df = df.apply(lambda x: x)
-
-        # Then pivot and resample to get a complete date_time index without missing datetimes.
-        df = df.reset_index()
-        df = df.pivot(index='date_time', columns='obsid', values='level_masl')
-        df = resample(df, None, self.resample_rule.text(), resample_kwargs)
-
-        if self.skip_nan.isChecked():
-            df = df.dropna()
+        self.water_level_cube = self.get_water_level_cube()
+        df = self.water_level_cube.df
 
         #The slider should update after user pan.
         valuemin = 0
@@ -1257,7 +1321,7 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
 
         self.date_slider.on_changed(self.update_animation)
         current_idx = self.get_slider_idx()
-        x_wl, WL = self.get_water_levels_from_df(df, current_idx, self.obsids_x_position)
+        x_wl, WL = self.get_water_levels_from_cube(self.water_level_cube, current_idx, self.obsids_x_position)
         self.waterlevel_lineplot(x_wl, WL, longdateformat(df_idx_as_datetime(df, current_idx)))
 
         self.canvas.mpl_connect('draw_event', self.update_slider)
@@ -1268,26 +1332,69 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
         return int(round(self.date_slider.val, 0))
 
     @fn_timer
-    def get_water_levels_from_df(self, df, idx, obsids_x_position):
+    def get_water_level_cube(self):
+        """
+        Returns the resampled water levels for the obsids in the section as a date x obsid matrix.
+
+        The matrix is cached per table, obsids and resample settings and only read again when the table has changed.
+        """
+        table = self.ms.settingsdict['secplotwlvltab']
+        resample_kwargs = {'how': self.resample_how.text()}
+        if self.resample_offset.text():
+            if pd.__version__ < '1.1.0':
+                resample_kwargs['base'] = int(self.resample_offset.text())
+            else:
+                resample_kwargs['offset'] = self.resample_offset.text()
+
+        obsids = tuple(sorted(self.obsids_x_position.keys()))
+        key = (self.dbconnection.db_identity(), table, obsids, self.resample_rule.text(),
+               tuple(sorted(resample_kwargs.items())), self.skip_nan.isChecked())
+        change_token = db_utils.table_change_token(table, obsids, value_column=['level_masl'],
+                                                   dbconnection=self.dbconnection)
+        cached = _water_level_cube_cache.get(key)
+        if cached is not None and cached[0] == change_token:
+            return cached[1]
+
+        sql = '''SELECT date_time, level_masl, obsid FROM {} WHERE obsid IN ({})'''.format(table, common_utils.sql_unicode_list(obsids))
+        df = pd.read_sql(sql,
+                         self.dbconnection.conn,
+                         index_col='date_time',
+                         coerce_float=True,
+                         params=None,
+                         parse_dates={'date_time': {'format': 'mixed'}},
+                         columns=None,
+                         chunksize=None)
+
+        if isinstance(df, pd.Series):
+            df = df.to_frame()
+
+        # First resample each obsid to overcome duplicate date_times
+        df = resample(df.groupby(by=['obsid']), 'level_masl', self.resample_rule.text(), resample_kwargs)
+        df = df.apply(lambda x: x)
+
+        # Then pivot and resample to get a complete date_time index without missing datetimes.
+        df = df.reset_index()
+        df = df.pivot(index='date_time', columns='obsid', values='level_masl')
+        df = resample(df, None, self.resample_rule.text(), resample_kwargs)
+
+        if self.skip_nan.isChecked():
+            df = df.dropna()
+
+        cube = WaterLevelCube(df)
+        if len(_water_level_cube_cache) >= WATER_LEVEL_CUBE_CACHE_SIZE:
+            _water_level_cube_cache.clear()
+        _water_level_cube_cache[key] = (change_token, cube)
+        return cube
+
+    @fn_timer
+    def get_water_levels_from_cube(self, cube, idx, obsids_x_position):
         WL = []
         x_wl = []
+        row = cube.values[idx]
         for obs, x in obsids_x_position.items():
-            try:
-                val = df.iloc[[idx]][obs]
-            except KeyError:
+            if obs not in cube.columns:
                 continue
-            except TypeError:
-                try:
-                    _obs = obs.encode('utf8').decode('utf8')
-                except Exception as e:
-                    common_utils.MessagebarAndLog.info(log_msg=ru(QCoreApplication.translate("Sectionplot: Encoding string failed for %s")) % ru(obs))
-                    continue
-                else:
-                    try:
-                        val = df.iloc[[idx]][_obs]
-                    except KeyError:
-                        continue
-
+            val = row[cube.columns[obs]]
             WL.append(val)
             x_wl.append(x)
             if obs not in self.obsid_annotation or not any([self.ms.settingsdict['stratigraphyplotted'],
@@ -1297,7 +1404,7 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
 
     def update_animation(self, datevalue):
         current_idx = self.get_slider_idx()
-        x_wl, WL = self.get_water_levels_from_df(self.df, current_idx, self.obsids_x_position)
+        x_wl, WL = self.get_water_levels_from_cube(self.water_level_cube, current_idx, self.obsids_x_position)
         if self._waterlevel_lineplot is not None and self.df is not None:
             self._waterlevel_lineplot.set_ydata(WL)
             self.axvline.set_xdata(df_idx_as_datetime(self.df, current_idx))
@@ -1421,16 +1528,14 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
         self.ms.settingsdict['secplotlocation']=dockarea
 
     @fn_timer
-    def upload_qgis_vector_layer(self, layer, srid=None,selected=False, mapinfo=True,Attributes=False): #from qspatialite, with a few  changes LAST ARGUMENT IS USED TO SKIP ARGUMENTS SINCE WE ONLY WANT THE GEOMETRY TO CALCULATE DISTANCES
-        """Upload layer (QgsMapLayer) (optionnaly only selected values ) into current DB, in self.temptable_name (string) with desired SRID (default layer srid if None) - user can desactivate mapinfo compatibility Date importation. Return True if operation succesfull or false in all other cases"""
-
-        #Upload a selected feature into a table. If spatialite, make it a memory table, if postgis make it temporary.
-        #upload two fields only, one id field set to dummy and one geometry field.
-
+    def get_section_line_geometry(self, layer):
+        """
+        Returns the geometry of the one selected feature in the section line layer, or None if it isn't a valid section line.
+        """
         selected_features = [f for f in layer.getSelectedFeatures()]
         if len(selected_features) != 1:
             common_utils.MessagebarAndLog.critical(bar_msg=ru(QCoreApplication.translate('SectionPlot', "Must select only one feature in qgis layer: %s)")) % layer.name())
-            return False
+            return None
 
         """
         qgis geometry types:
@@ -1443,22 +1548,31 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
         try:
             if layer.geometryType() != 1:
                 common_utils.MessagebarAndLog.critical(bar_msg=ru(QCoreApplication.translate('SectionPlot', "Layer %s is missing geometry type MULTILINESTRING, had %s")) % (layer.name(), str(layer.geometryType())))
-                return False
+                return None
         except:
             common_utils.MessagebarAndLog.critical(
                 bar_msg=ru(QCoreApplication.translate('SectionPlot', "Layer %s is not MultiLineString geometry")) % layer.name())
-            return False
-
-        self.temptable_name = self.dbconnection.create_temporary_table_for_import(self.temptable_name, ['dummyfield TEXT'], ['geometry', 'LINESTRING', srid])
-
-        feature = selected_features[0]
+            return None
 
-        geom = feature.geometry()
+        geom = selected_features[0].geometry()
         try:
             geom_linestring = geom.convertToType(1)
         except TypeError:
             # Adjustment for QGIS > 3.30
             geom_linestring = geom.convertToType(Qgis.GeometryType.Line)
+        return geom_linestring
+
+    def upload_qgis_vector_layer(self, layer, srid=None,selected=False, mapinfo=True,Attributes=False): #from qspatialite, with a few  changes LAST ARGUMENT IS USED TO SKIP ARGUMENTS SINCE WE ONLY WANT THE GEOMETRY TO CALCULATE DISTANCES
+        """Upload layer (QgsMapLayer) (optionnaly only selected values ) into current DB, in self.temptable_name (string) with desired SRID (default layer srid if None) - user can desactivate mapinfo compatibility Date importation. Return True if operation succesfull or false in all other cases"""
+
+        #Upload a selected feature into a table. If spatialite, make it a memory table, if postgis make it temporary.
+        #upload two fields only, one id field set to dummy and one geometry field.
+        geom_linestring = self.get_section_line_geometry(layer)
+        if geom_linestring is None:
+            return False
+
+        self.temptable_name = self.dbconnection.create_temporary_table_for_import(self.temptable_name, ['dummyfield TEXT'], ['geometry', 'LINESTRING', srid])
+
         wkt = geom_linestring.asWkt()
         sql = """INSERT INTO %s (dummyfield, geometry) VALUES ('0', ST_GeomFromText('%s', %s))"""%(self.temptable_name, wkt, srid)
         self.dbconnection.execute(sql)
@@ -1541,6 +1655,7 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
     def sample_polygon(self, polyLayer, sectionlinelayer, xarray):
         polyProvider = polyLayer.dataProvider()
         renderer = polyLayer.renderer()
+        renderer_key = (renderer.dump(), self.iface.mapCanvas().mapSettings().scale())
         if not isinstance(renderer, QgsRuleBasedRenderer):
             renderer = QgsRuleBasedRenderer.convertFromRenderer(renderer)
         root_rule = renderer.rootRule()
@@ -1551,7 +1666,10 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
 
         context = QgsRenderContext.fromMapSettings(self.iface.mapCanvas().mapSettings())
 
-        sampled_values = []
+        # The rule evaluation is remembered between redraws until the style or the scale changes.
+        if self.polygon_rule_cache.get(polyLayer.id(), (None, None))[0] != renderer_key:
+            self.polygon_rule_cache[polyLayer.id()] = (renderer_key, {})
+        processed_features = self.polygon_rule_cache[polyLayer.id()][1]
 
         x0_x1_poly = {}
         for linefeature in sectionlinelayer.getSelectedFeatures():
@@ -1565,49 +1683,152 @@ class SectionPlot(qgis.PyQt.QtWidgets.QDockWidget, Ui_SecPlotDock):#the Ui_SecPl
                     for line in multiline:
                         x0 = linegeom.lineLocatePoint(QgsGeometry().fromPointXY(line[0]))
                         x1 = linegeom.lineLocatePoint(QgsGeometry().fromPointXY(line[-1]))
-                        k = (x0, x1)
+                        k = (min(x0, x1), max(x0, x1))
                         if k not in x0_x1_poly:
                             x0_x1_poly[k] = polyfeature
 
-        processed_features = {}
-
-        x0_x1_poly = dict(sorted(x0_x1_poly.items()))
-        for x in xarray:
-            for (x0, x1), feat in x0_x1_poly.items():
-                if x0 <= x <= x1:
-                    if feat.id() in processed_features:
-                        sampled_values.append(processed_features[feat.id()])
-                        break
-
-                    rendered_rules = [r.ruleKey() for r in rules
-                                      if r.willRenderFeature(feat, context)]
-                    label_symbols = [
-                        (legend_symbols[k].label(), legend_symbols[k].symbol())
-                        for k in rendered_rules]
-
-                    if label_symbols:
-                        label, symbol = label_symbols[0]
-                        symbol_layers = symbol.symbolLayers()
-                        # Use the bottom layer color
-                        _color = symbol_layers[0].properties()['color']
-                        color_list = _color.split(',')
-                        try:
-                            color = tuple([float(c) / float(255) for c in color_list])
-                        except ValueError:
-                            if len(color_list) > 4:
-                                color = tuple(
-                                    [float(c) / float(255) for c in color_list[:4]])
-                            else:
-                                raise
-                        sampled_values.append((label, color))
-                        processed_features[feat.id()] = (label, color)
-                    else:
-                        processed_features[feat.id()] = None
-                    break
-            else:
+        intervals = list(x0_x1_poly.keys())
+        feature_idxs = first_containing_interval([x0 for x0, x1 in intervals], [x1 for x0, x1 in intervals], xarray)
+
+        sampled_values = []
+        for feature_idx in feature_idxs:
+            if feature_idx < 0:
                 sampled_values.append(None)
+                continue
+            feat = x0_x1_poly[intervals[feature_idx]]
+            attributes = tuple(str(attr) for attr in feat.attributes())
+            if feat.id() not in processed_features or processed_features[feat.id()][0] != attributes:
+                processed_features[feat.id()] = (attributes,
+                                                 self.polygon_label_color(feat, rules, legend_symbols, context))
+            sampled_values.append(processed_features[feat.id()][1])
         return sampled_values
 
+    def polygon_label_color(self, feat, rules, legend_symbols, context):
+        rendered_rules = [r.ruleKey() for r in rules
+                          if r.willRenderFeature(feat, context)]
+        label_symbols = [
+            (legend_symbols[k].label(), legend_symbols[k].symbol())
+            for k in rendered_rules]
+
+        if not label_symbols:
+            return None
+
+        label, symbol = label_symbols[0]
+        symbol_layers = symbol.symbolLayers()
+        # Use the bottom layer color
+        _color = symbol_layers[0].properties()['color']
+        color_list = _color.split(',')
+        try:
+            color = tuple([float(c) / float(255) for c in color_list])
+        except ValueError:
+            if len(color_list) > 4:
+                color = tuple(
+                    [float(c) / float(255) for c in color_list[:4]])
+            else:
+                raise
+        return (label, color)
+
+def first_containing_interval(starts, ends, xs):
+    """
+    Finds the interval containing each x using a sweep over the sorted intervals.
+
+    If several intervals contain x, the first one sorted by (start, end) is used.
+
+    >>> first_containing_interval([5, 0, 2], [8, 3, 6], [-1, 1, 2.5, 4, 8, 9]).tolist()
+    [-1, 1, 1, 2, 0, -1]
+
+    :param starts: The start of each interval.
+    :param ends: The end of each interval.
+    :param xs: The values to find intervals for.
+    :return: A numpy array with the index of the interval for each x, -1 if no interval contains x.
+    """
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    xs = np.asarray(xs, dtype=float)
+    result = np.full(len(xs), -1, dtype=int)
+    if not len(starts) or not len(xs):
+        return result
+
+    order = np.lexsort((ends, starts))
+    sorted_starts = starts[order]
+    sorted_ends = ends[order]
+    x_order = np.argsort(xs, kind='stable')
+    nr_of_started = np.searchsorted(sorted_starts, xs[x_order], side='right')
+
+    # Heap of the started intervals by sort order. Intervals ending before x can't contain any later x.
+    started = []
+    nr_pushed = 0
+    for x_idx, nr_started in zip(x_order, nr_of_started):
+        while nr_pushed < nr_started:
+            heapq.heappush(started, nr_pushed)
+            nr_pushed += 1
+        while started and sorted_ends[started[0]] < xs[x_idx]:
+            heapq.heappop(started)
+        if started:
+            result[x_idx] = order[started[0]]
+    return result
+
+def parse_sql_in_condition(sql_condition):
+    """
+    Parses an sql condition like "in ('a', 'b')" or "not in ('a', 'b')".
+
+    >>> negated, values = parse_sql_in_condition("NOT IN ('berg', 'b', 'o''hara')")
+    >>> negated, sorted(values)
+    (True, ['b', 'berg', "o'hara"])
+    >>> parse_sql_in_condition("LIKE '%sand%'") is None
+    True
+
+    :param sql_condition: The sql condition
+    :return: (negated, frozenset of values) or None if the condition couldn't be parsed.
+    """
+    match = re.match(r"\s*(not\s+)?in\s*\((.*)\)\s*$", sql_condition, flags=re.IGNORECASE | re.DOTALL)
+    if match is None:
+        return None
+    sql_string = r"'(?:[^']|'')*'"
+    if re.match(r"\s*{0}(\s*,\s*{0})*\s*$".format(sql_string), match.group(2)) is None:
+        return None
+    values = frozenset([value[1:-1].replace("''", "'") for value in re.findall(sql_string, match.group(2))])
+    return match.group(1) is not None, values
+
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+def matches_sql_in_condition(value, condition, lower=True, ascii_lower=True):
+    """
+    Tests value like the sql "TRIM(LOWER(value)) in (...)" would, NULL never matches.
+
+    TRIM only removes spaces. LOWER in SQLite only changes ASCII letters (use ascii_lower=True) while
+    LOWER in PostgreSQL changes all letters (use ascii_lower=False).
+
+    >>> matches_sql_in_condition(' Sand', (False, frozenset(['sand'])))
+    True
+    >>> matches_sql_in_condition(None, (True, frozenset(['sand'])))
+    False
+    >>> matches_sql_in_condition('sand\\t', (False, frozenset(['sand'])))
+    False
+    >>> matches_sql_in_condition('LERA', (False, frozenset(['lera'])), lower=False)
+    False
+    >>> matches_sql_in_condition('MORÄN', (False, frozenset(['moran', 'morÄn'])))
+    True
+    >>> matches_sql_in_condition('MORÄN', (False, frozenset(['morän'])), ascii_lower=False)
+    True
+    """
+    if value is None:
+        return False
+    negated, values = condition
+    value = str(value).strip(' ')
+    if lower:
+        value = value.translate(_ASCII_LOWER) if ascii_lower else value.lower()
+    return (value in values) != negated
+
+class WaterLevelCube(object):
+    """
+    Water levels as a date x obsid matrix, so that the levels for one date is a single row slice.
+    """
+    def __init__(self, df):
+        self.df = df
+        self.values = df.to_numpy(dtype=float)
+        self.columns = {obsid: colnr for colnr, obsid in enumerate(df.columns)}
+
 def resample(df, valuecol, rule, resample_kwargs):
     resample_kwargs = dict(resample_kwargs)
     how = resample_kwargs.get('how', 'mean')
@@ -477,6 +477,7 @@ def add_views_to_db(dbconnection, bedrock_types):
         cur.execute(sql)
     except:
         midvatten_utils.MessagebarAndLog.warning(log_msg=traceback.format_exc())
+    db_utils.invalidate_schema_cache(dbconnection)
 
     if view_name not in list(db_utils.tables_columns(dbconnection=dbconnection).keys()):
         raise NotFoundError(ru(QCoreApplication.translate('strat_symbology',
@@ -502,6 +503,7 @@ def add_views_to_db(dbconnection, bedrock_types):
                                  .format(**{'view_name': view_name}))
     except:
         midvatten_utils.MessagebarAndLog.warning(log_msg=traceback.format_exc())
+    db_utils.invalidate_schema_cache(dbconnection)
 
     view_found = False
     if view_name in list(db_utils.tables_columns(dbconnection=dbconnection).keys()):
@@ -569,6 +571,7 @@ CREATE VIEW {view_name} AS
         cur.execute(bergy)
     except:
         midvatten_utils.MessagebarAndLog.warning(log_msg=traceback.format_exc())
+    db_utils.invalidate_schema_cache(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         cur.execute('''INSERT OR IGNORE INTO views_geometry_columns SELECT '{}', 'geometry', 'rowid', 'obs_points', 'geometry', 1'''.format(view_name))
@@ -106,7 +106,8 @@ class Stratigraphy(object):
         self.w = w # save reference so it doesn't get deleted immediately        This has to be done both here and also in midvatten instance
 
 class SurveyInfo(object):   # This class is to define the data structure... 
-    
+    __slots__ = ('obsid', 'top_lvl', 'coord', 'length', 'strata')
+
     def __init__(self, obsid='', top_lvl=0, coord=None, strata=None, length=None):  #_CHANGE_ added obsid
         self.obsid = obsid # _CHANGE_
         self.top_lvl = top_lvl
@@ -119,6 +120,8 @@ class SurveyInfo(object):   # This class is to define the data structure...
         return "SURVEY('%s', %f, '%s')" % (str(self.obsid), self.top_lvl, self.coord) # _CHANGE_
 
 class StrataInfo(object):
+    __slots__ = ('stratid', 'geology', 'depthTop', 'depthBot', 'geo_short', 'comment', 'hydro', 'development')
+
     def __init__(self, stratid=0, depthTop=0, depthBot=0, geology='',  geo_short='', hydro='', Comment='', development=''):
         self.stratid = stratid  # This is id no for the geological information (1 = uppermost stratigraphy layer)
         self.geology = geology # This is full text description of stratigraphy (the geologic descripition, e.g. "sandy till")
@@ -222,22 +225,28 @@ class SurveyStore(object):
         return surveys
 
     def _getDataStep2(self, surveys):
-        """ STEP 2: get strata information for every point """
+        """ STEP 2: get strata information for every point
+
+        The strata for all points are loaded using one query.
+        """
         dbconnection = db_utils.DbConnectionManager()
+        sql = r"""SELECT obsid, stratid, depthtop, depthbot, geology, trim(lower(geoshort)), trim(capacity), comment, development FROM """
+        sql += self.stratitable #MacOSX fix1
+        sql += r""" WHERE obsid IN (%s) ORDER BY obsid, stratid""" % common_utils.sql_unicode_list(surveys.keys())
+        all_recs = {}
+        for row in dbconnection.execute_and_fetchall(sql):
+            all_recs.setdefault(row[0], []).append(row[1:])
+        dbconnection.closedb()
+
         for (obsid, survey) in surveys.items():
-            sql =r"""SELECT stratid, depthtop, depthbot, geology, trim(lower(geoshort)), trim(capacity), comment, development FROM """
-            sql += self.stratitable #MacOSX fix1
-            sql += r""" WHERE obsid = '"""
-            sql += str(obsid)   # THIS IS WHERE THE KEY IS GIVEN TO LOAD STRATIGRAPHY FOR CHOOSEN obsid
-            sql += """' ORDER BY stratid"""
-            recs = dbconnection.execute_and_fetchall(sql)
+            recs = all_recs.get(obsid, [])
             if not recs:
                 if survey.length is not None:
                     recs.append([1, 0.0, survey.length, '', '', '', '', ''])
             # parse attributes
             prev_depthbot = 0
             for record in recs:
-                if common_utils.isinteger(record[0]) and common_utils.isfloat(record[1]) and common_utils.isfloat(record[2]):
+                if is_number(record[0], integer=True) and is_number(record[1]) and is_number(record[2]):
                     stratigaphy_id = record[0]  # Stratigraphy layer no
                     depthtotop = record[1]  # depth to top of stratrigraphy layer
                     depthtobot = record[2]  # depth to bottom of stratrigraphy layer
@@ -276,8 +285,7 @@ class SurveyStore(object):
                 survey.strata.append(st)
                 prev_depthbot = depthtobot
 
-            DataLoadingStatus = True
-        dbconnection.closedb()
+        DataLoadingStatus = True
         return DataLoadingStatus, surveys
 
         
@@ -411,10 +419,13 @@ class SurveyWidget(QtWidgets.QFrame):
 
         painter = QtGui.QPainter(self)
 
-        self.drawSurveys(self.rect(), painter)
+        self.drawSurveys(self.rect(), painter, visible_rect=event.rect())
 
-    def drawSurveys(self, rect, painter):
-        """ draw surveys to specified rect with specified painter """
+    def drawSurveys(self, rect, painter, visible_rect=None):
+        """ draw surveys to specified rect with specified painter
+
+        If visible_rect is given, only the surveys inside it are drawn.
+        """
         surveys = len(self.sondaggio)
         surveyWidth = rect.width() / surveys
         surveyHeight = rect.height()
@@ -443,6 +454,8 @@ class SurveyWidget(QtWidgets.QFrame):
                              int(surveyWidth - 2*margin),
                              int(surveyHeight - 2*margin))
             x += surveyWidth
+            if visible_rect is not None and not r.intersects(visible_rect):
+                continue
             sond = self.sondaggio[survey.obsid]
             # draw the survey
             try:
@@ -662,6 +675,26 @@ class SurveyDialog(QtWidgets.QDialog):
             
 
 
+def is_number(value, integer=False):
+    """ Returns True if value is a number or a string that can be converted to a number
+
+    >>> is_number(1), is_number(1.5), is_number('1.5'), is_number('a'), is_number(None)
+    (True, True, True, False, False)
+    >>> is_number('1.5', integer=True), is_number('2', integer=True), is_number(2.0, integer=True)
+    (False, True, True)
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return True
+    try:
+        if integer:
+            int(value)
+        else:
+            float(value)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
 class DataSanityError(Exception):  # Instances of this class is created whenever some data sanity checks fails
     """ exception raised when data don't comply with some constraints """
     
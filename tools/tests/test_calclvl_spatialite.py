@@ -171,6 +171,44 @@ class TestCalclvl(utils_for_tests.MidvattenTestSpatialiteDbSv):
         print(test_string)
         assert test_string == reference_string
 
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    @mock.patch('midvatten.tools.wlevels_calc_calibr.common_utils.getselectedobjectnames')
+    def test_calc_selected_incremental(self, mock_selected_obsids, mock_messagebar):
+        mock_selected_obsids.return_value = ['rb1', 'rb2']
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid, h_toc) VALUES ('rb1', 2)''')
+        db_utils.sql_alter_db('''INSERT into w_levels (obsid, meas, date_time) VALUES ('rb1', 222, '2005-01-01 00:00:00')''')
+        db_utils.sql_alter_db('''INSERT into w_levels (obsid, meas, h_toc, level_masl, date_time) VALUES ('rb1', 100, 1, -99, '2005-01-02 00:00:00')''')
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid, h_toc) VALUES ('rb2', 4)''')
+        db_utils.sql_alter_db('''INSERT into w_levels (obsid, meas, h_toc, level_masl, date_time) VALUES ('rb2', 444, 4, -440, '2005-01-01 00:00:00')''')
+        db_utils.sql_alter_db('''INSERT into w_levels (obsid, meas, level_masl, date_time) VALUES ('rb2', 555, 667, '2005-01-02 00:00:00')''')
+        self.calclvl.FromDateTime = QtWidgets.QDateTimeEdit()
+        self.calclvl.FromDateTime.setDateTime(datestring_to_date('2000-01-01 00:00:00'))
+        self.calclvl.ToDateTime = QtWidgets.QDateTimeEdit()
+        self.calclvl.ToDateTime.setDateTime(datestring_to_date('2010-01-01 00:00:00'))
+        self.calclvl.checkBox_incremental.setChecked(True)
+        self.calclvl.calcselected()
+
+        test_string = utils_for_tests.create_test_string(
+            db_utils.sql_load_fr_db('SELECT obsid, date_time, meas, h_toc, level_masl FROM w_levels ORDER BY obsid, date_time'))
+        reference_string = '(True, [(rb1, 2005-01-01 00:00:00, 222.0, 2.0, -220.0), (rb1, 2005-01-02 00:00:00, 100.0, 2.0, -98.0), (rb2, 2005-01-01 00:00:00, 444.0, 4.0, -440.0), (rb2, 2005-01-02 00:00:00, 555.0, None, 667.0)])'
+        assert test_string == reference_string
+        assert self.calclvl.updated_level_masl == 2
+
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    def test_calc_incremental_skips_null_h_toc(self, mock_messagebar):
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid, h_toc) VALUES ('rb1', 2)''')
+        db_utils.sql_alter_db('''INSERT into w_levels (obsid, meas, date_time) VALUES ('rb1', 222, '2005-01-01 00:00:00')''')
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('rb3')''')
+        db_utils.sql_alter_db('''INSERT into w_levels (obsid, meas, date_time) VALUES ('rb3', 333, '2005-01-01 00:00:00')''')
+        self.calclvl.calc_incremental({'fr_dt': '2000-01-01 00:00:00', 'to_dt': '2010-01-01 00:00:00',
+                                       'obsids': "'rb1', 'rb3'"})
+
+        test_string = utils_for_tests.create_test_string(
+            db_utils.sql_load_fr_db('SELECT obsid, date_time, meas, h_toc, level_masl FROM w_levels ORDER BY obsid, date_time'))
+        reference_string = '(True, [(rb1, 2005-01-01 00:00:00, 222.0, 2.0, -220.0), (rb3, 2005-01-01 00:00:00, 333.0, None, None)])'
+        assert test_string == reference_string
+        assert self.calclvl.updated_level_masl == 1
+
     def tearDown(self):
         if hasattr(self.calclvl, 'updated_h_tocs') and hasattr(self.calclvl, 'updated_level_masl'):
             # Must be equal for all tests
@@ -66,4 +66,31 @@ class TestCalculateStatistics(utils_for_tests.MidvattenTestSpatialiteDbSv):
                         duration=15,
                         log_msg='Obsid;Min;Median;Average;Max;Nr of values\n1;1.0;3.0;3.0;5.0;3\n2;2.0;8.5;7.25;10.0;4')
         print(str(mock_messagebar.mock_calls))
-        assert ref in mock_messagebar.mock_calls
\ No newline at end of file
+        assert ref in mock_messagebar.mock_calls
+
+    def test_get_statistics_percentiles_and_null(self):
+        db_utils.sql_alter_db("""INSERT INTO obs_points(obsid) VALUES('1')""")
+        db_utils.sql_alter_db("""INSERT INTO obs_points(obsid) VALUES('2')""")
+        db_utils.sql_alter_db("""INSERT INTO w_levels(obsid, date_time, meas) VALUES('1', '2017-01-01', 1.0)""")
+        db_utils.sql_alter_db("""INSERT INTO w_levels(obsid, date_time, meas) VALUES('1', '2017-01-02', 3.0)""")
+        db_utils.sql_alter_db("""INSERT INTO w_levels(obsid, date_time, meas) VALUES('1', '2017-01-03', NULL)""")
+        db_utils.sql_alter_db("""INSERT INTO w_levels(obsid, date_time, meas) VALUES('2', '2017-01-04', NULL)""")
+
+        stats = calculate_statistics.get_statistics(['1', '2'], 'w_levels', 'meas', percentiles=[25])
+        test_string = utils_for_tests.create_test_string(stats)
+        reference = '{1: [1.0, 3.0, 2.0, 2, 2.0, 1.5], 2: [None, None, None, 0, None, None]}'
+        assert test_string == reference
+
+    def test_get_statistics_for_obsids(self):
+        db_utils.sql_alter_db("""INSERT INTO obs_points(obsid) VALUES('1')""")
+        db_utils.sql_alter_db("""INSERT INTO obs_points(obsid) VALUES('2')""")
+        db_utils.sql_alter_db("""INSERT INTO obs_points(obsid) VALUES('3')""")
+        db_utils.sql_alter_db("""INSERT INTO w_levels(obsid, date_time, meas, level_masl) VALUES('1', '2017-01-01', 1.0, 10.0)""")
+        db_utils.sql_alter_db("""INSERT INTO w_levels(obsid, date_time, meas, level_masl) VALUES('1', '2017-01-02', 3.0, 8.0)""")
+        db_utils.sql_alter_db("""INSERT INTO w_levels(obsid, date_time, level_masl) VALUES('2', '2017-01-01', 5.0)""")
+
+        stats = calculate_statistics.get_statistics_for_obsids(['1', '2', '3'])
+        test_string = utils_for_tests.create_test_string(stats)
+        reference = '{1: (meas, [1.0, 2.0, 2, 3.0]), 2: (level_masl, [5.0, 5.0, 1, 5.0]), 3: (meas, [None, 0, 0, None])}'
+        assert test_string == reference
+        assert calculate_statistics.get_statistics_for_single_obsid('2') == stats['2']
@@ -264,5 +264,31 @@ class TestCustomPlot(utils_for_tests.MidvattenTestSpatialiteDbSv):
                          ('6', '2026-01-02 09:00:00', '', '4.0'),
                          ('7', '2026-01-02 14:00:00', '', '10.0'))
 
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    def test_get_data_several_obsids_one_query(self, mock_messagebar):
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('o1')''')
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('o2')''')
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('o3')''')
+        db_utils.sql_alter_db(
+            '''INSERT INTO w_levels_logger (obsid, date_time, level_masl) VALUES ('o2', '2026-01-01 10:31', 10.0)''')
+        db_utils.sql_alter_db(
+            '''INSERT INTO w_levels_logger (obsid, date_time, level_masl) VALUES ('o1', '2026-01-01 00:30', 5.0)''')
+        db_utils.sql_alter_db(
+            '''INSERT INTO w_levels_logger (obsid, date_time, level_masl) VALUES ('o2', '2026-01-01 00:30', 6.0)''')
+        db_utils.sql_alter_db(
+            '''INSERT INTO w_levels_logger (obsid, date_time, level_masl) VALUES ('o3', '2026-01-01 00:30', 7.0)''')
 
+        self.midvatten.plot_sqlite()
+        customplot = self.midvatten.customplot
+        gui_utils.set_combobox(customplot.table_ComboBox_1, 'w_levels_logger')
+        gui_utils.set_combobox(customplot.xcol_ComboBox_1, 'date_time')
+        gui_utils.set_combobox(customplot.ycol_ComboBox_1, 'level_masl')
+        gui_utils.set_combobox(customplot.Filter1_ComboBox_1, 'obsid')
+        customplot.Filter1_QListWidget_1.item(1).setSelected(True)
+        customplot.Filter1_QListWidget_1.item(0).setSelected(True)
 
+        data = customplot.drawPlot_all(only_get_data=True)
+        result = [(label, list(table.date_time), list(table.values)) for table, label in data]
+        print(str(result))
+        assert result == [('o1', ['2026-01-01 00:30'], [5.0]),
+                          ('o2', ['2026-01-01 00:30', '2026-01-01 10:31'], [6.0, 10.0])]
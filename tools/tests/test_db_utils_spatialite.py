@@ -23,9 +23,10 @@ from __future__ import absolute_import
 
 from builtins import object
 
+import mock
 from nose.plugins.attrib import attr
 
-from midvatten.tools.utils import db_utils
+from midvatten.tools.utils import db_utils, midvatten_utils
 from midvatten.tools.tests import utils_for_tests
 
 
@@ -150,3 +151,126 @@ class TestGetTimezoneFromDb(utils_for_tests.MidvattenTestSpatialiteDbSv):
                     WHERE tablename = 'w_levels' and columnname = 'date_time';""")
         tz = db_utils.get_timezone_from_db('w_levels')
         assert tz == 'Europe/Stockholm'
+
+
+@attr(status='on')
+class TestReuseDbconnection(utils_for_tests.MidvattenTestSpatialiteDbSv):
+    def test_reuse_dbconnection_opens_one_connection(self):
+        db_utils.sql_alter_db("""INSERT INTO obs_points (obsid) VALUES ('P1')""")
+        nr_of_opened_before = db_utils.DbConnectionManager.nr_of_opened_connections
+        with db_utils.reuse_dbconnection() as dbconnection:
+            db_utils.sql_alter_db("""INSERT INTO w_levels (obsid, date_time, meas) VALUES ('P1', '2020-01-01 00:00', 1.0)""")
+            obsids = db_utils.get_all_obsids()
+            median = db_utils.calculate_median_value('w_levels', 'meas', 'P1')
+            with db_utils.reuse_dbconnection() as nested_dbconnection:
+                assert nested_dbconnection is dbconnection
+                tables = db_utils.get_tables()
+        assert db_utils.DbConnectionManager.nr_of_opened_connections - nr_of_opened_before == 1
+        assert obsids == ['P1']
+        assert median == 1.0
+        assert 'w_levels' in tables
+
+        db_utils.sql_load_fr_db("""SELECT obsid FROM obs_points""")
+        assert db_utils.DbConnectionManager.nr_of_opened_connections - nr_of_opened_before == 2
+
+
+@attr(status='on')
+class TestSchemaCache(utils_for_tests.MidvattenTestSpatialiteDbSv):
+    def test_schema_cache_invalidated_by_ddl(self):
+        assert 'newcol' not in db_utils.tables_columns('obs_points')['obs_points']
+        db_utils.sql_alter_db("""ALTER TABLE obs_points ADD COLUMN newcol TEXT""")
+        assert 'newcol' in db_utils.tables_columns('obs_points')['obs_points']
+
+    def test_schema_cache_explicit_invalidation(self):
+        dbconnection = db_utils.DbConnectionManager()
+        assert 'newtable' not in db_utils.get_tables(dbconnection=dbconnection)
+        dbconnection.cursor.execute("""CREATE TABLE newtable (obsid TEXT)""")
+        assert 'newtable' not in db_utils.get_tables(dbconnection=dbconnection)
+        db_utils.invalidate_schema_cache(dbconnection)
+        assert 'newtable' in db_utils.get_tables(dbconnection=dbconnection)
+        dbconnection.closedb()
+
+
+@attr(status='on')
+class TestDbPropertiesCache(utils_for_tests.MidvattenTestSpatialiteDbSv):
+    def test_timezone_cache_invalidated_by_about_db_write(self):
+        db_utils.sql_alter_db("""UPDATE about_db SET description = 'Date and time (UTC+1)' WHERE tablename = 'w_levels_logger' AND columnname = 'date_time'""")
+        assert db_utils.get_timezone_from_db('w_levels_logger') == 'UTC+1'
+        db_utils.sql_alter_db("""UPDATE about_db SET description = 'Date and time (UTC+5)' WHERE tablename = 'w_levels_logger' AND columnname = 'date_time'""")
+        assert db_utils.get_timezone_from_db('w_levels_logger') == 'UTC+5'
+
+    def test_locale_cached_without_connection(self):
+        midvatten_utils.getcurrentlocale()
+        nr_of_opened_before = db_utils.DbConnectionManager.nr_of_opened_connections
+        for i in range(3):
+            midvatten_utils.getcurrentlocale()
+        assert db_utils.DbConnectionManager.nr_of_opened_connections == nr_of_opened_before
+
+    def test_locale_cache_ignores_print_error_message_in_bar(self):
+        midvatten_utils.get_locale_from_db(print_error_message_in_bar=True)
+        nr_of_opened_before = db_utils.DbConnectionManager.nr_of_opened_connections
+        midvatten_utils.get_locale_from_db(print_error_message_in_bar=False)
+        assert db_utils.DbConnectionManager.nr_of_opened_connections == nr_of_opened_before
+
+    def test_locale_failed_read_not_cached(self):
+        db_utils.invalidate_db_properties_cache()
+        with mock.patch('midvatten.tools.utils.db_utils.sql_load_fr_db') as mock_sql_load_fr_db:
+            mock_sql_load_fr_db.return_value = (False, [])
+            assert midvatten_utils.get_locale_from_db() is None
+        assert midvatten_utils.get_locale_from_db() == 'sv_SE'
+
+    def test_writes_db_properties_with_schema_invalidates_cache(self):
+        db_utils.sql_alter_db("""UPDATE about_db SET description = 'Date and time (UTC+1)' WHERE tablename = 'w_levels_logger' AND columnname = 'date_time'""")
+        assert db_utils.get_timezone_from_db('w_levels_logger') == 'UTC+1'
+        db_utils.sql_alter_db("""UPDATE main.about_db SET description = 'Date and time (UTC+5)' WHERE tablename = 'w_levels_logger' AND columnname = 'date_time'""")
+        assert db_utils.get_timezone_from_db('w_levels_logger') == 'UTC+5'
+
+
+@attr(status='on')
+class TestTableChangeToken(utils_for_tests.MidvattenTestSpatialiteDbSv):
+    def test_table_change_token(self):
+        db_utils.sql_alter_db("""INSERT INTO obs_points (obsid) VALUES ('P1')""")
+        db_utils.sql_alter_db("""INSERT INTO obs_points (obsid) VALUES ('P2')""")
+        db_utils.sql_alter_db("""INSERT INTO w_levels (obsid, date_time, level_masl) VALUES ('P1', '2020-01-01 00:00', 1.0)""")
+        token = db_utils.table_change_token('w_levels', ['P1'], value_column='level_masl')
+        assert token == (1, '2020-01-01 00:00', '2020-01-01 00:00', 1577836800, 1.0)
+
+        db_utils.sql_alter_db("""INSERT INTO w_levels (obsid, date_time, level_masl) VALUES ('P2', '2020-01-02 00:00', 2.0)""")
+        assert db_utils.table_change_token('w_levels', ['P1'], value_column='level_masl') == token
+
+        db_utils.sql_alter_db("""UPDATE w_levels SET level_masl = 3.0 WHERE obsid = 'P1'""")
+        assert db_utils.table_change_token('w_levels', ['P1'], value_column='level_masl') != token
+
+    def test_table_change_token_date_changed_within_range(self):
+        db_utils.sql_alter_db("""INSERT INTO obs_points (obsid) VALUES ('P1')""")
+        for date_time in ['2020-01-01 00:00', '2020-01-02 00:00', '2020-01-03 00:00']:
+            db_utils.sql_alter_db("""INSERT INTO w_levels (obsid, date_time, level_masl) VALUES ('P1', '{}', 1.0)""".format(date_time))
+        token = db_utils.table_change_token('w_levels', ['P1'], value_column=['level_masl'])
+        db_utils.sql_alter_db("""UPDATE w_levels SET date_time = '2020-01-02 12:00' WHERE date_time = '2020-01-02 00:00'""")
+        assert db_utils.table_change_token('w_levels', ['P1'], value_column=['level_masl']) != token
+
+    def test_table_change_token_text_column_changed(self):
+        db_utils.sql_alter_db("""INSERT INTO obs_points (obsid) VALUES ('P1')""")
+        for date_time, source in [('2020-01-01 00:00', 'a'), ('2020-01-02 00:00', 'b'), ('2020-01-03 00:00', 'c')]:
+            db_utils.sql_alter_db("""INSERT INTO w_levels_logger (obsid, date_time, head_cm, source) VALUES ('P1', '{}', 1.0, '{}')""".format(date_time, source))
+        token = db_utils.table_change_token('w_levels_logger', ['P1'], value_column=['head_cm'], text_columns=['source'])
+        assert token[-3:] == (3, 'a', 'c')
+        db_utils.sql_alter_db("""UPDATE w_levels_logger SET source = 'bb' WHERE source = 'b'""")
+        assert db_utils.table_change_token('w_levels_logger', ['P1'], value_column=['head_cm'], text_columns=['source']) != token
+
+
+@attr(status='on')
+class TestExecuteAndFetchmany(utils_for_tests.MidvattenTestSpatialiteDbSv):
+    def test_execute_and_fetchmany(self):
+        for obsid in ['P1', 'P2', 'P3']:
+            db_utils.sql_alter_db("""INSERT INTO obs_points (obsid) VALUES ('{}')""".format(obsid))
+        dbconnection = db_utils.DbConnectionManager()
+        columns, rows = dbconnection.execute_and_fetchmany("""SELECT obsid, h_toc FROM obs_points ORDER BY obsid""", batchsize=2)
+        first_row = next(rows)
+        # The default cursor is still usable while the rows are read.
+        nr_of_rows = dbconnection.execute_and_fetchall("""SELECT count(*) FROM obs_points""")[0][0]
+        result = [first_row] + list(rows)
+        dbconnection.closedb()
+        assert columns == ['obsid', 'h_toc']
+        assert [tuple(row) for row in result] == [('P1', None), ('P2', None), ('P3', None)]
+        assert nr_of_rows == 3
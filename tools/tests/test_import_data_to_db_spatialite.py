@@ -58,6 +58,27 @@ class TestGeneralImport(utils_for_tests.MidvattenTestSpatialiteDbSvImportInstanc
         print(test_string)
         assert test_string == reference_string
 
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    @mock.patch('midvatten.tools.import_data_to_db.common_utils.Askuser', mock.MagicMock())
+    def test_general_import_wlvllogg_from_generator_in_chunks(self, mock_messagebar):
+        def rows():
+            yield ('obsid', 'date_time', 'head_cm')
+            yield ('rb1', '2016-03-15 10:30:00', '1')
+            yield ('rb1', '2016-03-15 10:31:00', '2')
+            yield ('rb1', '2016-03-15 10:32:00', '3')
+            yield ('rb1', '2016-03-15 10:30:00', '4')
+            yield ('rb1', '2016-03-15 10:33:00', '')
+
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('rb1')''')
+
+        self.importinstance.general_import(dest_table='w_levels_logger', file_data=rows(), chunksize=2)
+
+        test_string = utils_for_tests.create_test_string(
+            db_utils.sql_load_fr_db('''select obsid, date_time, head_cm from w_levels_logger ORDER BY date_time'''))
+        reference_string = r'''(True, [(rb1, 2016-03-15 10:30:00, 1.0), (rb1, 2016-03-15 10:31:00, 2.0), (rb1, 2016-03-15 10:32:00, 3.0), (rb1, 2016-03-15 10:33:00, None)])'''
+        print(test_string)
+        assert test_string == reference_string
+
     @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
     @mock.patch('midvatten.tools.import_data_to_db.common_utils.Askuser', mock.MagicMock())
     @mock.patch('qgis.utils.iface', autospec=True)
@@ -836,3 +857,21 @@ class TestDeleteExistingDateTimesFromTemptable(utils_for_tests.MidvattenTestSpat
         assert test_string == reference_string
 
 
+
+    @mock.patch('midvatten.tools.import_data_to_db.common_utils.Askuser', mock.MagicMock())
+    def test_delete_existing_date_times_from_temptable_other_obsid_not_blocked(self):
+        db_utils.sql_alter_db("""INSERT INTO obs_points (obsid) VALUES ('obsid1')""")
+        db_utils.sql_alter_db("""INSERT INTO obs_points (obsid) VALUES ('obsid2')""")
+        db_utils.sql_alter_db("""INSERT INTO w_levels (obsid, date_time, level_masl) VALUES ('obsid1', '2016-01-01 00:00', '123.0')""")
+
+        f = [['obsid', 'date_time', 'level_masl'],
+             ['obsid1', '2016-01-01 00:00:00', '345'],
+             ['obsid2', '2016-01-01 00:00:00', '456'],
+             ['obsid2', '2016-01-01 00:00', '789']]
+
+        self.importinstance.general_import(dest_table='w_levels', file_data=f)
+
+        test_string = utils_for_tests.create_test_string(
+            db_utils.sql_load_fr_db('''select * from w_levels ORDER BY obsid, date_time'''))
+        reference_string = r'''(True, [(obsid1, 2016-01-01 00:00, None, None, 123.0, None), (obsid2, 2016-01-01 00:00, None, None, 789.0, None), (obsid2, 2016-01-01 00:00:00, None, None, 456.0, None)])'''
+        assert test_string == reference_string
@@ -32,7 +32,7 @@ from nose.plugins.attrib import attr
 from midvatten.tools.utils import common_utils
 from midvatten.tools.tests import utils_for_tests
 from midvatten.tools.tests.mocks_for_tests import MockReturnUsingDictIn
-from midvatten.tools.import_diveroffice import DiverofficeImport
+from midvatten.tools.import_diveroffice import DiverofficeImport, DiverofficeDataError
 
 
 #
@@ -258,6 +258,57 @@ class TestParseDiverofficeFile(object):
         assert os.path.basename(path) == file_data[1]
         assert file_data[2] == 'rb1'
 
+    @mock.patch("midvatten.tools.import_diveroffice.common_utils.MessagebarAndLog")
+    def test_parse_diveroffice_mon_file_without_end_of_data(self, mock_messagebarandlog):
+        f = ('[Logger settings]',
+                  'Location=rb1',
+                  'Instrument number=UTC+1',
+                  '[Channel 1]',
+                  'Identification          =LEVEL',
+                  '[Channel 2]',
+                  'Identification          =TEMPERATURE',
+                  '[Data]',
+                  '2',
+                  '2016/03/15 10:30:00;1,2;10',
+                  '2016/03/15 11:00:00;2;101')
+
+        charset_of_diverofficefile = 'utf-8'
+        with common_utils.tempinput('\n'.join(f), charset_of_diverofficefile, suffix='.mon') as path:
+                file_data = DiverofficeImport.parse_diveroffice_file(path, charset_of_diverofficefile)
+
+        test_string = utils_for_tests.create_test_string(file_data[0])
+        reference_string = '[[date_time, head_cm, temp_degc, cond_mscm], [2016-03-15 10:30:00, 1.2, 10, None], [2016-03-15 11:00:00, 2.0, 101, None]]'
+
+        print(f"Ref: {reference_string}\ntest: {test_string}")
+        assert test_string == reference_string
+        assert file_data[2] == 'rb1'
+        assert file_data[3] == 'UTC+1'
+
+    @mock.patch("midvatten.tools.import_diveroffice.common_utils.MessagebarAndLog")
+    def test_parse_diveroffice_mon_file_invalid_date(self, mock_messagebarandlog):
+        f = ('[Logger settings]',
+                  'Location=rb1',
+                  'Instrument number=UTC+1',
+                  '[Channel 1]',
+                  'Identification          =LEVEL',
+                  '[Data]',
+                  '3',
+                  '2016/03/15 10:30:00;1,2',
+                  'not a date;2',
+                  '2016/03/15 11:30:00;3',
+                  'END OF DATA FILE OF DATALOGGER FOR WINDOWS')
+
+        charset_of_diverofficefile = 'utf-8'
+        with common_utils.tempinput('\n'.join(f), charset_of_diverofficefile, suffix='.mon') as path:
+            try:
+                DiverofficeImport.parse_diveroffice_file(path, charset_of_diverofficefile)
+            except DiverofficeDataError as e:
+                invalid_dates = e.invalid_dates
+            else:
+                invalid_dates = None
+
+        assert invalid_dates == ['not a date']
+
 
 
 @attr(status='on')
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ This part of the Midvatten plugin tests the sampling of rasters along the
+ section line.
+
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by joskal (HenrikSpa)
+        email                : groundwatergis [at] gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import numpy as np
+from nose.plugins.attrib import attr
+from osgeo import gdal
+from qgis.core import QgsRasterLayer, QgsPointXY, QgsField, QgsGeometry
+from qgis.PyQt.QtCore import QVariant
+
+from midvatten.tools.tests import utils_for_tests
+from midvatten.tools.utils import sampledem
+from midvatten.tools.utils.sampledem import sample_raster_points, sample_raster_point, chainage
+
+
+def create_raster_layer(name, data, datatype=gdal.GDT_Float32, nodata=None):
+    """
+    Creates a raster layer from an in-memory GeoTIFF.
+
+    :param data: A numpy array with the shape (bands, rows, cols). The pixels are 10 x 10 with the upper left corner
+                 at (0, 10 * rows).
+    """
+    path = '/vsimem/{}.tif'.format(name)
+    bands, rows, cols = data.shape
+    dataset = gdal.GetDriverByName('GTiff').Create(path, cols, rows, bands, datatype)
+    dataset.SetGeoTransform((0.0, 10.0, 0.0, 10.0 * rows, 0.0, -10.0))
+    for bandnr in range(bands):
+        band = dataset.GetRasterBand(bandnr + 1)
+        if nodata is not None:
+            band.SetNoDataValue(nodata)
+        band.WriteArray(data[bandnr])
+    dataset.FlushCache()
+    dataset = None
+    return QgsRasterLayer(path, name, 'gdal')
+
+
+@attr(status='on')
+class TestSampleRasterPoints(object):
+    def setUp(self):
+        self.points = np.array([[5.0, 25.0], [15.0, 25.0], [35.0, 5.0], [11.3, 12.7], [39.9, 0.1], [0.1, 29.9],
+                                [25.0, 15.0], [-5.0, 15.0], [15.0, 35.0], [45.0, 5.0]])
+
+    def test_sample_raster_points_like_identify(self):
+        data = np.arange(12, dtype=np.float32).reshape(1, 3, 4)
+        data[0, 1, 2] = -9999.0
+        layer = create_raster_layer('sample_float', data, nodata=-9999.0)
+        assert layer.isValid()
+
+        test = sample_raster_points(self.points, layer)
+        reference = [sample_raster_point(layer.dataProvider(), QgsPointXY(x, y)) for x, y in self.points]
+        print("Ref:\n" + str(reference))
+        print("Test:\n" + str(test))
+        assert test == reference
+        assert test == [0.0, 1.0, 11.0, 5.0, 11.0, 0.0, None, None, None, None]
+
+    def test_sample_raster_points_bands(self):
+        data = np.stack([np.arange(12, dtype=np.uint8).reshape(3, 4) + offset for offset in (0, 100, 200)])
+        layer = create_raster_layer('sample_rgb', data, datatype=gdal.GDT_Byte)
+        assert layer.isValid()
+
+        test = sample_raster_points(self.points, layer, bands=(1, 2, 3))
+        reference = [sample_raster_point(layer.dataProvider(), QgsPointXY(x, y), bands=(1, 2, 3))
+                     for x, y in self.points]
+        print("Ref:\n" + str(reference))
+        print("Test:\n" + str(test))
+        assert test == reference
+        assert test[2] == [11.0, 111.0, 211.0]
+
+    def test_sample_raster_points_no_points(self):
+        layer = create_raster_layer('sample_empty', np.zeros((1, 3, 4), dtype=np.float32))
+        assert sample_raster_points(np.empty((0, 2)), layer) == []
+
+
+@attr(status='on')
+class TestChainage(object):
+    def setUp(self):
+        sampledem._chainage_cache.clear()
+
+    def test_chainage_cached(self):
+        layer = utils_for_tests.create_vectorlayer([QgsField('name', QVariant.String)], [['line']],
+                                                   [QgsGeometry.fromWkt('LINESTRING(0 0, 6 0, 6 8)')],
+                                                   geomtype='LineString', crs=3006, select_ids=True)
+        xarray, points = chainage(layer, 2.5)
+        assert xarray == [0.0, 2.5, 5.0, 7.5, 10.0, 12.5]
+        geom = QgsGeometry.fromWkt('LINESTRING(0 0, 6 0, 6 8)')
+        reference = [[geom.interpolate(dist).asPoint().x(), geom.interpolate(dist).asPoint().y()] for dist in xarray]
+        assert np.allclose(points, reference)
+        assert len(sampledem._chainage_cache) == 1
+
+        xarray.append(15.0)
+        xarray2, points2 = chainage(layer, 2.5)
+        assert xarray2 == [0.0, 2.5, 5.0, 7.5, 10.0, 12.5]
+        assert points2 is points
+        assert len(sampledem._chainage_cache) == 1
+
+        chainage(layer, 5)
+        assert len(sampledem._chainage_cache) == 2
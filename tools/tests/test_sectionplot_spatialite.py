@@ -23,6 +23,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import re
+import types
 from builtins import str
 
 import mock
@@ -33,6 +34,7 @@ from qgis.core import QgsProject, QgsVectorLayer
 from midvatten.tools.utils import db_utils, gui_utils
 from midvatten.tools.tests import utils_for_tests
 from midvatten.tools.utils.midvatten_utils import anything_to_string_representation
+from midvatten.tools.sectionplot import SectionPlot
 
 
 @attr(status='on')
@@ -307,6 +309,7 @@ class TestSectionPlot(utils_for_tests.MidvattenTestSpatialiteDbSv):
         test_string = utils_for_tests.create_test_string(myplot.obsids_x_position)
         assert test_string == "{P1: 1.0, P2: 3.0, P3: 5.0}"
         assert mock.call.info(log_msg='Hidden features, obsids and length along section:\nP1;P2;P3\\1.0;3.0;5.0') in mock_messagebar.mock_calls
+        assert utils_for_tests.create_test_string(myplot.get_length_along(('P1', 'P2', 'P3'), in_db=True)) == test_string
         assert not mock_messagebar.warning.called
         assert not mock_messagebar.critical.called
 
@@ -547,3 +550,61 @@ class TestSectionPlot(utils_for_tests.MidvattenTestSpatialiteDbSv):
                     assert m
                 else:
                     assert not m
+
+
+@attr(status='on')
+class TestGetPlotDataBars(utils_for_tests.MidvattenTestSpatialiteDbSv):
+    def get_bars_using_sql(self, plot, typ_subtypes, strat_key):
+        """ The bars as they were calculated using one query per type and obsid """
+        bars = {}
+        for typ, subtypes in typ_subtypes.items():
+            for obs, x in plot.obsids_x_position.items():
+                sql = """SELECT depthtop, depthbot FROM stratigraphy WHERE obsid = '{}' AND {} {}
+                         ORDER BY stratid""".format(obs, strat_key, subtypes)
+                for row in db_utils.sql_load_fr_db(sql, plot.dbconnection)[1]:
+                    bars.setdefault(typ, {}).setdefault('x', []).append(x)
+                    bars.setdefault(typ, {}).setdefault('height', []).append(float(row[1]) - float(row[0]))
+                    bars.setdefault(typ, {}).setdefault('bottom', []).append(plot.z_data[obs]['z'] - float(row[1]))
+        return bars
+
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    def test_get_plot_data_bars_conditions(self, mock_messagebar):
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('P1')''')
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('P2')''')
+        for obsid, stratid, depthtop, depthbot, geoshort, capacity in [('P1', 1, 0, 1, "' Sand '", "'3 '"),
+                                                                        ('P1', 2, 1, 2, "'sand' || char(9)", "'4'"),
+                                                                        ('P1', 3, 2, 3, "'LERA'", "'4+'"),
+                                                                        ('P1', 4, 3, 4, "'MORÄN'", 'NULL'),
+                                                                        ('P2', 1, 0, 2, "'morän'", "'5'"),
+                                                                        ('P2', 2, 2, 5, "'grus'", "'3'"),
+                                                                        ('P2', 3, 5, 6, 'NULL', "'2'")]:
+            db_utils.sql_alter_db('''INSERT INTO stratigraphy (obsid, stratid, depthtop, depthbot, geoshort, capacity) VALUES ('{}', {}, {}, {}, {}, {})'''.format(obsid, stratid, depthtop, depthbot, geoshort, capacity))
+
+        plot = types.SimpleNamespace()
+        plot.dbconnection = db_utils.DbConnectionManager()
+        plot.obsids_x_position = {'P1': 1.0, 'P2': 2.0}
+        plot.z_data = {'P1': {'z': 10.0}, 'P2': {'z': 20.0}}
+        plot.obsid_annotation = {}
+        plot.strata = SectionPlot.get_stratigraphy_data(plot)
+        plot.get_stratigraphy_data_using_condition = types.MethodType(SectionPlot.get_stratigraphy_data_using_condition, plot)
+
+        geo_subtypes = {'sand': "in ('sand')",
+                        'lera': "IN ('lera', 'lerig')",
+                        'morän': "in ('morän', 'moran')",
+                        'other': "not in ('sand', 'lera')",
+                        'like': "like '%rus'"}
+        bars = SectionPlot.get_plot_data_bars(plot, geo_subtypes, strat_column='geoshort', lower=True)
+        reference = self.get_bars_using_sql(plot, geo_subtypes, 'TRIM(LOWER(geoshort))')
+        print("Ref:\n" + str(reference))
+        print("Test:\n" + str(bars))
+        assert bars == reference
+        assert bars['sand']['height'] == [1.0]
+        assert bars['morän']['bottom'] == [18.0]
+
+        hydro_subtypes = {'3': "in ('3')", '4': "in ('4', '4+')", 'not 4': "not in ('4', '4+')"}
+        bars = SectionPlot.get_plot_data_bars(plot, hydro_subtypes, strat_column='capacity', lower=False)
+        reference = self.get_bars_using_sql(plot, hydro_subtypes, 'TRIM(capacity)')
+        print("Ref:\n" + str(reference))
+        print("Test:\n" + str(bars))
+        assert bars == reference
+        plot.dbconnection.closedb()
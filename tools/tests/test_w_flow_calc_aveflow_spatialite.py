@@ -47,7 +47,7 @@ class TestWFlowCalcAveflow(utils_for_tests.MidvattenTestSpatialiteDbSv):
         widget = QtWidgets.QWidget()
         calcave = w_flow_calc_aveflow.Calcave(widget)
         calcave.FromDateTime.setDateTime(date_utils.datestring_to_date('2000-01-01 00:00:00'))
-        calcave.calcall(use_pandas=False)
+        calcave.calcall(use_pandas=False, in_db=False)
         print(str(mock_messagebar.mock_calls))
         #insert or ignore into w_flow(obsid,instrumentid,flowtype,date_time,reading,unit) values('%s','%s','Aveflow','%s','%s','l/s')
         res = db_utils.sql_load_fr_db('''SELECT obsid, instrumentid, flowtype, date_time, ROUND(reading, 4), unit FROM w_flow ORDER BY obsid, flowtype, date_time''')[1]
@@ -79,7 +79,7 @@ class TestWFlowCalcAveflow(utils_for_tests.MidvattenTestSpatialiteDbSv):
         widget = QtWidgets.QWidget()
         calcave = w_flow_calc_aveflow.Calcave(widget)
         calcave.FromDateTime.setDateTime(date_utils.datestring_to_date('2000-01-01 00:00:00'))
-        calcave.calcselected(use_pandas=False)
+        calcave.calcselected(use_pandas=False, in_db=False)
         print(str(mock_messagebar.mock_calls))
         #insert or ignore into w_flow(obsid,instrumentid,flowtype,date_time,reading,unit) values('%s','%s','Aveflow','%s','%s','l/s')
         res = db_utils.sql_load_fr_db('''SELECT obsid, instrumentid, flowtype, date_time, ROUND(reading, 4), unit FROM w_flow ORDER BY obsid, flowtype, date_time''')[1]
@@ -118,7 +118,7 @@ class TestWFlowCalcAveflow(utils_for_tests.MidvattenTestSpatialiteDbSv):
         widget = QtWidgets.QWidget()
         calcave = w_flow_calc_aveflow.Calcave(widget)
         calcave.FromDateTime.setDateTime(date_utils.datestring_to_date('2000-01-01 00:00:00'))
-        calcave.calcselected(use_pandas=True)
+        calcave.calcselected(use_pandas=True, in_db=False)
         print(str(mock_messagebar.mock_calls))
         #insert or ignore into w_flow(obsid,instrumentid,flowtype,date_time,reading,unit) values('%s','%s','Aveflow','%s','%s','l/s')
         res = db_utils.sql_load_fr_db('''SELECT obsid, instrumentid, flowtype, date_time, ROUND(reading, 4), unit FROM w_flow ORDER BY obsid, flowtype, date_time''')[1]
@@ -151,7 +151,7 @@ class TestWFlowCalcAveflow(utils_for_tests.MidvattenTestSpatialiteDbSv):
         widget = QtWidgets.QWidget()
         calcave = w_flow_calc_aveflow.Calcave(widget)
         calcave.FromDateTime.setDateTime(date_utils.datestring_to_date('2000-01-01 00:00:00'))
-        calcave.calcselected(use_pandas=True)
+        calcave.calcselected(use_pandas=True, in_db=False)
         print(str(mock_messagebar.mock_calls))
         #insert or ignore into w_flow(obsid,instrumentid,flowtype,date_time,reading,unit) values('%s','%s','Aveflow','%s','%s','l/s')
         res = db_utils.sql_load_fr_db('''SELECT obsid, instrumentid, flowtype, date_time, ROUND(reading, 4), unit FROM w_flow ORDER BY obsid, flowtype, date_time''')[1]
@@ -164,4 +164,43 @@ class TestWFlowCalcAveflow(utils_for_tests.MidvattenTestSpatialiteDbSv):
         print("Test:\n" + str(test))
         #result_list = self.calcave.observations
         #reference_list = ['1', '2']
-        assert test == reference
\ No newline at end of file
+        assert test == reference
+
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    def test_calcall_in_db(self, mock_messagebar):
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('1')''')
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('2')''')
+        db_utils.sql_alter_db('''INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit, comment) VALUES ('1', 'inst1', 'Accvol', '2019-02-02 00:00', 2.0, 'm3', 'comment1')''')
+        db_utils.sql_alter_db('''INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit) VALUES ('1', 'inst1', 'Accvol', '2019-02-01 00:00', 1.0, 'm3')''')
+        db_utils.sql_alter_db('''INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit) VALUES ('2', 'inst2', 'Accvol', '2019-02-04 00:00', 10.0, 'm3')''')
+        db_utils.sql_alter_db('''INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit) VALUES ('2', 'inst2', 'Accvol', '2019-02-03 00:00', 5.0, 'm3')''')
+
+        widget = QtWidgets.QWidget()
+        calcave = w_flow_calc_aveflow.Calcave(widget)
+        calcave.FromDateTime.setDateTime(date_utils.datestring_to_date('2000-01-01 00:00:00'))
+        calcave.calcall()
+        res = db_utils.sql_load_fr_db('''SELECT obsid, instrumentid, flowtype, date_time, ROUND(reading, 4), unit FROM w_flow ORDER BY obsid, flowtype, date_time''')[1]
+        test = common_utils.anything_to_string_representation(res)
+        reference = '[("1", "inst1", "Accvol", "2019-02-01 00:00", 1.0, "m3", ), ("1", "inst1", "Accvol", "2019-02-02 00:00", 2.0, "m3", ), ("1", "inst1", "Aveflow", "2019-02-02 00:00", 0.0116, "l/s", ), ("2", "inst2", "Accvol", "2019-02-03 00:00", 5.0, "m3", ), ("2", "inst2", "Accvol", "2019-02-04 00:00", 10.0, "m3", ), ("2", "inst2", "Aveflow", "2019-02-04 00:00", 0.0579, "l/s", )]'
+        assert test == reference
+        comments = db_utils.sql_load_fr_db('''SELECT obsid, comment FROM w_flow WHERE flowtype = 'Aveflow' ORDER BY obsid''')[1]
+        assert comments == [('1', 'comment1'), ('2', None)]
+
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    def test_calcall_in_db_incremental(self, mock_messagebar):
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('1')''')
+        db_utils.sql_alter_db('''INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit) VALUES ('1', 'inst1', 'Accvol', '2019-02-01 00:00', 1.0, 'm3')''')
+        db_utils.sql_alter_db('''INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit) VALUES ('1', 'inst1', 'Accvol', '2019-02-02 00:00', 2.0, 'm3')''')
+        db_utils.sql_alter_db('''INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit) VALUES ('1', 'inst1', 'Accvol', '2019-02-03 00:00', 5.0, 'm3')''')
+        db_utils.sql_alter_db('''INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit) VALUES ('1', 'inst1', 'Accvol', '2019-02-04 00:00', 10.0, 'm3')''')
+        db_utils.sql_alter_db('''INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit) VALUES ('1', 'inst1', 'Aveflow', '2019-02-03 00:00', 99.0, 'l/s')''')
+
+        widget = QtWidgets.QWidget()
+        calcave = w_flow_calc_aveflow.Calcave(widget)
+        calcave.FromDateTime.setDateTime(date_utils.datestring_to_date('2000-01-01 00:00:00'))
+        calcave.checkBox_incremental.setChecked(True)
+        calcave.calcall()
+        res = db_utils.sql_load_fr_db('''SELECT date_time, ROUND(reading, 4) FROM w_flow WHERE flowtype = 'Aveflow' ORDER BY date_time''')[1]
+        test = common_utils.anything_to_string_representation(res)
+        reference = '[("2019-02-03 00:00", 99.0, ), ("2019-02-04 00:00", 0.0579, )]'
+        assert test == reference
@@ -130,6 +130,30 @@ class TestCalibrlogger(utils_for_tests.MidvattenTestSpatialiteDbSv):
         print(test)
         assert test == ref
 
+    @mock.patch('midvatten.tools.wlevels_calc_calibr.common_utils.pop_up_info', autospec=True)
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    def test_calibrlogger_calc_best_fit_add_closest_value(self, mock_messagebar, skip_popup):
+        db_utils.sql_alter_db("INSERT INTO obs_points (obsid) VALUES ('rb1')")
+        db_utils.sql_alter_db("INSERT INTO w_levels (obsid, date_time, level_masl) VALUES ('rb1', '2017-02-01 00:00', 100)")
+        db_utils.sql_alter_db("INSERT INTO w_levels_logger (obsid, date_time, level_masl) VALUES ('rb1', '2017-02-01 00:30', 50)")
+        db_utils.sql_alter_db("INSERT INTO w_levels_logger (obsid, date_time, level_masl) VALUES ('rb1', '2017-02-01 01:30', 60)")
+        calibrlogger = Calibrlogger(self.iface.mainWindow(), self.midvatten.ms)
+
+        calibrlogger.update_plot()
+
+        calibrlogger.loggerpos_masl_or_offset_state = 2
+        calibrlogger.FromDateTime.setDateTime(date_utils.datestring_to_date('2000-01-01 00:00:00'))
+        gui_utils.set_combobox(calibrlogger.combobox_obsid, 'rb1 (uncalibrated)')
+        calibrlogger.bestFitSearchRadius.setText('2 hours')
+        calibrlogger.checkBox_closest_value.setChecked(True)
+
+        calibrlogger.calc_best_fit()
+
+        test = utils_for_tests.create_test_string(db_utils.sql_load_fr_db('SELECT obsid, date_time, head_cm, temp_degc, cond_mscm, level_masl, comment FROM w_levels_logger ORDER BY date_time'))
+        ref = '(True, [(rb1, 2017-02-01 00:30, None, None, None, 100.0, None), (rb1, 2017-02-01 01:30, None, None, None, 110.0, None)])'
+        print(test)
+        assert test == ref
+
     @mock.patch('midvatten.tools.wlevels_calc_calibr.common_utils.pop_up_info', autospec=True)
     @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
     def test_calibrlogger_calc_best_fit_add_matches_same_from_date(self, mock_messagebar, skip_popup):
@@ -353,6 +377,31 @@ class TestCalibrlogger(utils_for_tests.MidvattenTestSpatialiteDbSv):
         calibrlogger.load_obsid_and_init()
         assert tuple(calibrlogger.meas_ts.tolist()) == (('2017-05-01 00:00', 2.0),)
 
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    def test_calibrlogger_series_cache(self, mock_messagebar):
+        db_utils.sql_alter_db("INSERT INTO obs_points (obsid) VALUES ('rb1')")
+        db_utils.sql_alter_db("INSERT INTO w_levels_logger (obsid, date_time, head_cm) VALUES ('rb1', '2017-02-01 00:00', 100)")
+        db_utils.sql_alter_db("INSERT INTO w_levels_logger (obsid, date_time, head_cm) VALUES ('rb1', '2017-03-01 00:00', 200)")
+        calibrlogger = Calibrlogger(self.iface.mainWindow(), self.midvatten.ms)
+        gui_utils.set_combobox(calibrlogger.combobox_obsid, 'rb1', add_if_not_exists=False)
+        calibrlogger.load_obsid_and_init()
+        assert np.isnan(calibrlogger.level_masl_ts.values).all()
+
+        # Calibration refreshes the changed range of the cache.
+        calibrlogger.FromDateTime.setDateTime(date_utils.datestring_to_date('2017-02-15 00:00'))
+        calibrlogger.ToDateTime.setDateTime(date_utils.datestring_to_date('2099-12-31 23:59:59'))
+        calibrlogger.logger_elevation.setText('10')
+        calibrlogger.loggerpos_masl_or_offset_state = 1
+        calibrlogger.calibrate()
+        calibrlogger.load_obsid_and_init()
+        assert np.isnan(calibrlogger.level_masl_ts.values[0])
+        assert calibrlogger.level_masl_ts.values[1] == 12.0
+
+        # Changes made outside of the plugin are noticed.
+        db_utils.sql_alter_db("UPDATE w_levels_logger SET level_masl = 5 WHERE date_time = '2017-02-01 00:00'")
+        calibrlogger.load_obsid_and_init()
+        assert calibrlogger.level_masl_ts.values.tolist() == [5.0, 12.0]
+
     @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
     def test_calibrlogger_normalize_against_logger(self, mock_messagebar):
         db_utils.sql_alter_db("INSERT INTO obs_points (obsid) VALUES ('rb1')")
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ This part of the Midvatten plugin tests the water quality report.
+
+                             -------------------
+        begin                : 2026-10-18
+        copyright            : (C) 2026 by joskal (HenrikSpa)
+        email                : groundwatergis [at] gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import mock
+from nose.plugins.attrib import attr
+
+from midvatten.tools.utils import db_utils
+from midvatten.tools.tests import utils_for_tests
+from midvatten.tools.wqualreport import Wqualreport
+
+
+@attr(status='on')
+class TestWqualreport(utils_for_tests.MidvattenTestSpatialiteDbSv):
+    def setUp(self):
+        super(TestWqualreport, self).setUp()
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('P1')''')
+        db_utils.sql_alter_db('''INSERT INTO obs_points (obsid) VALUES ('P2')''')
+        for report, obsid, date_time, parameter, reading_txt, unit in [
+                ('R1', 'P1', "'2020-01-01 10:00:15'", 'Cl', '5', "'mg/l'"),
+                ('R1', 'P1', "'2020-01-01 10:00:15'", 'Na', '3', "'mg/l'"),
+                ('R1', 'P1', "'2020-01-01 10:00:15'", 'pH', '7', 'NULL'),
+                ('R2', 'P1', "'2020-01-01 10:00:45'", 'Cl', '6', "'mg/l'"),
+                ('R3', 'P1', 'NULL', 'Cl', '<1', "'mg/l'"),
+                ('R4', 'P1', "''", 'Na', '2', "'mmol/l'"),
+                ('R5', 'P2', "'2020-02-01 08:00'", 'Cl', '9', "'mg/l'"),
+                ('R6', 'P2', "'2020-02-02 08:00:00'", 'Fe', '0.1', "'mg/l'")]:
+            db_utils.sql_alter_db('''INSERT INTO w_qual_lab (report, obsid, date_time, parameter, reading_txt, unit) VALUES ('{}', '{}', {}, '{}', '{}', {})'''.format(report, obsid, date_time, parameter, reading_txt, unit))
+
+    def get_report_tables(self, settingsdict):
+        # Skips __init__, which needs a layer and writes the html report.
+        wqualreport = Wqualreport.__new__(Wqualreport)
+        wqualreport.settingsdict = settingsdict
+        rows_by_obsid = wqualreport.load_rows(['P1', 'P2'])
+        return [wqualreport.GetData('', obsid, rows=rows_by_obsid.get(obsid, [])) for obsid in ['P1', 'P2']]
+
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    def test_wqualreport_short_date_time_unit_and_sorting(self, mock_messagebar):
+        test = self.get_report_tables({'wqual_paramcolumn': 'parameter', 'wqual_unitcolumn': 'unit',
+                                       'wqual_sortingcolumn': 'report', 'wqual_valuecolumn': 'reading_txt',
+                                       'wqualtable': 'w_qual_lab', 'wqual_date_time_format': 'yyyy-mm-dd hh:mm',
+                                       'database': ''})
+        # The same result as when the report was built using one query per value.
+        reference = [[['obsid', 'P1', 'P1', 'P1', 'P1'],
+                      ['date_time', None, '', '2020-01-01 10:00', '2020-01-01 10:00'],
+                      ['report', 'R3', 'R4', 'R1', 'R2'],
+                      ['Cl, mg/l', '<1', ' ', '5', '6'],
+                      ['Na, mg/l', ' ', ' ', '3', ' '],
+                      ['Na, mmol/l', ' ', '2', ' ', ' '],
+                      ['pH', ' ', ' ', '7', ' ']],
+                     [['obsid', 'P2', 'P2'],
+                      ['date_time', '2020-02-01 08:00', '2020-02-02 08:00'],
+                      ['report', 'R5', 'R6'],
+                      ['Cl, mg/l', '9', ' '],
+                      ['Fe, mg/l', ' ', '0.1']]]
+        print("Ref:\n" + str(reference))
+        print("Test:\n" + str(test))
+        assert test == reference
+
+    @mock.patch('midvatten.tools.utils.common_utils.MessagebarAndLog')
+    def test_wqualreport_no_unit_no_sorting(self, mock_messagebar):
+        test = self.get_report_tables({'wqual_paramcolumn': 'parameter', 'wqual_unitcolumn': '',
+                                       'wqual_sortingcolumn': '', 'wqual_valuecolumn': 'reading_txt',
+                                       'wqualtable': 'w_qual_lab', 'wqual_date_time_format': 'yyyy-mm-dd hh:mm',
+                                       'database': ''})
+        # The same result as when the report was built using one query per value.
+        # Empty and NULL date_times are matched together.
+        reference = [[['obsid', 'P1', 'P1', 'P1'],
+                      ['date_time', None, '', '2020-01-01 10:00'],
+                      ['Cl', '<1', '<1', '5'],
+                      ['Na', '2', '2', '3'],
+                      ['pH', ' ', ' ', '7']],
+                     [['obsid', 'P2', 'P2'],
+                      ['date_time', '2020-02-01 08:00', '2020-02-02 08:00'],
+                      ['Cl', '9', ' '],
+                      ['Fe', ' ', '0.1']]]
+        print("Ref:\n" + str(reference))
+        print("Test:\n" + str(test))
+        assert test == reference
@@ -40,7 +40,7 @@ import numpy as np
 import qgis.utils
 from PyQt5.QtCore import QCoreApplication
 from PyQt5.QtWebKitWidgets import QWebView
-from matplotlib.dates import num2date
+from matplotlib.dates import num2date, date2num
 from qgis.PyQt import QtWidgets, QtCore, uic
 from qgis.core import Qgis, QgsApplication, QgsLogger, QgsProject, QgsMapLayer
 
@@ -1246,15 +1246,27 @@ def to_float_or_none(anything):
 
 
 def write_printlist_to_file(filename, printlist, dialect=csv.excel, delimiter=';', encoding="utf-8", **kwds):
+    """
+    Writes printlist to a csv file.
+
+    :param printlist: A list of lists or any iterable of rows, like a generator. The rows are converted and written one
+                      at a time, so a generator is never kept in memory as a whole.
+    """
     with io.open(filename, 'w', newline='', encoding=encoding) as csvfile:
         csvwriter = csv.writer(csvfile, delimiter=delimiter, dialect=dialect, **kwds)
         #csvwriter.writerows([[bytes(returnunicode(col), encoding) for col in row] for row in printlist])
-        csvwriter.writerows(returnunicode(printlist, keep_containers=True))
+        csvwriter.writerows(returnunicode(row, keep_containers=True) for row in printlist)
     MessagebarAndLog.info(bar_msg=returnunicode(QCoreApplication.translate('write_printlist_to_file', 'Data written to file %s.')) % filename)
 
 
 def sql_unicode_list(an_iterator):
-    return ', '.join(["'{}'".format(returnunicode(x)) for x in an_iterator])
+    """
+    Returns the values as a list of quoted sql strings, for use in IN (...).
+
+    >>> sql_unicode_list(['a', "b'c", 1])
+    "'a', 'b''c', '1'"
+    """
+    return ', '.join(["'{}'".format(returnunicode(x).replace("'", "''")) for x in an_iterator])
 
 
 def get_save_file_name_no_extension(**kwargs):
@@ -1308,6 +1320,94 @@ def get_full_filename(filename):
     return os.path.join(os.sep, os.path.dirname(__file__), "../..", "definitions", filename)
 
 
+def decimate_min_max(x, y, nbins):
+    """
+    Decimates a series to the first, last, min and max value in each of nbins bins along x.
+
+    Nan values in x or y splits the series into parts that are decimated separately, so gaps are kept.
+
+    >>> x, y = decimate_min_max(np.arange(10.0), np.array([0, 5, 1, 2, 3, -1, 4, 4, 4, 1.0]), 2)
+    >>> x.tolist(), y.tolist()
+    ([0.0, 1.0, 4.0, 5.0, 8.0, 9.0], [0.0, 5.0, 3.0, -1.0, 4.0, 1.0])
+
+    :param x: The x values, sorted ascending between nans.
+    :param y: The y values.
+    :param nbins: The number of bins, normally the width of the axes in pixels.
+    :return: (x, y) as numpy float arrays.
+    """
+    x = np.asarray(x)
+    if x.dtype.kind not in 'fiu':
+        x = date2num(x)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= 4 * nbins:
+        return x, y
+
+    gaps = np.flatnonzero(np.isnan(x) | np.isnan(y))
+    keep = [gaps]
+    for start, end in zip(np.concatenate(([0], gaps + 1)), np.concatenate((gaps, [len(x)]))):
+        if end - start <= 2:
+            keep.append(np.arange(start, end))
+            continue
+        part_x = x[start:end]
+        part_y = y[start:end]
+        xrange = (part_x[-1] - part_x[0]) or 1.0
+        bins = np.clip(((part_x - part_x[0]) / xrange * nbins).astype(int), 0, nbins - 1)
+        bin_starts = np.concatenate(([0], np.flatnonzero(np.diff(bins)) + 1))
+        bin_ends = np.concatenate((bin_starts[1:], [len(bins)]))
+        # Sorted by bin and then y, so the first value in each bin is the min and the last the max.
+        order = np.lexsort((part_y, bins))
+        keep.append(start + np.concatenate((bin_starts, bin_ends - 1, order[bin_starts], order[bin_ends - 1])))
+    keep = np.unique(np.concatenate(keep).astype(int))
+    return x[keep], y[keep]
+
+
+class LevelOfDetail(object):
+    """
+    Keeps the number of drawn points bounded for long lines.
+
+    The lines are drawn decimated to the axes width in pixels. When the view is changed using the navigation toolbar,
+    the visible x-range (and one view width on each side for panning) is sliced from the full resolution data and
+    decimated again, so zooming in shows all points.
+    """
+    def __init__(self, axes, toolbar=None):
+        self.axes = axes
+        self.lines = []
+        if toolbar is not None and hasattr(toolbar, 'view_changed'):
+            toolbar.view_changed.connect(lambda: self.update())
+            toolbar.edit_parameters_used.connect(lambda: self.update())
+
+    def add_line(self, line, x, y):
+        """
+        :param line: The matplotlib Line2D drawing x, y.
+        :param x: The full resolution x values, sorted ascending between nans.
+        :param y: The full resolution y values.
+        """
+        x = np.asarray(x)
+        if x.dtype.kind not in 'fiu':
+            x = date2num(x)
+        x = np.asarray(x, dtype=float)
+        # Nans are replaced by the previous value to make x searchable.
+        searchable_x = np.fmax.accumulate(np.where(np.isnan(x), -np.inf, x))
+        self.lines.append((line, x, np.asarray(y, dtype=float), searchable_x))
+
+    def clear(self):
+        self.lines = []
+
+    def update(self, draw=True):
+        if not self.lines:
+            return
+        xmin, xmax = sorted(self.axes.get_xlim())
+        xspan = xmax - xmin
+        nbins = 3 * max(int(self.axes.bbox.width), 100)
+        for line, x, y, searchable_x in self.lines:
+            start = max(np.searchsorted(searchable_x, xmin - xspan, side='left') - 1, 0)
+            end = min(np.searchsorted(searchable_x, xmax + xspan, side='right') + 1, len(x))
+            line.set_data(*decimate_min_max(x[start:end], y[start:end], nbins))
+        if draw:
+            self.axes.figure.canvas.draw_idle()
+
+
 class PickAnnotator(object):
     def __init__(self, fig, canvas=None, mousebutton='left'):
         self.fig = fig
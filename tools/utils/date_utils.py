@@ -21,6 +21,7 @@ from __future__ import absolute_import
 
 import datetime
 import re
+import warnings
 from builtins import str
 import pytz
 import numpy as np
@@ -30,13 +31,49 @@ from qgis.PyQt.QtCore import QCoreApplication
 from midvatten.tools.utils.common_utils import returnunicode as ru, MessagebarAndLog
 
 
+DATE_FORMATS = ['%Y/%m/%d %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+                '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%d %H:%M:%S.%f',
+                '%Y%m%d %H:%M:%S', '%Y%m%d %H:%M', '%Y-%m-%d %H:%M', '%Y%m%d',
+                '%Y-%m-%d', '%d-%m-%Y', '%H:%M:%S', '%d-%m-%Y %H:%M:%S',
+                '%d-%m-%Y %H:%M', '%d-%m-%Y %H', '%Y/%m/%d %H:%M',
+                '%Y/%m/%d %H', '%Y%m%d %H%M%S', '%Y%m%d %H%M',
+                '%Y%m%d %H', '%m/%d/%y %H:%M:%S', '%d-%b-%y %H:%M:%S',
+                '%d-%b-%Y %H:%M:%S', '%d-%B-%y %H:%M:%S', '%d-%B-%Y %H:%M:%S',
+                '%d.%m.%Y %H:%M', '%d.%m.%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S',
+                '%d/%m/%Y %H:%M']
+
+# The found date formats, keyed by the shape of the date string (see date_shape). A column of dates almost always
+# has the same shape on every row, so the format is only searched for once.
+DATE_FORMAT_CACHE_SIZE = 256
+_date_formats_by_shape = {}
+_DATE_SHAPE_TABLE = dict([(ord(c), '0') for c in '0123456789'] +
+                         [(ord(c), 'a') for c in 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'])
+
+_ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}:\d{2}(\.\d{3}|\.\d{6})?| \d{2}:\d{2})?$')
+
+
+def date_shape(datestring):
+    """
+    Returns the shape of a date string, with all digits replaced by 0 and all ascii letters replaced by a.
+
+    >>> date_shape('2015-01-01 12:00')
+    '0000-00-00 00:00'
+    >>> date_shape('01-May-15 12:00:00')
+    '00-aaa-00 00:00:00'
+    """
+    return datestring.translate(_DATE_SHAPE_TABLE)
+
+
 def find_date_format(datestring, suppress_error_msg=False):
     """
     Parses a string and returns the found working dateformat string
     :param datestring: A string representing a date, ex: '2015-01-01 12:00'
     :return: The dateformat of the string, ex: '%Y-%m-%d %H:%M'
 
-    Can only parse a list of preconfigured datestrings. See the code.
+    Can only parse a list of preconfigured datestrings. See DATE_FORMATS.
+
+    The found format is remembered for the shape of the string and tried first the next time a string with the same
+    shape is parsed.
 
     >>> find_date_format('2015-01-01 01:01:01')
     '%Y-%m-%d %H:%M:%S'
@@ -50,18 +87,18 @@ def find_date_format(datestring, suppress_error_msg=False):
     None
     """
     datestring = str(datestring)
-    date_formats_to_try = ['%Y/%m/%d %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
-                           '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%d %H:%M:%S.%f',
-                           '%Y%m%d %H:%M:%S', '%Y%m%d %H:%M', '%Y-%m-%d %H:%M', '%Y%m%d',
-                           '%Y-%m-%d', '%d-%m-%Y', '%H:%M:%S', '%d-%m-%Y %H:%M:%S',
-                           '%d-%m-%Y %H:%M', '%d-%m-%Y %H', '%Y/%m/%d %H:%M',
-                           '%Y/%m/%d %H', '%Y%m%d %H%M%S', '%Y%m%d %H%M',
-                           '%Y%m%d %H', '%m/%d/%y %H:%M:%S', '%d-%b-%y %H:%M:%S',
-                           '%d-%b-%Y %H:%M:%S', '%d-%B-%y %H:%M:%S', '%d-%B-%Y %H:%M:%S',
-                           '%d.%m.%Y %H:%M', '%d.%m.%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S',
-                           '%d/%m/%Y %H:%M']
+    shape = date_shape(datestring)
+    cached_format = _date_formats_by_shape.get(shape)
+    if cached_format is not None:
+        try:
+            datetime.datetime.strptime(datestring, cached_format)
+        except ValueError:
+            pass
+        else:
+            return cached_format
+
     found_format = None
-    for dateformat in date_formats_to_try:
+    for dateformat in DATE_FORMATS:
         try:
             datetime.datetime.strptime(datestring, dateformat)
         except ValueError:
@@ -74,7 +111,11 @@ def find_date_format(datestring, suppress_error_msg=False):
         if not suppress_error_msg:
             MessagebarAndLog.critical(
                 bar_msg=QCoreApplication.translate('find_date_format', 'Date parsing failed, see log message panel'),
-                log_msg=ru(QCoreApplication.translate('find_date_format', 'Could not find the date format for string "%s"\nSupported date formats:\n%s'))%(ru(datestring), '\n'.join(date_formats_to_try)))
+                log_msg=ru(QCoreApplication.translate('find_date_format', 'Could not find the date format for string "%s"\nSupported date formats:\n%s'))%(ru(datestring), '\n'.join(DATE_FORMATS)))
+    else:
+        if len(_date_formats_by_shape) >= DATE_FORMAT_CACHE_SIZE:
+            _date_formats_by_shape.clear()
+        _date_formats_by_shape[shape] = found_format
 
     return found_format
 
@@ -127,10 +168,15 @@ def datestring_to_date(astring, now=datetime.datetime.now(), df=None):
 
     If astring is a datetime object, it is untouched and returned.
 
+    ISO formatted strings are parsed directly using datetime.fromisoformat. If df doesn't match astring, the format
+    is searched for using find_date_format.
+
     >>> datestring_to_date('2015-01-01')
     datetime.datetime(2015, 1, 1, 0, 0)
     >>> datestring_to_date('2015-01-01 12:00')
     datetime.datetime(2015, 1, 1, 12, 0)
+    >>> datestring_to_date('01.02.2015 12:00', df='%d.%m.%Y %H:%M')
+    datetime.datetime(2015, 2, 1, 12, 0)
     >>> datestring_to_date(datetime.datetime(2015, 1, 1, 12, 0))
     datetime.datetime(2015, 1, 1, 12, 0)
     """
@@ -138,11 +184,18 @@ def datestring_to_date(astring, now=datetime.datetime.now(), df=None):
         return astring
     else:
         if df is not None:
-            format = df
-        else:
-            format = find_date_format(astring)
+            try:
+                return datetime.datetime.strptime(astring, df)
+            except (ValueError, TypeError):
+                pass
+        if isinstance(astring, str) and _ISO_DATE_RE.match(astring):
+            try:
+                return datetime.datetime.fromisoformat(astring)
+            except ValueError:
+                pass
+        format = find_date_format(astring)
         if format is not None:
-            adate = datetime.datetime.strptime(astring, find_date_format(astring))
+            adate = datetime.datetime.strptime(astring, format)
         else:
             splitted = astring.split()
             if len(splitted) == 2:
@@ -155,6 +208,39 @@ def datestring_to_date(astring, now=datetime.datetime.now(), df=None):
                     adate = None
     return adate
 
+def datestrings_to_datetime64(datestrings):
+    """
+    Converts date strings to a numpy datetime64 array, with the timezone information removed.
+
+    ISO formatted dates without timezone are converted at once by numpy. For other formats, the date format is found
+    once using the first date string and then used for all rows, falling back to datestring_to_date for the rows it
+    doesn't match.
+
+    >>> datestrings_to_datetime64(['2015-01-01 12:00', '2015-01-02']).tolist()
+    [datetime.datetime(2015, 1, 1, 12, 0), datetime.datetime(2015, 1, 2, 0, 0)]
+    >>> datestrings_to_datetime64(['01-02-2015 12:00', '02-02-2015 13:00', '2015-02-03']).tolist()
+    [datetime.datetime(2015, 2, 1, 12, 0), datetime.datetime(2015, 2, 2, 13, 0), datetime.datetime(2015, 2, 3, 0, 0)]
+    """
+    try:
+        with warnings.catch_warnings():
+            # Numpy converts dates with timezone to UTC with a warning.
+            warnings.simplefilter('error')
+            return np.array(datestrings, dtype='datetime64[us]')
+    except (ValueError, TypeError, Warning):
+        pass
+
+    datestrings = list(datestrings)
+    date_format = find_date_format(datestrings[0], suppress_error_msg=True) if datestrings else None
+    strptime = datetime.datetime.strptime
+    dates = []
+    for datestring in datestrings:
+        try:
+            adate = strptime(datestring, date_format)
+        except (ValueError, TypeError):
+            adate = datestring_to_date(datestring)
+        dates.append(adate.replace(tzinfo=None))
+    return np.array(dates, dtype='datetime64[us]')
+
 def long_dateformat(astring, dateformat=None):
     return datetime.datetime.strftime(datestring_to_date(astring, df=dateformat), '%Y-%m-%d %H:%M:%S')
 
@@ -22,6 +22,9 @@
 from __future__ import absolute_import
 
 import ast
+import copy
+import functools
+import inspect
 import os
 import traceback
 import zipfile
@@ -35,10 +38,13 @@ except:
     compression = zipfile.ZIP_STORED
 
 import datetime
+import itertools
 import psycopg2
 import re
 import tempfile
+import threading
 from collections import OrderedDict
+from contextlib import contextmanager
 import sqlite3 as sqlite
 
 from qgis.PyQt.QtCore import QCoreApplication, QSettings
@@ -49,7 +55,7 @@ import db_manager.db_plugins.connector
 import db_manager.db_plugins.spatialite.connector as spatialite_connector
 
 from midvatten.tools.utils.common_utils import MessagebarAndLog, returnunicode as ru, UsageError, UserInterruptError, \
-    sql_failed_msg, write_printlist_to_file, lstrip
+    sql_failed_msg, write_printlist_to_file, lstrip, sql_unicode_list
 
 
 class PostGisDBConnectorMod(db_manager.db_plugins.postgis.connector.PostGisDBConnector):
@@ -109,7 +115,16 @@ class PostGisDBConnectorMod(db_manager.db_plugins.postgis.connector.PostGisDBCon
         self.connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
 
 
+# The number of rows per fetch when a select is read in batches using DbConnectionManager.execute_and_fetchmany.
+FETCHMANY_BATCHSIZE = 10000
+_named_cursor_counter = itertools.count()
+
+
 class DbConnectionManager(object):
+    # Number of connections opened since the plugin was loaded. Used by reuse_dbconnection to report how many
+    # connections an action needed.
+    nr_of_opened_connections = 0
+
     def __init__(self, db_settings=None):
         """
         Manuals for db connectors:
@@ -193,6 +208,16 @@ class DbConnectionManager(object):
         if self.connector is not None:
             self.conn = self.connector.connection
             self.cursor = self.conn.cursor()
+            DbConnectionManager.nr_of_opened_connections += 1
+
+    def db_identity(self):
+        """
+        Returns a hashable identity of the database (not the connection), used as key for per-database caches.
+        """
+        if self.dbtype == 'spatialite':
+            return (self.dbtype, os.path.normcase(os.path.abspath(self.dbpath)))
+        else:
+            return (self.dbtype, ru(self.uri.connectionInfo(False)), self.schema)
 
     def connect2db(self):
         self.check_db_is_locked()
@@ -212,6 +237,10 @@ class DbConnectionManager(object):
         elif not isinstance(sql, (list, tuple)):
             raise TypeError(ru(QCoreApplication.translate('DbConnectionManager', 'DbConnectionManager.execute: sql must be type string or a list/tuple of strings. Was %s'))%ru(type(sql)))
         for idx, line in enumerate(sql):
+            if changes_schema(line):
+                invalidate_schema_cache(self)
+            elif writes_db_properties(line):
+                invalidate_db_properties_cache()
             if all_args is None:
                 try:
                     self.cursor.execute(line)
@@ -235,6 +264,10 @@ class DbConnectionManager(object):
                 raise TypeError(ru(QCoreApplication.translate('DbConnectionManager', 'DbConnectionManager.execute: all_args must be a list/tuple. Was %s')) % ru(type(all_args)))
 
     def execute_and_fetchall(self, sql, args=None):
+        if changes_schema(sql):
+            invalidate_schema_cache(self)
+        elif writes_db_properties(sql):
+            invalidate_db_properties_cache()
         try:
             if args is not None:
                 self.cursor.execute(sql, args)
@@ -251,6 +284,59 @@ class DbConnectionManager(object):
 
         return self.cursor.fetchall()
 
+    def execute_and_fetchmany(self, sql, args=None, batchsize=None):
+        """
+        Executes a select and returns the column names and an iterator over the rows, fetched batchsize rows at a time.
+
+        The rows are read through a separate cursor, so self.cursor can still be used while they are consumed. For
+        postgis a named (server side) cursor is used, so the result is kept in the database and only one batch at a
+        time is transferred. The connection is in autocommit mode, so the cursor must be declared with hold.
+
+        :param sql: A select query.
+        :param args: Arguments for ? in sql.
+        :param batchsize: The number of rows per fetch, FETCHMANY_BATCHSIZE if None.
+        :return: (column names, iterator of rows)
+        """
+        if batchsize is None:
+            batchsize = FETCHMANY_BATCHSIZE
+
+        if self.dbtype == 'postgis':
+            cursor = self.conn.cursor(name='midv_fetchmany_{}'.format(next(_named_cursor_counter)), withhold=True)
+            cursor.itersize = batchsize
+        else:
+            cursor = self.conn.cursor()
+
+        try:
+            if args is not None:
+                cursor.execute(sql, args)
+            else:
+                cursor.execute(sql)
+            # The description of a named cursor is set at the first fetch.
+            first_batch = cursor.fetchmany(batchsize)
+        except Exception as e:
+            cursor.close()
+            textstring = ru(QCoreApplication.translate('sql_load_fr_db',
+                                                       """DB error!\n SQL causing this error:%s\nMsg:\n%s""")) % (
+                         ru(sql), ru(str(e)))
+            MessagebarAndLog.warning(
+                bar_msg=sql_failed_msg(),
+                log_msg=textstring)
+            raise
+
+        columns = [col[0] for col in cursor.description]
+
+        def rows():
+            batch = first_batch
+            try:
+                while batch:
+                    for row in batch:
+                        yield row
+                    batch = cursor.fetchmany(batchsize)
+            finally:
+                cursor.close()
+
+        return columns, rows()
+
     def execute_and_commit(self, sql, all_args=None):
         self.execute(sql, all_args=all_args)
         self.commit()
@@ -342,29 +428,207 @@ class DbConnectionManager(object):
             write_printlist_to_file(filename, printlist)
 
     def get_srid(self, table_name, geometry_column='geometry'):
-        srid = None
-        if self.dbtype == 'spatialite':
-            srid = self.execute_and_fetchall("""SELECT srid FROM geometry_columns WHERE f_table_name = '%s'""" % table_name)
-            if not srid:
-                srid = None
-            else:
-                srid = srid[0][0]
+        return get_srid(table_name, geometry_column, dbconnection=self)
+
+    def placeholder_sign(self):
+        return placeholder_sign(self)
+
+_shared_dbconnection = threading.local()
+
+
+def get_dbconnection(dbconnection=None):
+    """
+    Returns the connection a db_utils helper should use, and if the helper created it (and must close it).
+
+    An explicitly given connection is always used. Otherwise the connection shared by an enclosing
+    reuse_dbconnection block is used, and last a new connection is opened.
+
+    :param dbconnection: A DbConnectionManager or None.
+    :return: (dbconnection, dbconnection_created)
+    """
+    if isinstance(dbconnection, DbConnectionManager):
+        return dbconnection, False
+
+    shared = getattr(_shared_dbconnection, 'dbconnection', None)
+    if shared is not None:
+        return shared, False
+
+    return DbConnectionManager(), True
+
+
+@contextmanager
+def reuse_dbconnection(action_name=None):
+    """
+    Opens one connection that is reused by all db_utils helpers called without a connection inside the block.
+
+    Nested blocks reuse the connection of the outermost block. The connection is closed when the outermost block
+    exits. If action_name is given, the number of connections opened during the block is written to the log.
+
+    with reuse_dbconnection('Load obsid') as dbconnection:
+        ...
+
+    :param action_name: Name of the action, used in the log message.
+    :return: The shared DbConnectionManager.
+    """
+    shared = getattr(_shared_dbconnection, 'dbconnection', None)
+    if shared is not None:
+        yield shared
+        return
+
+    nr_of_opened_before = DbConnectionManager.nr_of_opened_connections
+    dbconnection = DbConnectionManager()
+    _shared_dbconnection.dbconnection = dbconnection
+    try:
+        yield dbconnection
+    finally:
+        _shared_dbconnection.dbconnection = None
+        dbconnection.closedb()
+        if action_name is not None:
+            MessagebarAndLog.info(log_msg=ru(QCoreApplication.translate('reuse_dbconnection', '%s: %s database connection(s) opened.'))%(
+                ru(action_name), str(DbConnectionManager.nr_of_opened_connections - nr_of_opened_before)))
+
+
+# Cached results of the schema introspection functions, like {db_identity: {(function name, arguments): result}}.
+_schema_cache = {}
+
+# Arguments that don't change the result of a cached function, so they are not part of the cache key.
+_NON_KEY_ARGUMENTS = ('dbconnection', 'print_error_message_in_bar')
+
+# Cached database properties stored as data in the database (locale, timezones), like
+# {db_identity: {(function name, arguments): result}}.
+_db_properties_cache = {}
+
+
+def schema_cached(func):
+    """
+    Caches the result of a schema introspection function per database.
+
+    The decorated function must take an argument named dbconnection. The cache for a database is cleared by
+    invalidate_schema_cache, which is called automatically when CREATE, DROP or ALTER (of non-temporary objects) is
+    executed through DbConnectionManager. Schema changes made outside of Midvatten require an explicit
+    invalidate_schema_cache().
+    """
+    return _cached_per_database(func, _schema_cache)
+
+
+def db_properties_cached(func=None, cache_none=True):
+    """
+    Caches the result of a function reading a database property from about_db, like the locale or a timezone, per
+    database.
+
+    The decorated function must take an argument named dbconnection. None results are also cached unless the
+    decorator is used as @db_properties_cached(cache_none=False), for functions that return None on errors. The cache is
+    cleared by invalidate_db_properties_cache, which is called automatically when about_db is written through
+    DbConnectionManager and when the schema is changed.
+
+    When called without a connection (and outside of reuse_dbconnection), the database setting is used as key, so a
+    cached result is returned without opening a connection.
+    """
+    if func is None:
+        return functools.partial(db_properties_cached, cache_none=cache_none)
+    return _cached_per_database(func, _db_properties_cache, cache_none=cache_none, key_by_settings=True)
+
+
+def _cached_per_database(func, per_database_cache, cache_none=False, key_by_settings=False):
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (func.__name__, ) + tuple([(k, tuple(v) if isinstance(v, list) else v)
+                                        for k, v in bound.arguments.items() if k not in _NON_KEY_ARGUMENTS])
+
+        if (key_by_settings and bound.arguments['dbconnection'] is None and
+                getattr(_shared_dbconnection, 'dbconnection', None) is None):
+            dbconnection, dbconnection_created = None, False
+            db_identity = ('db_settings', QgsProject.instance().readEntry("Midvatten", "database")[0])
         else:
-            try:
-                self.cursor.execute("""SELECT Find_SRID('{}', '{}', '{}');""".format(self.schema, table_name,
-                                                                                     geometry_column))
-            except:
-                #Assume that the column doesn't have a srid/is a geometry.
-                srid = None
+            dbconnection, dbconnection_created = get_dbconnection(bound.arguments['dbconnection'])
+            bound.arguments['dbconnection'] = dbconnection
+            db_identity = dbconnection.db_identity()
+
+        cache = per_database_cache.setdefault(db_identity, {})
+        try:
+            if key in cache:
+                result = cache[key]
             else:
+                result = func(*bound.args, **bound.kwargs)
+                if result is not None or cache_none:
+                    cache[key] = result
+        finally:
+            if dbconnection_created:
+                dbconnection.closedb()
+        # The callers may alter the result, so the cached object is never returned.
+        return copy.deepcopy(result)
+    return wrapper
 
-                srid = self.cursor.fetchall()[0][0]
-        if srid is not None:
-            srid = int(srid)
-        return srid
 
-    def placeholder_sign(self):
-        return placeholder_sign(self)
+def invalidate_schema_cache(dbconnection=None):
+    """
+    Clears the cached schema information for the database of dbconnection, or for all databases if None.
+
+    The cached database properties are cleared as well.
+    """
+    if dbconnection is None:
+        _schema_cache.clear()
+    else:
+        _schema_cache.pop(dbconnection.db_identity(), None)
+    invalidate_db_properties_cache()
+
+
+def invalidate_db_properties_cache():
+    """
+    Clears the cached database properties (see db_properties_cached) for all databases.
+
+    The properties are cached both by database and by database setting, so everything is cleared.
+    """
+    _db_properties_cache.clear()
+
+
+def writes_db_properties(sql):
+    """
+    Returns True if sql writes to about_db, with or without a schema prefix.
+
+    >>> writes_db_properties("UPDATE about_db SET description = 'locale:sv_SE' WHERE description LIKE 'locale:%'")
+    True
+    >>> writes_db_properties('INSERT INTO about_db (tablename, columnname) VALUES ("*", "*")')
+    True
+    >>> writes_db_properties("UPDATE public.about_db SET description = 'locale:sv_SE'")
+    True
+    >>> writes_db_properties('DELETE FROM "public"."about_db"')
+    True
+    >>> writes_db_properties("UPDATE public.about_db_copy SET description = ''")
+    False
+    >>> writes_db_properties("SELECT description FROM about_db")
+    False
+    """
+    if not isinstance(sql, str):
+        return False
+    return re.match(r'\s*(INSERT\s+(OR\s+\w+\s+)?INTO|UPDATE|DELETE\s+FROM|REPLACE\s+INTO)\s+'
+                    r'(["]?\w+["]?\.)?["]?about_db\b', sql, flags=re.IGNORECASE) is not None
+
+
+def changes_schema(sql):
+    """
+    Returns True if sql creates, drops or alters a non-temporary database object.
+
+    >>> changes_schema('ALTER TABLE w_levels_logger ADD COLUMN source TEXT')
+    True
+    >>> changes_schema('CREATE TEMPORARY table temp_w_levels (obsid TEXT)')
+    False
+    >>> changes_schema('DROP TABLE mem.temp_w_levels')
+    False
+    >>> changes_schema('SELECT * FROM obs_points')
+    False
+    """
+    if not isinstance(sql, str):
+        return False
+    match = re.match(r'\s*(CREATE|DROP|ALTER)\s+(.*)', sql, flags=re.IGNORECASE | re.DOTALL)
+    if match is None:
+        return False
+    return re.match(r'(\w+\s+){0,3}?(TEMP\s|TEMPORARY\s|mem\.|temp_)', match.group(2)[:200], flags=re.IGNORECASE) is None
+
 
 def connect_with_spatialite_connect(dbpath):
     conn = spatialite_connect(dbpath, detect_types=sqlite.PARSE_DECLTYPES | sqlite.PARSE_COLNAMES)
@@ -414,11 +678,7 @@ def get_postgis_connections():
 
 
 def sql_load_fr_db(sql, dbconnection=None, print_error_message_in_bar=True):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     try:
         result = dbconnection.execute_and_fetchall(sql)
@@ -438,11 +698,7 @@ def sql_load_fr_db(sql, dbconnection=None, print_error_message_in_bar=True):
 
 
 def sql_alter_db(sql, dbconnection=None, all_args=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         try:
@@ -504,13 +760,10 @@ def tables_columns(table=None, dbconnection=None):
                                                                                dbconnection=dbconnection).items()])
 
 
+@schema_cached
 def db_tables_columns_info(table=None, dbconnection=None):
     """Returns a dict like {'tablename': (ordernumber, name, type, notnull, defaultvalue, primarykey)}"""
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     existing_tablenames = get_tables(dbconnection=dbconnection)
 
@@ -546,12 +799,9 @@ def db_tables_columns_info(table=None, dbconnection=None):
     return tables_dict
 
 
+@schema_cached
 def get_tables(dbconnection=None, skip_views=False):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         if skip_views:
@@ -582,13 +832,10 @@ def get_tables(dbconnection=None, skip_views=False):
     return tablenames
 
 
+@schema_cached
 def get_table_info(tablename, dbconnection=None):
 
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         columns_sql = """PRAGMA table_info ('%s')""" % (tablename)
@@ -640,6 +887,7 @@ def get_table_info(tablename, dbconnection=None):
     return columns
 
 
+@schema_cached
 def get_foreign_keys(table, dbconnection=None):
     """Get foreign keys for table.
        Returns a dict like {foreign_key_table: (colname in table, colname in foreign_key_table)}
@@ -648,11 +896,7 @@ def get_foreign_keys(table, dbconnection=None):
     and
     https://stackoverflow.com/questions/39379939/how-to-access-information-schema-foreign-key-constraints-with-read-only-user-in
     """
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     foreign_keys = {}
     if dbconnection.dbtype == 'spatialite':
@@ -768,11 +1012,7 @@ def get_sql_result_as_dict(sql, dbconnection=None):
     :param dbconnection:
     :return: A dict with the first column as key and the rest in a tuple as value
     """
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     connection_ok, result_list = sql_load_fr_db(sql, dbconnection=dbconnection)
     if not connection_ok:
@@ -804,6 +1044,7 @@ def change_cast_type_for_geometry_columns(dbconnection, table_info, tablename):
     return column_headers_types
 
 
+@schema_cached
 def get_geometry_types(dbconnection, tablename):
     if dbconnection.dbtype == 'spatialite':
         sql = """SELECT f_geometry_column, geometry_type FROM geometry_columns WHERE f_table_name = '%s'""" % tablename
@@ -825,11 +1066,7 @@ def delete_duplicate_values(dbconnection, tablename, primary_keys):
 
 
 def activate_foreign_keys(activated=True, dbconnection=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         if activated:
@@ -855,11 +1092,7 @@ class DatabaseLockedError(Exception):
 
 
 def placeholder_sign(dbconnection=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     signs = {'spatialite': '?',
              'postgis': '%s'}
@@ -884,11 +1117,7 @@ def get_dbtype(dbtype):
 
 
 def cast_date_time_as_epoch(dbconnection=None, date_time=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if date_time is None:
         date_time = 'date_time'
@@ -908,11 +1137,7 @@ def cast_date_time_as_epoch(dbconnection=None, date_time=None):
 
 
 def backup_db(dbconnection=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         curs = dbconnection.cursor
@@ -937,11 +1162,7 @@ def backup_db(dbconnection=None):
 
 
 def cast_null(data_type, dbconnection=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         sql = 'NULL'
@@ -955,11 +1176,7 @@ def cast_null(data_type, dbconnection=None):
 
 
 def test_not_null_and_not_empty_string(table, column, dbconnection=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         sql = """%s IS NOT NULL AND %s !='' """%(column, column)
@@ -1000,12 +1217,39 @@ def sqlite_numeric_data_types():
             'double']
 
 
-def get_srid_name(srid, dbconnection=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
+@schema_cached
+def get_srid(table_name, geometry_column='geometry', dbconnection=None):
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
+
+    srid = None
+    if dbconnection.dbtype == 'spatialite':
+        srid = dbconnection.execute_and_fetchall("""SELECT srid FROM geometry_columns WHERE f_table_name = '%s'""" % table_name)
+        if not srid:
+            srid = None
+        else:
+            srid = srid[0][0]
     else:
-        dbconnection_created = False
+        try:
+            dbconnection.cursor.execute("""SELECT Find_SRID('{}', '{}', '{}');""".format(dbconnection.schema, table_name,
+                                                                                         geometry_column))
+        except:
+            #Assume that the column doesn't have a srid/is a geometry.
+            srid = None
+        else:
+
+            srid = dbconnection.cursor.fetchall()[0][0]
+
+    if dbconnection_created:
+        dbconnection.closedb()
+
+    if srid is not None:
+        srid = int(srid)
+    return srid
+
+
+@schema_cached
+def get_srid_name(srid, dbconnection=None):
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         ref_sys_name = dbconnection.execute_and_fetchall("""SELECT ref_sys_name FROM spatial_ref_sys WHERE srid = '%s'"""%srid)[0][0]
@@ -1025,11 +1269,7 @@ def get_srid_name(srid, dbconnection=None):
 
 
 def test_if_numeric(column, dbconnection=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         sql = """(typeof(%s)=typeof(0.01) OR typeof(%s)=typeof(1))"""%(column, column)
@@ -1043,11 +1283,7 @@ def test_if_numeric(column, dbconnection=None):
 
 
 def numeric_datatypes(dbconnection=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         res = sqlite_numeric_data_types()
@@ -1069,11 +1305,7 @@ def calculate_median_value(table, column, obsid, dbconnection=None):
     :param dbconnection:
     :return:
     """
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
 
@@ -1130,11 +1362,7 @@ def calculate_median_value(table, column, obsid, dbconnection=None):
 
 
 def rowid_string(dbconnection=None):
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         res = 'ROWID'
@@ -1216,27 +1444,65 @@ def create_dict_from_db_2_cols(params):#params are (col1=keys,col2=values,db-tab
     return True, adict
 
 
-def get_all_obsids(table='obs_points'):
+def get_all_obsids(table='obs_points', dbconnection=None):
     """ Returns all obsids from obs_points
     :return: All obsids from obs_points
     """
     obsids = []
-    connection_ok, result = sql_load_fr_db('''SELECT DISTINCT obsid FROM %s ORDER BY OBSID''' % table)
+    connection_ok, result = sql_load_fr_db('''SELECT DISTINCT obsid FROM %s ORDER BY OBSID''' % table, dbconnection=dbconnection)
     if connection_ok:
         obsids = [row[0] for row in result]
     return obsids
 
 
+def table_change_token(table, obsids=None, value_column=None, date_column='date_time', text_columns=None,
+                       dbconnection=None):
+    """
+    Returns a cheap fingerprint of the rows in table, used to know when data cached from the table must be reloaded.
+
+    :param table: The table, ex. 'w_levels'.
+    :param obsids: Only use the rows for these obsids. None to use all rows.
+    :param value_column: A numeric column to sum, to catch edited values. It can also be a list of columns, then the
+                         sum and the number of non-null values of each column is used.
+    :param date_column: The date column.
+    :param text_columns: A list of text columns, ex. ['source']. The sum of the lengths, the min and the max of each
+                         column is added to the token.
+    :return: A tuple like (row count, min date, max date, sum of dates as epoch, sum of value_column)
+             or (row count, min date, max date, sum of dates as epoch, sum of column 1, count of column 1, ...) if
+             value_column is a list, followed by (sum of lengths, min, max) for each of text_columns.
+
+    The sums catch most edits of dates and values, but not edits that cancel each other out in the sum. Edits of a
+    text column that keep the total length, the min and the max are not caught.
+    """
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
+    if not value_column:
+        value = 'NULL'
+    elif isinstance(value_column, (list, tuple)):
+        value = ', '.join(['SUM({col}), COUNT({col})'.format(col=col) for col in value_column])
+    else:
+        value = 'SUM({})'.format(value_column)
+    if text_columns:
+        value += ''.join([', SUM(LENGTH({col})), MIN({col}), MAX({col})'.format(col=col) for col in text_columns])
+    if dbconnection.dbtype == 'spatialite':
+        date_as_epoch = """CAST(strftime('%s', {}) AS NUMERIC)""".format(date_column)
+    else:
+        date_as_epoch = """extract(epoch from {}::timestamp)""".format(date_column)
+    sql = 'SELECT COUNT(*), MIN({date}), MAX({date}), SUM({date_as_epoch}), {value} FROM {table}'.format(
+        date=date_column, date_as_epoch=date_as_epoch, value=value, table=table)
+    if obsids is not None:
+        sql += ' WHERE obsid IN ({})'.format(sql_unicode_list(obsids))
+    token = tuple(dbconnection.execute_and_fetchall(sql)[0])
+    if dbconnection_created:
+        dbconnection.closedb()
+    return token
+
+
 def get_latlon_for_all_obsids(dbconnection=None):
     """
     Returns lat, lon for all obsids
     :return: A dict of tuples with like {'obsid': (lat, lon)} for all obsids in obs_points
     """
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     if dbconnection.dbtype == 'spatialite':
         sql = 'SELECT obsid, Y(Transform(geometry, 4326)) as lat, X(Transform(geometry, 4326)) as lon from obs_points'
@@ -1253,13 +1519,10 @@ def get_latlon_for_all_obsids(dbconnection=None):
     latlon_dict = dict([(obsid, lat_lon[0]) for obsid, lat_lon in latlon_dict.items()])
     return latlon_dict
 
+@db_properties_cached
 def get_timezone_from_db(tablename, dbconnection=None):
     timezone = None
-    if not isinstance(dbconnection, DbConnectionManager):
-        dbconnection = DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = get_dbconnection(dbconnection)
 
     about_db_cols = tables_columns('about_db', dbconnection)['about_db']
     if 'tablename' in about_db_cols:
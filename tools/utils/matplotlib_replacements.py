@@ -144,6 +144,8 @@ def replace_matplotlib_backends_backend_qt5agg_NavigationToolbar2QT_set_message_
 
 class NavigationToolbarWithSignal(NavigationToolbar, QObject):
     edit_parameters_used = pyqtSignal()
+    # Emitted when the axes limits are changed using zoom, pan, home, back or forward.
+    view_changed = pyqtSignal()
 
     def __init__(self, *args, **kwargs):
         NavigationToolbar.__init__(self, *args, **kwargs)
@@ -152,6 +154,26 @@ class NavigationToolbarWithSignal(NavigationToolbar, QObject):
         super(NavigationToolbarWithSignal, self).edit_parameters(*args, **kwargs)
         self.edit_parameters_used.emit()
 
+    def release_zoom(self, *args, **kwargs):
+        super(NavigationToolbarWithSignal, self).release_zoom(*args, **kwargs)
+        self.view_changed.emit()
+
+    def release_pan(self, *args, **kwargs):
+        super(NavigationToolbarWithSignal, self).release_pan(*args, **kwargs)
+        self.view_changed.emit()
+
+    def home(self, *args, **kwargs):
+        super(NavigationToolbarWithSignal, self).home(*args, **kwargs)
+        self.view_changed.emit()
+
+    def back(self, *args, **kwargs):
+        super(NavigationToolbarWithSignal, self).back(*args, **kwargs)
+        self.view_changed.emit()
+
+    def forward(self, *args, **kwargs):
+        super(NavigationToolbarWithSignal, self).forward(*args, **kwargs)
+        self.view_changed.emit()
+
 
 LINESTYLES = {'-': 'Solid',
               '--': 'Dashed',
@@ -211,27 +211,14 @@ def sql_to_parameters_units_tuple(sql):
 
 
 def getcurrentlocale(print_error_message_in_bar=True, dbconnection=None):
-    if not isinstance(dbconnection, db_utils.DbConnectionManager):
-        try:
-            dbconnection = db_utils.DbConnectionManager()
-        except UsageError:
-            # The user has not selected a database.
-            dbconnection_created = False
-            dbconnection = None
-        else:
-            dbconnection_created = True
-    else:
-        dbconnection_created = False
-
-    if dbconnection is not None:
+    try:
+        # get_locale_from_db is cached, so this usually doesn't open a connection.
         db_locale = get_locale_from_db(print_error_message_in_bar=print_error_message_in_bar,
-                                   dbconnection=dbconnection)
-    else:
+                                       dbconnection=dbconnection)
+    except UsageError:
+        # The user has not selected a database.
         db_locale = None
 
-    if dbconnection_created:
-        dbconnection.closedb()
-
 
     if db_locale is not None and db_locale:
         return [db_locale, locale.getdefaultlocale()[1]]
@@ -239,12 +226,9 @@ def getcurrentlocale(print_error_message_in_bar=True, dbconnection=None):
         return locale.getdefaultlocale()[:2]
 
 
+@db_utils.db_properties_cached(cache_none=False)
 def get_locale_from_db(print_error_message_in_bar=True, dbconnection=None):
-    if not isinstance(dbconnection, db_utils.DbConnectionManager):
-        dbconnection = db_utils.DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = db_utils.get_dbconnection(dbconnection)
 
     connection_ok, locale_row = db_utils.sql_load_fr_db("SELECT description FROM about_db WHERE description LIKE 'locale:%'",
                                                         print_error_message_in_bar=print_error_message_in_bar,
@@ -316,11 +300,7 @@ def list_of_lists_from_table(tablename):
 
 
 def create_layer(tablename, geometrycolumn=None, sql=None, keycolumn=None, dbconnection=None, layername=None):
-    if not isinstance(dbconnection, db_utils.DbConnectionManager):
-        dbconnection = db_utils.DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = db_utils.get_dbconnection(dbconnection)
 
     uri = dbconnection.uri
     dbtype = dbconnection.dbtype
@@ -340,11 +320,7 @@ def create_layer(tablename, geometrycolumn=None, sql=None, keycolumn=None, dbcon
 
 
 def add_layers_to_list(resultlist, tablenames, geometrycolumn=None, dbconnection=None, layernames=None, key_columns=None):
-    if not isinstance(dbconnection, db_utils.DbConnectionManager):
-        dbconnection = db_utils.DbConnectionManager()
-        dbconnection_created = True
-    else:
-        dbconnection_created = False
+    dbconnection, dbconnection_created = db_utils.get_dbconnection(dbconnection)
 
     if key_columns is None:
         key_columns = [None, 'obsid', 'rowid']
@@ -519,6 +495,7 @@ def add_view_obs_points_obs_lines():
         dbconnection.execute('''DROP VIEW IF EXISTS view_obs_lines;''')
         dbconnection.execute('''DELETE FROM views_geometry_columns WHERE view_name IN ('view_obs_points', 'view_obs_lines');''')
         db_utils.execute_sqlfile(get_full_filename('qgis3_obsp_fix.sql'), dbconnection)
+        db_utils.invalidate_schema_cache(dbconnection)
         dbconnection.commit_and_closedb()
         MessagebarAndLog.info(bar_msg=QCoreApplication.translate("Midvatten",
                                                                            'Views added. Please reload layers (Midvatten>Load default db-layers to qgis or "F7").'))
@@ -534,6 +511,7 @@ def add_non_essential_tables(dbconnection=None):
     if connection_ok:
         db_utils.execute_sqlfile(get_full_filename('create_db_extra_data_tables.sql'),
                                  dbconnection, merge_newlines=True)
+        db_utils.invalidate_schema_cache(dbconnection)
         dbconnection.commit()
         MessagebarAndLog.info(bar_msg=QCoreApplication.translate("Midvatten",
                                                                  'Tables added. Load tables using Midvatten>Utilities>Load data tables to qgis.'))
@@ -16,9 +16,24 @@ This code is inspired from the PointSamplingTool plugin Copyright (C) 2008 Borys
 and qchainage plugin (C) 2012 by Werner Macho
 """
 
+import math
+
+import numpy as np
 import qgis.PyQt
 from qgis.core import QgsFeature, QgsField, QgsFields, QgsProject, QgsApplication, QgsRaster, QgsVectorLayer, \
-    QgsUnitTypes, QgsWkbTypes
+    QgsUnitTypes, QgsWkbTypes, QgsRectangle, QgsPointXY, QgsGeometry, Qgis
+
+# {(line wkb, distance): (xarray, points)}, shared by all DEMs sampled along the same section line.
+_chainage_cache = {}
+CHAINAGE_CACHE_SIZE = 16
+
+RASTER_NUMPY_DTYPES = {Qgis.Byte: np.uint8,
+                       Qgis.UInt16: np.uint16,
+                       Qgis.Int16: np.int16,
+                       Qgis.UInt32: np.uint32,
+                       Qgis.Int32: np.int32,
+                       Qgis.Float32: np.float32,
+                       Qgis.Float64: np.float64}
 
 
 def qchain(sectionlinelayer, distance): #original start function from qchainage
@@ -166,3 +181,168 @@ def sampling(pointsamplinglayer, rastersamplinglayer, bands=1, extract_type='val
             result.append(sample[list(sample.keys())[0]])
 
     return result
+
+
+def chainage(sectionlinelayer, distance):
+    """
+    Calculates the points along the selected section line every distance.
+
+    The result is cached per line geometry and distance so that it's calculated once for all DEMs.
+
+    :param sectionlinelayer: The section line layer with one selected feature.
+    :param distance: The sampling distance.
+    :return: (xarray, points) where xarray is a list of distances along the line and points is a numpy array
+             with one row (x, y) for each distance.
+    """
+    geom = None
+    for feature in sectionlinelayer.getSelectedFeatures():
+        if feature.geometry():
+            geom = feature.geometry()
+    if geom is None:
+        return [], np.empty((0, 2))
+
+    key = (bytes(geom.asWkb()), float(distance))
+    if key not in _chainage_cache:
+        if len(_chainage_cache) >= CHAINAGE_CACHE_SIZE:
+            _chainage_cache.clear()
+        points = chainage_points(geom, float(distance))
+        points.setflags(write=False)
+        _chainage_cache[key] = (points[:, 0].tolist(), points[:, 1:])
+    xarray, points = _chainage_cache[key]
+    return list(xarray), points
+
+def chainage_points(geom, distance):
+    """
+    Interpolates points along geom every distance.
+
+    :param geom: A QgsGeometry line.
+    :param distance: The sampling distance.
+    :return: A numpy array with one row (dist, x, y) for each point.
+    """
+    length = geom.length()
+    distances = distance * np.arange(int(math.floor(length / distance + 1e-9)) + 1)
+
+    if geom.isMultipart():
+        # Let qgis decide how the parts are joined.
+        coords = [geom.interpolate(float(dist)).asPoint() for dist in distances]
+        return np.array([[dist, point.x(), point.y()] for dist, point in zip(distances, coords)]).reshape(-1, 3)
+
+    vertices = np.array([[point.x(), point.y()] for point in geom.asPolyline()], dtype=float)
+    segment_lengths = np.hypot(*np.diff(vertices, axis=0).T)
+    keep = np.concatenate(([True], segment_lengths > 0))
+    vertices = vertices[keep]
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_lengths[segment_lengths > 0])))
+    return np.column_stack((distances,
+                            np.interp(distances, cumulative, vertices[:, 0]),
+                            np.interp(distances, cumulative, vertices[:, 1])))
+
+def sample_raster_points(points, rastersamplinglayer, bands=1):
+    """
+    Samples a raster at all points using one block read per band.
+
+    The raster window under the bounding box of the points is read once and all points get the value of the pixel
+    they are in, like QgsRasterDataProvider.identify.
+    Falls back to sampling point by point if the raster can't be read as a block.
+
+    :param points: A numpy array with one row (x, y) for each point, in the crs of the raster.
+    :param rastersamplinglayer: A QgsRasterLayer
+    :param bands: A band number or a list/tuple of band numbers.
+    :return: A list with one value (or one list of values if bands is a list/tuple) per point,
+             None for points outside the raster or on nodata.
+    """
+    provider = rastersamplinglayer.dataProvider()
+    _bands = list(bands) if isinstance(bands, (list, tuple)) else [bands]
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if not len(points):
+        return []
+
+    if (provider.xSize() <= 0 or provider.ySize() <= 0 or
+            any(provider.dataType(band) not in RASTER_NUMPY_DTYPES for band in _bands)):
+        return [sample_raster_point(provider, QgsPointXY(x, y), bands) for x, y in points]
+
+    extent = provider.extent()
+    xres = extent.width() / provider.xSize()
+    yres = extent.height() / provider.ySize()
+    # Pixel coordinates with (0, 0) at the upper left corner of the raster.
+    px = (points[:, 0] - extent.xMinimum()) / xres
+    py = (extent.yMaximum() - points[:, 1]) / yres
+    inside = (px >= 0) & (px <= provider.xSize()) & (py >= 0) & (py <= provider.ySize())
+    if not inside.any():
+        return [None] * len(points)
+
+    col0 = max(int(math.floor(px[inside].min())), 0)
+    col1 = min(int(math.floor(px[inside].max())), provider.xSize() - 1)
+    row0 = max(int(math.floor(py[inside].min())), 0)
+    row1 = min(int(math.floor(py[inside].max())), provider.ySize() - 1)
+    window = QgsRectangle(extent.xMinimum() + col0 * xres, extent.yMaximum() - (row1 + 1) * yres,
+                          extent.xMinimum() + (col1 + 1) * xres, extent.yMaximum() - row0 * yres)
+    width = col1 - col0 + 1
+    height = row1 - row0 + 1
+    px = px - col0
+    py = py - row0
+
+    values = np.full((len(points), len(_bands)), np.nan)
+    for bandidx, band in enumerate(_bands):
+        block = provider.block(band, window, width, height)
+        data = np.frombuffer(bytes(block.data()), dtype=RASTER_NUMPY_DTYPES[block.dataType()])
+        if data.size != width * height:
+            return [sample_raster_point(provider, QgsPointXY(x, y), bands) for x, y in points]
+        data = data.reshape(height, width).astype(float)
+        if block.hasNoDataValue():
+            data[data == block.noDataValue()] = np.nan
+
+        cols = np.minimum(np.floor(px[inside]).astype(int), width - 1)
+        rows = np.minimum(np.floor(py[inside]).astype(int), height - 1)
+        values[inside, bandidx] = data[rows, cols]
+
+    result = []
+    for row in values:
+        if np.isnan(row).any():
+            result.append(None)
+        elif isinstance(bands, (list, tuple)):
+            result.append(row.tolist())
+        else:
+            result.append(float(row[0]))
+    return result
+
+def sample_raster_point(raster_provider, point, bands=1):
+    sample = raster_provider.identify(point, QgsRaster.IdentifyFormatValue).results()
+    if not sample:
+        return None
+    try:
+        if isinstance(bands, (list, tuple)):
+            return [float(sample[band]) for band in bands]
+        else:
+            return float(sample[bands])
+    except (TypeError, ValueError, KeyError): # point is out of raster extent
+        return None
+
+def line_locate_points(geom, points):
+    """
+    Calculates the distance along the line to the closest point on the line for each point, like
+    ST_Length(line) * ST_LineLocatePoint(line, point).
+
+    :param geom: A QgsGeometry line.
+    :param points: A numpy array with one row (x, y) for each point, in the crs of the line.
+    :return: A numpy array with the distance along the line for each point.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if geom.isMultipart():
+        return np.array([geom.lineLocatePoint(QgsGeometry.fromPointXY(QgsPointXY(x, y))) for x, y in points],
+                        dtype=float)
+
+    vertices = np.array([[point.x(), point.y()] for point in geom.asPolyline()], dtype=float)
+    starts = vertices[:-1]
+    vectors = np.diff(vertices, axis=0)
+    segment_lengths = np.hypot(vectors[:, 0], vectors[:, 1])
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_lengths)[:-1]))
+    squared_lengths = np.where(segment_lengths > 0, segment_lengths ** 2, 1.0)
+
+    # One row per point and one column per segment.
+    dx = points[:, 0:1] - starts[:, 0]
+    dy = points[:, 1:2] - starts[:, 1]
+    t = np.clip((dx * vectors[:, 0] + dy * vectors[:, 1]) / squared_lengths, 0.0, 1.0)
+    squared_distances = (dx - t * vectors[:, 0]) ** 2 + (dy - t * vectors[:, 1]) ** 2
+    closest = np.argmin(squared_distances, axis=1)
+    rows = np.arange(len(points))
+    return cumulative[closest] + t[rows, closest] * segment_lengths[closest]
@@ -22,6 +22,7 @@ from __future__ import absolute_import
 
 import datetime
 import os
+import sqlite3 as sqlite
 from builtins import str
 
 import numpy as np
@@ -57,7 +58,7 @@ class Calcave(qgis.PyQt.QtWidgets.QDialog, Calc_Ui_Dialog): # An instance of the
         self.pushButton_Selected.clicked.connect(lambda x: self.calcselected())
         self.pushButton_Cancel.clicked.connect(lambda x: self.close())
 
-    def calcall(self, use_pandas=True):
+    def calcall(self, use_pandas=True, in_db=True):
         ok, obsar = db_utils.sql_load_fr_db('''SELECT DISTINCT obsid FROM w_flow WHERE flowtype = 'Accvol' ''')
         #if not ok:
         #    midvatten_utils.MessagebarAndLog.critical(bar_msg=)
@@ -65,19 +66,113 @@ class Calcave(qgis.PyQt.QtWidgets.QDialog, Calc_Ui_Dialog): # An instance of the
             common_utils.MessagebarAndLog.critical(bar_msg=ru(QCoreApplication.translate('Calcave', "No observations with Accvol found, nothing calculated!")))
             return
         self.observations = [obs[0] for obs in obsar]
-        if pandas_on and use_pandas:
-            self.calculateaveflow_pandas()
-        else:
-            self.calculateaveflow()
+        self.calculate(use_pandas, in_db)
 
-    def calcselected(self, use_pandas=True):
+    def calcselected(self, use_pandas=True, in_db=True):
         obsar = common_utils.getselectedobjectnames(qgis.utils.iface.activeLayer())
         self.observations = [obs for obs in obsar] #turn into a list of python byte strings
-        if pandas_on and use_pandas:
+        self.calculate(use_pandas, in_db)
+
+    def calculate(self, use_pandas=True, in_db=True):
+        if in_db:
+            self.calculateaveflow_in_db(incremental=self.checkBox_incremental.isChecked(), use_pandas=use_pandas)
+        elif pandas_on and use_pandas:
             self.calculateaveflow_pandas()
         else:
             self.calculateaveflow()
 
+    def calculateaveflow_in_db(self, incremental=False, use_pandas=True):
+        """
+        Calculates Aveflow in the database using one INSERT ... SELECT and the window function LAG.
+
+        :param incremental: If True, only Accvol readings newer than the latest existing Aveflow for each
+                            obsid and instrumentid are read, together with the reading just before them.
+        :param use_pandas: Passed on to calculate if the database doesn't support window functions.
+        """
+        dbconnection = db_utils.DbConnectionManager()
+        if dbconnection.dbtype == 'spatialite' and sqlite.sqlite_version_info < (3, 25, 0):
+            dbconnection.closedb()
+            common_utils.MessagebarAndLog.info(log_msg=ru(QCoreApplication.translate('Calcave', "SQLite %s doesn't support window functions. Aveflow calculated in python instead."))%sqlite.sqlite_version)
+            self.calculate(use_pandas=use_pandas, in_db=False)
+            return
+
+        common_utils.start_waiting_cursor()
+        temptable_name = None
+        try:
+            date_from = self.FromDateTime.dateTime().toPyDateTime()
+            date_to = self.ToDateTime.dateTime().toPyDateTime()
+            obsids = common_utils.sql_unicode_list(self.observations)
+            date_time_as_epoch = db_utils.cast_date_time_as_epoch(dbconnection)
+
+            if incremental:
+                # The last Accvol reading at or before the latest Aveflow is kept as the first value for LAG. Older
+                # readings are not read at all.
+                incremental_join = """LEFT JOIN (SELECT g.obsid, g.instrumentid,
+                                                        (SELECT MAX(c.date_time) FROM w_flow AS c
+                                                         WHERE c.obsid = g.obsid AND c.instrumentid = g.instrumentid
+                                                         AND c.flowtype = 'Accvol'
+                                                         AND c.date_time <= (SELECT MAX(b.date_time) FROM w_flow AS b
+                                                                             WHERE b.obsid = g.obsid
+                                                                             AND b.instrumentid = g.instrumentid
+                                                                             AND b.flowtype = 'Aveflow')) AS seed_date_time
+                                                 FROM (SELECT DISTINCT obsid, instrumentid FROM w_flow
+                                                       WHERE flowtype = 'Aveflow' AND obsid IN ({obsids})) AS g) AS s
+                                      ON f.obsid = s.obsid AND f.instrumentid = s.instrumentid""".format(obsids=obsids)
+                incremental_sql = """AND (s.seed_date_time IS NULL OR f.date_time >= s.seed_date_time)"""
+            else:
+                incremental_join = ''
+                incremental_sql = ''
+
+            temptable_name = dbconnection.create_temporary_table_for_import('temp_aveflow', ['obsid TEXT', 'instrumentid TEXT',
+                                                                                             'date_time TEXT',
+                                                                                             'reading double precision',
+                                                                                             'comment TEXT'])
+
+            #Accvol is supposed to be in m3, so Aveflow = 1000 * delta volume / delta seconds gives l/s
+            sql = """INSERT INTO {temptable} (obsid, instrumentid, date_time, reading, comment)
+                     SELECT a.obsid, a.instrumentid, a.date_time, a.aveflow, a.comment
+                     FROM (SELECT obsid, instrumentid, date_time, comment,
+                                  (reading - LAG(reading) OVER w) * 1000.0
+                                  / NULLIF({epoch} - LAG({epoch}) OVER w, 0) AS aveflow
+                           FROM (SELECT f.obsid, f.instrumentid, f.date_time, f.reading, f.comment
+                                 FROM w_flow AS f {incremental_join}
+                                 WHERE f.flowtype = 'Accvol' AND f.date_time >= '{date_from}' AND f.date_time <= '{date_to}'
+                                 AND f.obsid IN ({obsids}) {incremental}) AS r
+                           WINDOW w AS (PARTITION BY obsid, instrumentid ORDER BY date_time)) AS a
+                     WHERE a.aveflow IS NOT NULL""".format(temptable=temptable_name, epoch=date_time_as_epoch,
+                                                           incremental_join=incremental_join, date_from=date_from,
+                                                           date_to=date_to, obsids=obsids, incremental=incremental_sql)
+            dbconnection.execute(sql)
+
+            # Only the Aveflow values added by this calculation are checked, not the already existing ones.
+            negativeflow = dbconnection.execute_and_fetchall("""SELECT t.obsid FROM {} AS t WHERE t.reading < 0
+                                                                AND NOT EXISTS (SELECT 1 FROM w_flow AS w
+                                                                                WHERE w.obsid = t.obsid
+                                                                                AND w.instrumentid = t.instrumentid
+                                                                                AND w.flowtype = 'Aveflow'
+                                                                                AND w.date_time = t.date_time)
+                                                                LIMIT 1""".format(temptable_name))
+
+            sql = """INSERT INTO w_flow (obsid, instrumentid, flowtype, date_time, reading, unit, comment)
+                     SELECT obsid, instrumentid, 'Aveflow', date_time, reading, 'l/s', comment FROM {}""".format(temptable_name)
+            dbconnection.execute(db_utils.add_insert_or_ignore_to_sql(sql, dbconnection))
+            nr_of_added = dbconnection.cursor.rowcount
+            dbconnection.commit()
+        finally:
+            if temptable_name is not None:
+                try:
+                    dbconnection.drop_temporary_table(temptable_name)
+                except Exception:
+                    # The temporary table goes away with the connection anyway.
+                    pass
+            dbconnection.closedb()
+            common_utils.stop_waiting_cursor()
+
+        common_utils.MessagebarAndLog.info(bar_msg=ru(QCoreApplication.translate('Calcave', "%s Aveflow values added."))%str(nr_of_added))
+        if negativeflow:
+            common_utils.MessagebarAndLog.info(bar_msg=ru(QCoreApplication.translate('Calcave', "Please notice that negative flow was encountered.")))
+        self.close()
+
     def calculateaveflow(self):
         common_utils.start_waiting_cursor()
         date_from = self.FromDateTime.dateTime().toPyDateTime()
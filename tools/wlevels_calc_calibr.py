@@ -25,7 +25,6 @@ from __future__ import print_function
 
 import math
 import os
-from builtins import next
 from builtins import range
 from builtins import str
 
@@ -39,19 +38,16 @@ from matplotlib.dates import datestr2num, num2date
 from qgis.PyQt import uic, QtWidgets
 from qgis.PyQt.QtCore import QCoreApplication, Qt
 
-try:#assume matplotlib >=1.5.1
-    from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-except:
-    from matplotlib.backends.backend_qt5agg import NavigationToolbar2QTAgg as NavigationToolbar
-
 from matplotlib.widgets import RectangleSelector
 
 import datetime
 
 from midvatten.tools.utils import common_utils, db_utils
-from midvatten.tools.utils.common_utils import returnunicode as ru, fn_timer
-from midvatten.tools.utils.date_utils import dateshift, datestring_to_date, long_dateformat, change_timezone
+from midvatten.tools.utils.common_utils import returnunicode as ru, fn_timer, decimate_min_max
+from midvatten.tools.utils.date_utils import dateshift, datestring_to_date, long_dateformat, change_timezone, \
+    datestrings_to_datetime64
 from midvatten.tools.utils.gui_utils import add_action_to_navigation_toolbar
+from midvatten.tools.utils.matplotlib_replacements import NavigationToolbarWithSignal
 
 
 Calibr_Ui_Dialog =  uic.loadUiType(os.path.join(os.path.dirname(__file__),'..','ui', 'calibr_logger_dialog_integrated.ui'))[0]
@@ -96,6 +92,10 @@ class Calclvl(qgis.PyQt.QtWidgets.QDialog, Calc_Ui_Dialog): # An instance of the
 
         formatted_obsids = ', '.join(["'{}'".format(x) for x in obsids])
         where_args = {'fr_dt': str(fr_d_t), 'to_dt': str(to_d_t), 'obsids': formatted_obsids}
+        if self.checkBox_incremental.isChecked():
+            self.calc_incremental(where_args)
+            return None
+
         where_sql = """meas IS NOT NULL AND date_time >= '{fr_dt}' AND date_time <= '{to_dt}' AND obsid IN ({obsids})""".format(**where_args)
         if not self.checkBox_overwrite_prev.isChecked():
             where_sql += """ AND level_masl IS NULL """
@@ -113,6 +113,27 @@ class Calclvl(qgis.PyQt.QtWidgets.QDialog, Calc_Ui_Dialog): # An instance of the
                                                        log_msg=ru(QCoreApplication.translate('Calclvl', 'H_toc added and level_masl calculated for\nobsid;min date;max date;calculated number of measurements: \n%s'))%(self.updated_level_masl))
         self.close()
 
+    def calc_incremental(self, where_args):
+        """
+        Calculates h_toc and level_masl using one UPDATE, only for rows where level_masl is NULL (and obs_points.h_toc
+        is not NULL) or where obs_points.h_toc differs from the h_toc used for the previous calculation (stored in
+        w_levels.h_toc).
+        Rows with a level_masl but without h_toc (not calculated by Midvatten) are left unchanged.
+        """
+        dbconnection = db_utils.DbConnectionManager()
+        obs_points_h_toc = """(SELECT obs_points.h_toc FROM obs_points WHERE obs_points.obsid = w_levels.obsid)"""
+        sql = """UPDATE w_levels SET h_toc = {h_toc}, level_masl = {h_toc} - meas
+                 WHERE meas IS NOT NULL AND date_time >= '{fr_dt}' AND date_time <= '{to_dt}' AND obsid IN ({obsids})
+                 AND ((level_masl IS NULL AND {h_toc} IS NOT NULL)
+                      OR (h_toc IS NOT NULL AND h_toc {is_distinct_from} {h_toc}))""".format(
+            h_toc=obs_points_h_toc, is_distinct_from=db_utils.is_distinct_from(dbconnection), **where_args)
+        dbconnection.execute(sql)
+        self.updated_level_masl = dbconnection.cursor.rowcount
+        dbconnection.commit_and_closedb()
+
+        common_utils.MessagebarAndLog.info(bar_msg=ru(QCoreApplication.translate('Calclvl', 'Calculation done, h_toc added and level_masl calculated for %s rows.'))%str(self.updated_level_masl))
+        self.close()
+
     @fn_timer
     def calcall(self):
         obsids = db_utils.sql_load_fr_db("""SELECT DISTINCT obsid FROM w_levels""")[1]
@@ -156,6 +177,7 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
         self.head_ts = None
         self.head_ts_for_plot = None
         self.level_masl_ts = None
+        self.series_cache = {}
         self.logger_artist = None
         self.loggerpos_masl_or_offset_state = 1
         self.selected_line = None
@@ -172,7 +194,8 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
         self.calibrplotfigure = plt.figure()
         self.axes = self.calibrplotfigure.add_subplot( 111 )
         self.canvas = FigureCanvas( self.calibrplotfigure )
-        self.mpltoolbar = NavigationToolbar( self.canvas, self.widgetPlot )
+        self.mpltoolbar = NavigationToolbarWithSignal( self.canvas, self.widgetPlot )
+        self.level_of_detail = common_utils.LevelOfDetail(self.axes, self.mpltoolbar)
         self.layoutplot.addWidget( self.canvas )
         self.layoutplot.addWidget( self.mpltoolbar )
 
@@ -253,6 +276,7 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
                                                                                   else " obsid = '{}' AND ".format(obsid)))[1]]
 
     @fn_timer
+    @db_utils.reuse_dbconnection('Calibrlogger.load_obsid_from_db')
     def load_obsid_from_db(self):
         self.combobox_obsid.clear()
         self.combobox_obsid.addItems(self.get_all_obsids_in_w_levels_logger())
@@ -300,13 +324,14 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
             self.combobox_obsid.setItemText(idx, new_text)
 
     @fn_timer
+    @db_utils.reuse_dbconnection('Calibrlogger.load_obsid_and_init')
     def load_obsid_and_init(self):
         """ Checks the current obsid and reloads all ts.
         :return: obsid
 
         Info: Before, some time series was only reloaded when the obsid was changed, but this caused a problem if the
-        data was changed in the background in for example spatialite gui. Now all time series are reloaded always.
-        It's rather fast anyway.
+        data was changed in the background in for example spatialite gui. Now the time series are cached together
+        with a change token for the obsid (see get_meas_ts and get_logger_ts) and are reloaded when the token changes.
         """
         common_utils.start_waiting_cursor()
         obsid = self.selected_obsid
@@ -319,43 +344,26 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
             common_utils.stop_waiting_cursor()
             return None
 
-        meas_sql = r"""SELECT date_time, level_masl FROM w_levels WHERE obsid = '%s' ORDER BY date_time"""%obsid
-        self.meas_ts = self.sql_into_recarray(meas_sql)
-        if self.w_levels_logger_tz and self.w_levels_tz:
-            self.meas_ts.date_time = [change_timezone(x, self.w_levels_tz, self.w_levels_logger_tz)
-                                      for x in self.meas_ts.date_time]
-
-        existing_columns = db_utils.tables_columns('w_levels_logger')['w_levels_logger']
-        if 'source' in existing_columns:
-            head_level_masl_sql = r"""SELECT date_time, head_cm / 100, level_masl, TRIM(COALESCE(source, '')) FROM w_levels_logger WHERE obsid = '%s' ORDER BY date_time"""%obsid
-        else:
-            head_level_masl_sql = r"""SELECT date_time, head_cm / 100, level_masl, '' as source FROM w_levels_logger WHERE obsid = '%s' ORDER BY date_time""" % obsid
-        head_level_masl_list = db_utils.sql_load_fr_db(head_level_masl_sql)[1]
-        head_list = [(row[0], row[1], row[3]) for row in head_level_masl_list]
-        level_masl_list = [(row[0], row[2], row[3]) for row in head_level_masl_list]
+        self.meas_ts = self.get_meas_ts(obsid)
+        self.head_ts, self.level_masl_ts = self.get_logger_ts(obsid)
 
-        self.head_ts = self.list_of_list_to_recarray(head_list)
         if self.plot_logger_head.isChecked():
             if self.normalize_head.isChecked():
-                head_vals = [row[1] for row in head_list if row[1] is not None]
-                num_head = len(head_vals)
-
-                if num_head > 0:
-                    head_mean = sum(head_vals) / float(len(head_vals))
-
-                    level_masl_vals = [row[1] for row in level_masl_list if row[1] is not None]
-                    num_level_masl_vals = len(level_masl_vals)
-                    meas_vals = [x for x in self.meas_ts.values if x is not None]
-                    num_meas_vals = len(meas_vals)
-                    if num_level_masl_vals or num_meas_vals:
-                        if num_level_masl_vals:
-                            level_masl_mean = sum(level_masl_vals) / float(num_level_masl_vals)
-                        else:
-                            level_masl_mean = sum(meas_vals) / float(num_meas_vals)
+                head_vals = self.head_ts.values[~np.isnan(self.head_ts.values)]
 
-                        normalized_head = [(row[0], row[1] + (level_masl_mean - head_mean) if row[1] is not None else None, row[2]) for row in head_list]
+                if head_vals.size:
+                    head_mean = head_vals.mean()
 
-                        self.head_ts_for_plot = self.list_of_list_to_recarray(normalized_head)
+                    level_masl_vals = self.level_masl_ts.values[~np.isnan(self.level_masl_ts.values)]
+                    meas_vals = self.meas_ts.values[~np.isnan(self.meas_ts.values)]
+                    if level_masl_vals.size or meas_vals.size:
+                        if level_masl_vals.size:
+                            level_masl_mean = level_masl_vals.mean()
+                        else:
+                            level_masl_mean = meas_vals.mean()
+
+                        self.head_ts_for_plot = self.head_ts.copy()
+                        self.head_ts_for_plot.values = self.head_ts.values + (level_masl_mean - head_mean)
                     else:
                         common_utils.MessagebarAndLog.warning(bar_msg=ru(QCoreApplication.translate('Calibrlogger', 'No calibrated level_masl values to normalize against.')))
                         self.head_ts_for_plot = self.head_ts
@@ -369,15 +377,96 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
 
         self.obsid = obsid
 
-        self.level_masl_ts = self.list_of_list_to_recarray(level_masl_list)
-
-        calibration_status = [obsid] if [row[1] for row in level_masl_list if row[1] is None] else []
+        calibration_status = [obsid] if np.isnan(self.level_masl_ts.values).any() else []
         self.update_combobox_with_calibration_info(obsid=obsid, _obsids_with_uncalibrated_data=calibration_status)
 
         self.setlastcalibration(obsid)
         common_utils.stop_waiting_cursor()
         return obsid
 
+    @fn_timer
+    def get_meas_ts(self, obsid):
+        """ Returns the w_levels measurements for obsid as a recarray, converted to the timezone of w_levels_logger
+
+        The recarray is cached until the change token of the obsid in w_levels or the timezones change.
+        """
+        token = (db_utils.table_change_token('w_levels', [obsid], value_column=['level_masl']),
+                 self.w_levels_tz, self.w_levels_logger_tz)
+        cached = self.series_cache.get(('w_levels', obsid))
+        if cached is not None and cached[0] == token:
+            return cached[1]
+
+        meas_sql = r"""SELECT date_time, level_masl FROM w_levels WHERE obsid = '%s' ORDER BY date_time"""%obsid
+        meas_ts = self.sql_into_recarray(meas_sql)
+        if self.w_levels_logger_tz and self.w_levels_tz:
+            meas_ts.date_time = [change_timezone(x, self.w_levels_tz, self.w_levels_logger_tz)
+                                 for x in meas_ts.date_time]
+        self.series_cache[('w_levels', obsid)] = (token, meas_ts)
+        return meas_ts
+
+    @fn_timer
+    def get_logger_ts(self, obsid):
+        """ Returns the head (m) and the level_masl of w_levels_logger for obsid as two recarrays
+
+        The recarrays are cached until the change token of the obsid in w_levels_logger changes.
+        """
+        token = self.logger_change_token(obsid)
+        cached = self.series_cache.get(('w_levels_logger', obsid))
+        if cached is not None and cached[0] == token:
+            return cached[1], cached[2]
+
+        existing_columns = db_utils.tables_columns('w_levels_logger')['w_levels_logger']
+        if 'source' in existing_columns:
+            head_level_masl_sql = r"""SELECT date_time, head_cm / 100, level_masl, TRIM(COALESCE(source, '')) FROM w_levels_logger WHERE obsid = '%s' ORDER BY date_time"""%obsid
+        else:
+            head_level_masl_sql = r"""SELECT date_time, head_cm / 100, level_masl, '' as source FROM w_levels_logger WHERE obsid = '%s' ORDER BY date_time""" % obsid
+        head_level_masl_list = db_utils.sql_load_fr_db(head_level_masl_sql)[1]
+        head_ts = self.list_of_list_to_recarray([(row[0], row[1], row[3]) for row in head_level_masl_list])
+        level_masl_ts = self.list_of_list_to_recarray([(row[0], row[2], row[3]) for row in head_level_masl_list])
+        self.series_cache[('w_levels_logger', obsid)] = (token, head_ts, level_masl_ts)
+        return head_ts, level_masl_ts
+
+    def logger_change_token(self, obsid):
+        """ Returns the change token of the obsid in w_levels_logger
+
+        The token covers the dates, head_cm, level_masl and source (if the column exists), so edits made outside the
+        plugin are also picked up, except for edits that the sums in db_utils.table_change_token can't tell apart.
+        """
+        existing_columns = db_utils.tables_columns('w_levels_logger')['w_levels_logger']
+        return db_utils.table_change_token('w_levels_logger', [obsid], value_column=['level_masl', 'head_cm'],
+                                           text_columns=['source'] if 'source' in existing_columns else None)
+
+    @fn_timer
+    def refresh_cached_logger_ts(self, obsid, fr_d_t, to_d_t):
+        """ Reloads the cached level_masl of w_levels_logger for obsid between fr_d_t and to_d_t
+
+        Used after calibrating, where only level_masl in the date range is updated. If the rows in the range doesn't
+        match the cached rows, the cache is dropped and the whole series is reloaded the next time.
+        """
+        cached = self.series_cache.pop(('w_levels_logger', obsid), None)
+        if cached is None:
+            return
+        token, head_ts, level_masl_ts = cached
+
+        date_time_as_epoch = db_utils.cast_date_time_as_epoch()
+        sql = r"""SELECT date_time, level_masl FROM w_levels_logger WHERE obsid = '%s'""" % obsid
+        sql += """ AND %s >= %s""" % (date_time_as_epoch, str((fr_d_t - datetime.datetime(1970, 1, 1)).total_seconds()))
+        sql += """ AND %s <= %s""" % (date_time_as_epoch, str((to_d_t - datetime.datetime(1970, 1, 1)).total_seconds()))
+        sql += """ ORDER BY date_time"""
+        rows = db_utils.sql_load_fr_db(sql)[1]
+        if not rows:
+            return
+
+        start = int(np.searchsorted(level_masl_ts.date_time, rows[0][0]))
+        end = start + len(rows)
+        if list(level_masl_ts.date_time[start:end]) != [row[0] for row in rows]:
+            return
+
+        level_masl_ts = level_masl_ts.copy()
+        level_masl_ts.values[start:end] = [np.nan if row[1] is None else row[1] for row in rows]
+        token = self.logger_change_token(obsid)
+        self.series_cache[('w_levels_logger', obsid)] = (token, head_ts, level_masl_ts)
+
     @fn_timer
     def setlastcalibration(self, obsid):
         if not obsid=='':
@@ -414,6 +503,7 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
         self.update_plot()
 
     @fn_timer
+    @db_utils.reuse_dbconnection('Calibrlogger.calibrate')
     def calibrate(self, obsid=None):
 
         if obsid is None:
@@ -427,6 +517,7 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
                 self.update_level_masl_from_head(obsid, fr_d_t, to_d_t, self.logger_elevation.text())
             else:
                 self.update_level_masl_from_level_masl(obsid, fr_d_t, to_d_t, self.offset.text())
+            self.refresh_cached_logger_ts(obsid, fr_d_t, to_d_t)
 
         else:
 
@@ -515,6 +606,7 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
             return
         self.selected_line = None
         self.axes.clear()
+        self.level_of_detail.clear()
 
         p=[None]*2 # List for plot objects
 
@@ -572,11 +664,11 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
                     color = logger_level_masl_colors[idx]
                 except IndexError:
                     color = np.random.rand(3, 1).ravel()
-                a = self.plot_recarray(self.axes, ts,
-                                                label,
-                                                time_list=logger_time_list,
-                                                style=dict(linestyle='-', picker=0, markersize=3, marker=marker,
-                                                zorder=10, color=color))[0]
+                style = dict(linestyle='-', picker=0, markersize=3, marker=marker, zorder=10, color=color)
+                if marker:
+                    a = self.plot_recarray(self.axes, ts, label, time_list=logger_time_list, style=style)[0]
+                else:
+                    a = self.plot_with_level_of_detail(self.axes, logger_time_list, ts, label, style=style)
                 self.logger_plot_artists.append(a)
                 handles.append(a)
                 labels.append(label)
@@ -600,8 +692,8 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
                 ts = self.head_ts_for_plot.copy()
                 ts.values[ts.source != source] = np.nan
 
-                a = self.plot_recarray(self.axes, ts, label,
-                                   style=dict(linestyle='--', zorder=5, color=color, marker=''), time_list=logger_time_list)[0]
+                a = self.plot_with_level_of_detail(self.axes, logger_time_list, ts, label,
+                                                   style=dict(linestyle='--', zorder=5, color=color, marker=''))
                 handles.append(a)
                 labels.append(label)
 
@@ -674,6 +766,16 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
             style = {}
         return axes.plot_date(time_list, a_recarray.values, label=label, **style) #, xdate=True)
 
+    @fn_timer
+    def plot_with_level_of_detail(self, axes, time_list, a_recarray, label, style=None):
+        """ Plots a line decimated to the axes width and lets self.level_of_detail show more points when zooming in """
+        if style is None:
+            style = {}
+        x, y = decimate_min_max(time_list, a_recarray.values, max(int(axes.bbox.width), 100))
+        line = axes.plot_date(x, y, label=label, **style)[0]
+        self.level_of_detail.add_line(line, time_list, a_recarray.values)
+        return line
+
     @fn_timer
     def set_from_date_from_x(self):
         """ Used to set the self.FromDateTime by clicking on a line node in the plot self.canvas """
@@ -750,9 +852,8 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
 
             First matches measurements from self.meas_ts to logger values from
             self.head_ts. This is done by making a mean of all logger values inside
-            self.meas_ts date - search_radius and self.meas_ts date + search_radius.
-            (this could probably be change to get only the closest logger value
-            inside the search_radius instead)
+            self.meas_ts date - search_radius and self.meas_ts date + search_radius,
+            or by using the closest logger value if "Closest value" is checked.
             (search_radius is gotten from self.get_search_radius())
 
             Then calculates the mean of all matches and set to self.logger_elevation.
@@ -770,7 +871,8 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
             text_field = self.offset
             calib_func = self.add_to_level_masl
 
-        coupled_vals = self.match_ts_values(self.meas_ts, logger_ts, search_radius)
+        coupled_vals = self.match_ts_values(self.meas_ts, logger_ts, search_radius,
+                                            closest_value=self.checkBox_closest_value.isChecked())
         if not coupled_vals:
             common_utils.pop_up_info(ru(QCoreApplication.translate('Calibrlogger', "There was no match found between measurements and logger values inside the chosen period.\n Try to increase the search radius or adjust the period!")))
         else:
@@ -785,12 +887,13 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
         common_utils.stop_waiting_cursor()
 
     @fn_timer
-    def match_ts_values(self, meas_ts, logger_ts, search_radius_tuple):
+    def match_ts_values(self, meas_ts, logger_ts, search_radius_tuple, closest_value=False):
         """ Matches two timeseries values for shared timesteps
 
             For every measurement point, a mean of logger values inside
             measurementpoint + x minutes to measurementpoint - x minutes
-            is coupled together.
+            is coupled together. If closest_value is True, the logger value closest in
+            time to the measurement is used instead of the mean.
 
             At the first used measurement, only logger values greater than
             the set start date is used.
@@ -798,6 +901,10 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
             date is used.
             This is done so that values from another logger reposition is not
             mixed with the chosen logger positioning. (Hard to explain).
+
+            A logger value is only coupled to one measurement. When the search windows
+            overlap, the later measurement only gets the logger values after the window of
+            the previous one.
         """
         coupled_vals = []
 
@@ -805,58 +912,49 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
         search_radius = int(search_radius_tuple[0])
         search_radius_period = search_radius_tuple[1]
 
-        logger_gen = common_utils.ts_gen(logger_ts)
-        try:
-            l = next(logger_gen)
-        except StopIteration:
+        if not len(logger_ts):
             return None
-        log_vals = []
-
-        all_done = False
-        #The .replace(tzinfo=None) is used to remove info about timezone. Needed for the comparisons. This should not be a problem though as the date scale in the plot is based on the dates from the database.
-        outer_begin = self.FromDateTime.dateTime().toPyDateTime().replace(tzinfo=None)
-        outer_end = self.ToDateTime.dateTime().toPyDateTime().replace(tzinfo=None)
-        logger_step = datestring_to_date(l[0]).replace(tzinfo=None)
-        for m in meas_ts:
-            if logger_step is None:
-                break
-            meas_step = datestring_to_date(m[0]).replace(tzinfo=None)
-
-            step_begin = dateshift(meas_step, -search_radius, search_radius_period)
-            step_end = dateshift(meas_step, search_radius, search_radius_period)
-
-            if step_end < outer_begin:
-                continue
-            if step_begin > outer_end:
-                break
-
-            #Skip logger steps that are earlier than the chosen begin date or are not inside the measurement period.
-            while logger_step <= step_begin or logger_step <= outer_begin:
-                try:
-                    l = next(logger_gen)
-                except StopIteration:
-                    all_done = True
-                    break
-                logger_step = datestring_to_date(l[0]).replace(tzinfo=None)
 
-            log_vals = []
-
-            while logger_step is not None and step_begin <= logger_step <= step_end and outer_begin <= logger_step <= outer_end:
-                if not math.isnan(float(l[1])) or l[1] in ('nan', 'NULL'):
-                    log_vals.append(float(l[1]))
-                try:
-                    l = next(logger_gen)
-                except StopIteration:
-                    all_done = True
-                    break
-                logger_step = datestring_to_date(l[0]).replace(tzinfo=None)
-
-            if log_vals:
-                mean = np.mean(log_vals)
-                if not math.isnan(mean):
-                    coupled_vals.append((m[1], mean))
-            if all_done:
-                break
+        #The timezone info is removed. Needed for the comparisons. This should not be a problem though as the date scale in the plot is based on the dates from the database.
+        outer_begin = np.datetime64(self.FromDateTime.dateTime().toPyDateTime().replace(tzinfo=None), 'us')
+        outer_end = np.datetime64(self.ToDateTime.dateTime().toPyDateTime().replace(tzinfo=None), 'us')
+        _date = datetime.datetime(2000, 1, 1)
+        radius = np.timedelta64(dateshift(_date, search_radius, search_radius_period) - _date, 'us')
+
+        logger_times = datestrings_to_datetime64(logger_ts.date_time)
+        logger_values = np.asarray(logger_ts.values, dtype=float)
+        meas_times = datestrings_to_datetime64(meas_ts.date_time)
+
+        step_begin = meas_times - radius
+        step_end = meas_times + radius
+        used = step_end >= outer_begin
+        after_period = np.flatnonzero(step_begin > outer_end)
+        if len(after_period):
+            used[after_period[0]:] = False
+
+        # The logger values of each measurement are logger_values[starts[idx]:ends[idx]]. Logger values at the
+        # window begin (or the chosen begin date) are not used. The logger values used by one measurement are
+        # skipped by the following measurements.
+        window_starts = np.searchsorted(logger_times, np.maximum(step_begin, outer_begin), side='right')
+        window_ends = np.searchsorted(logger_times, np.minimum(step_end, outer_end), side='right')
+        window_starts[~used] = 0
+        window_ends[~used] = 0
+        consumed = np.maximum.accumulate(np.maximum(window_starts, window_ends))
+        starts = np.maximum(np.concatenate(([0], consumed[:-1])), window_starts)
+        ends = np.maximum(starts, window_ends)
+
+        for idx in np.flatnonzero(used & (ends > starts)):
+            window_values = logger_values[starts[idx]:ends[idx]]
+            not_nan = ~np.isnan(window_values)
+            if not not_nan.any():
+                continue
+            if closest_value:
+                time_diff = np.abs(logger_times[starts[idx]:ends[idx]][not_nan] - meas_times[idx])
+                value = window_values[not_nan][np.argmin(time_diff)]
+            else:
+                value = np.mean(window_values[not_nan])
+            if not math.isnan(value):
+                coupled_vals.append((meas_ts.values[idx], value))
         return coupled_vals
 
     @fn_timer
@@ -966,6 +1064,7 @@ class Calibrlogger(qgis.PyQt.QtWidgets.QMainWindow, Calibr_Ui_Dialog): # An inst
         self.reset_cid()
 
     @fn_timer
+    @db_utils.reuse_dbconnection('Calibrlogger.adjust_trend_func')
     def adjust_trend_func(self):
 
         obsid = self.load_obsid_and_init()
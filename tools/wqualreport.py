@@ -63,14 +63,17 @@ class Wqualreport(object):        # extracts water quality data for selected obj
 
         dbconnection = db_utils.DbConnectionManager()
 
-        for feature in observations:
-            attributes = feature.attributes()
-            obsid = attributes[kolumnindex]
+        obsids = [feature.attributes()[kolumnindex] for feature in observations]
+        rows_by_obsid = self.load_rows(obsids, dbconnection)   # all observations in one query
+
+        ReportData = None
+        for obsid in obsids:
             try:
                 print('about to get data for ' + obsid + ', at time: ' + str(time.time()))#debug
             except:
                 pass
-            ReportData = self.GetData(self.settingsdict['database'], obsid, dbconnection)   # one observation at a time
+            ReportData = self.GetData(self.settingsdict['database'], obsid, dbconnection,
+                                      rows=rows_by_obsid.get(obsid, []))   # one observation at a time
             try:
                 print('done with getting data for ' + obsid + ', at time: ' + str(time.time()))#debug
             except:
@@ -92,19 +95,37 @@ class Wqualreport(object):        # extracts water quality data for selected obj
         if ReportData:
             QDesktopServices.openUrl(QUrl.fromLocalFile(reportpath))
         
-    def GetData(self, dbPath='', obsid = '', dbconnection=None):            # GetData method that returns a table with water quality data
-        # Load all water quality parameters stored in two result columns: parameter, unit
-        if not(str(self.settingsdict['wqual_unitcolumn']) ==''):          #If there is a a given column for unit 
-            sql =r"""select distinct """ + self.settingsdict['wqual_paramcolumn'] + """, """
-            sql += self.settingsdict['wqual_unitcolumn']
-            sql +=r""" from """
-        else:                              # IF no specific column exist for unit
-            sql =r"""select distinct """ + self.settingsdict['wqual_paramcolumn'] + """, """ + self.settingsdict['wqual_paramcolumn'] + """ from """  # The twice selection of parameter is a dummy to keep same structure (2 cols) of sql-answer as if a unit column exists
-        sql += self.settingsdict['wqualtable']
-        sql += r""" where obsid = '"""
-        sql += obsid  
-        sql += r"""' ORDER BY """ + self.settingsdict['wqual_paramcolumn']
-        connection_ok, parameters = db_utils.sql_load_fr_db(sql, dbconnection)
+    def load_rows(self, obsids, dbconnection=None):
+        """ Loads the water quality rows for all obsids using one query
+
+        :return: A dict like {obsid: [(param, unit, parameter, sorting, date_time, value), ...]}.
+                 param is the wqual_paramcolumn, unit is the wqual_unitcolumn (or param if there is no unit column) and
+                 sorting is the wqual_sortingcolumn (or None if there is no sorting column).
+        """
+        sql = r"""SELECT obsid, {param}, {unit}, parameter, {sorting}, date_time, {value} FROM {table} WHERE obsid IN ({obsids})""".format(
+            param=self.settingsdict['wqual_paramcolumn'],
+            unit=self.settingsdict['wqual_unitcolumn'] if self.settingsdict['wqual_unitcolumn'] else self.settingsdict['wqual_paramcolumn'],
+            sorting=self.settingsdict['wqual_sortingcolumn'] if self.settingsdict['wqual_sortingcolumn'] else 'NULL',
+            value=self.settingsdict['wqual_valuecolumn'],
+            table=self.settingsdict['wqualtable'],
+            obsids=common_utils.sql_unicode_list(obsids))
+        connection_ok, rows = db_utils.sql_load_fr_db(sql, dbconnection)
+        rows_by_obsid = {}
+        for row in rows:
+            rows_by_obsid.setdefault(row[0], []).append(tuple(row[1:]))
+        return rows_by_obsid
+
+    def GetData(self, dbPath='', obsid = '', dbconnection=None, rows=None):            # GetData method that returns a table with water quality data
+        """ Returns the report table for obsid
+
+        The parameters, the date_times and the values are all taken from rows, which is loaded for the obsid if not
+        given (see load_rows).
+        """
+        if rows is None:
+            rows = self.load_rows([obsid], dbconnection).get(obsid, [])
+
+        # All water quality parameters stored in two result columns: parameter, unit
+        parameters = sorted(set([(row[0], row[1]) for row in rows]), key=lambda p_u: (none_first_key(p_u[0]), none_first_key(p_u[1])))
         if not parameters:
             common_utils.MessagebarAndLog.warning(bar_msg=ru(QCoreApplication.translate('Wqualreport', 'Debug, something is wrong, no parameters are found in table w_qual_lab for %s')) % obsid)
             return False
@@ -112,28 +133,21 @@ class Wqualreport(object):        # extracts water quality data for selected obj
             print('parameters for ' + obsid + ' is loaded at time: ' + str(time.time()))#debug
         except:
             pass
-        # Load all date_times, stored in two result columns: reportnr, date_time
-        if self.settingsdict['wqual_sortingcolumn']:          #If there is a a specific sorting column
-            if len(self.settingsdict['wqual_date_time_format']) > 16:
-                sql =r"""select distinct """
-                sql += self.settingsdict['wqual_sortingcolumn']
-                sql += r""", date_time from """      #including parameters
-            else:
-                sql = r"""select distinct under16.%s, under16.date_time from (select %s, substr(date_time,1,%s) as date_time from """%(self.settingsdict['wqual_sortingcolumn'], self.settingsdict['wqual_sortingcolumn'], len(self.settingsdict['wqual_date_time_format']))
-        else:                     # IF no specific column exist for sorting
-            if len(self.settingsdict['wqual_date_time_format'])>16:
-                sql =r"""select distinct date_time, date_time from """ # The twice selection of date_time is a dummy to keep same structure (2 cols) of sql-answer as if reportnr exists
-            else:
-                sql =r"""select distinct under16.dummy, under16.date_time from (select substr(date_time,1,%s) as dummy, substr(date_time,1,%s) as date_time from """%(len(self.settingsdict['wqual_date_time_format']),len(self.settingsdict['wqual_date_time_format']))      # The twice selection of date_time is a dummy to keep same structure (2 cols) of sql-answer as if reportnr exists
-        sql += self.settingsdict['wqualtable']
-        sql += """ where obsid = '"""
-        sql += obsid
-        if len(self.settingsdict['wqual_date_time_format'])>16:
-            sql += """' ORDER BY date_time"""
+
+        # All date_times, stored in two result columns: reportnr, date_time
+        # If there is no specific sorting column, date_time is used as a dummy to keep the same structure.
+        date_time_length = len(self.settingsdict['wqual_date_time_format'])
+        if date_time_length > 16:
+            truncate_date_time = lambda date_time: date_time
+        else:
+            truncate_date_time = lambda date_time: str(date_time)[:date_time_length] if date_time is not None else None
+        date_time_keys = [truncate_date_time(row[4]) for row in rows]
+        if self.settingsdict['wqual_sortingcolumn']:
+            date_times = [(row[3], date_time) for row, date_time in zip(rows, date_time_keys)]
         else:
-            sql += """') AS under16 ORDER BY date_time"""
-        #sql2 = unicode(sql) #To get back to unicode-string
-        connection_ok, date_times = db_utils.sql_load_fr_db(sql, dbconnection) #Send SQL-syntax to cursor,
+            date_times = [(date_time, date_time) for date_time in date_time_keys]
+        date_times = sorted(set(date_times), key=lambda r_d: (none_first_key(r_d[1]),
+                                                             none_first_key(str(r_d[0]) if r_d[0] is not None else None)))
 
         try:
             print('loaded distinct date_time for the parameters for ' + obsid + ' at time: ' + str(time.time()))#debug
@@ -190,37 +204,27 @@ class Wqualreport(object):        # extracts water quality data for selected obj
             print('now go for each parameter value for ' + obsid + ', at time: ' + str(time.time()))#debug
         except:
             pass
+
+        # The rows for each (date_time, parameter), in the order they were loaded.
+        # Empty date_times and NULL date_times are put together.
+        cells = {}
+        for rownr, (row, date_time) in enumerate(zip(rows, date_time_keys)):
+            cells.setdefault((date_time if date_time else None, row[2]), []).append((rownr, row))
+
         for datecounter, sorting_date_time in enumerate(date_times, start=1):    # Loop through all report
             sorting, date_time = sorting_date_time
 
             # Parameter rows starts after date or sorting row
             for parametercounter, p_u in enumerate(parameters, start=self.nr_header_rows):
                 p, u = p_u
-                sql = r"""SELECT {wqual_valuecolumn} FROM {wqualtable} WHERE obsid = '{obsid}' """.format(**{'wqual_valuecolumn': self.settingsdict['wqual_valuecolumn'],
-                                                                                                        'wqualtable': self.settingsdict['wqualtable'],
-                                                                                                        'obsid': obsid})
-                if date_time is None or not date_time:
-                    sql += r""" AND (date_time IS NULL OR date_time = '') """
-                else:
-                    if len(self.settingsdict['wqual_date_time_format'])>16:
-                        sql += " AND date_time  = '{}' ".format(date_time)
-                    else:
-                        sql += " AND substr(date_time,1,{})  = '{}' ".format(str(len(self.settingsdict['wqual_date_time_format'])), date_time)
-
-                sql += r""" AND parameter = '{}' """.format(p.replace("'", "''"))
+                recs = [row for rownr, row in cells.get((date_time if date_time else None, p), [])
+                        if (not (self.settingsdict['wqual_unitcolumn'] and u) or row[1] == u)
+                        and (not self.settingsdict['wqual_sortingcolumn'] or (row[3] is not None and str(row[3]) == str(sorting)))]
 
-                if self.settingsdict['wqual_unitcolumn'] and u:
-                    sql += r""" AND {unitcol} = '{unit}' """.format(**{'unitcol': self.settingsdict['wqual_unitcolumn'],
-                                                                       'unit': u})
-
-                if self.settingsdict['wqual_sortingcolumn']:
-                    sql += """ AND {} = '{}'""".format(self.settingsdict['wqual_sortingcolumn'], sorting)
-
-                connection_ok, recs = db_utils.sql_load_fr_db(sql, dbconnection)
                 #each value must be in unicode or string to be written as html report
                 if recs:
                     try:
-                        ReportTable[parametercounter][datecounter] = ru(recs[0][0])
+                        ReportTable[parametercounter][datecounter] = ru(recs[0][5])
                     except:
                         ReportTable[parametercounter][datecounter]=''
                         common_utils.MessagebarAndLog.warning(bar_msg=ru(QCoreApplication.translate('Wqualreport', "Note!, the value for %s [%s] at %s, %s was not readable. Check your data!")) % (p, u, sorting, date_time))
@@ -255,3 +259,11 @@ class Wqualreport(object):        # extracts water quality data for selected obj
             f.write(rpt)
         f.write("\n</table><p></p><p></p>")
 
+
+def none_first_key(value):
+    """ A sort key that puts None first, like ORDER BY in sqlite
+
+    >>> sorted(['b', None, 'a'], key=none_first_key)
+    [None, 'a', 'b']
+    """
+    return (value is not None, value if value is not None else '')